@@ -23,7 +23,8 @@ pages = {
         st.Page("pages/seo_extractor.py", title="🔍 SEO Extractor"),
         st.Page("pages/NLP_Rank_Boost.py", title="🚀 Rank Booster Analysis"),
         st.Page("pages/NLP_Rank_Boost_2.py", title="🚀 Rank Booster Processing"),
-        st.Page("pages/Query_Fan_Out.py", title="🚀 Query Fan-Out Analysis")
+        st.Page("pages/Query_Fan_Out.py", title="🚀 Query Fan-Out Analysis"),
+        st.Page("pages/Keyword_Clustering.py", title="🧩 Keyword Clustering (SERP)")
     ],
     "Technical SEO": [],
     "Off-Page SEO": []
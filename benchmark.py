@@ -0,0 +1,274 @@
+"""
+Benchmark end-to-end delle pipeline Rank Booster Analysis (pages/NLP_Rank_Boost.py)
+e Query Fan-Out (pages/Query_Fan_Out.py), senza rete e senza credenziali.
+
+Le pagine sono script Streamlit: il benchmark esegue le stesse fasi tramite i moduli
+in pages/rankboost e pages/fanout, con le chiamate esterne servite dalle cassette
+(pages/common/cassette.py).
+
+    # 1. registrazione (una volta, con rete e credenziali)
+    python benchmark.py --record
+    # 2. replay deterministico, con la latenza registrata o una latenza fissa
+    python benchmark.py --repeat 3
+    python benchmark.py --latency 0.2 --json
+    # 3. CPU per URL del SEO Extractor su pagine grandi non UTF-8 servite in locale
+    python benchmark.py --extract-fixture --pages 40 --page-kb 800
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark delle pipeline con chiamate registrate (cassette).")
+    parser.add_argument("--record", action="store_true", help="Esegue chiamate reali e le registra nelle cassette")
+    parser.add_argument("--repeat", type=int, default=1, help="Numero di ripetizioni (cache svuotate tra una e l'altra)")
+    parser.add_argument("--latency", default=None,
+                        help="Latenza simulata in replay: 'recorded' (default) o secondi fissi per chiamata")
+    parser.add_argument("--latency-scale", type=float, default=None, help="Moltiplicatore della latenza registrata")
+    parser.add_argument("--cassette-dir", default=None, help="Cartella delle cassette (default .data/cassettes)")
+    parser.add_argument("--query", default="scarpe da trail running")
+    parser.add_argument("--location-code", type=int, default=2380)
+    parser.add_argument("--location-name", default="Italy")
+    parser.add_argument("--language-code", default="it")
+    parser.add_argument("--language-name", default="Italian")
+    parser.add_argument("--fanout-query", action="append", default=None,
+                        help="Query per il Fan-Out (ripetibile; default: la query principale)")
+    parser.add_argument("--destination", default="BLOG_POST", help="Codice di destinazione del Fan-Out")
+    parser.add_argument("--skip-rankboost", action="store_true")
+    parser.add_argument("--skip-fanout", action="store_true")
+    parser.add_argument("--json", action="store_true", help="Stampa i risultati in JSON")
+    parser.add_argument("--extract-fixture", action="store_true",
+                        help="Misura la CPU per URL dell'estrazione SEO su un server locale (nessuna cassetta)")
+    parser.add_argument("--pages", type=int, default=40, help="Pagine servite dal server locale")
+    parser.add_argument("--page-kb", type=int, default=800, help="Dimensione di ogni pagina in KB")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args) -> None:
+    # Le impostazioni sono lette all'import dei moduli: vanno fissate prima
+    os.environ["ANNALECT_REPLAY_MODE"] = "record" if args.record else "replay"
+    if args.latency is not None:
+        os.environ["ANNALECT_REPLAY_LATENCY"] = str(args.latency)
+    if args.latency_scale is not None:
+        os.environ["ANNALECT_REPLAY_LATENCY_SCALE"] = str(args.latency_scale)
+    if args.cassette_dir:
+        os.environ["ANNALECT_CASSETTE_DIR"] = args.cassette_dir
+
+
+def run_rankboost(args, timings: dict) -> None:
+    """Fasi 1-5 della Rank Booster Analysis, come nel primo run della pagina."""
+    import pandas as pd
+
+    from pages.rankboost.content import competitor_texts, sections_headings
+    from pages.rankboost.dataforseo import run_collect_job
+    from pages.rankboost.nlu import content_hash, generate_text, merge_entity_tables, parse_markdown_tables, run_map
+    from pages.rankboost.prompts import get_content_brief_prompt, get_strategica_reduce_prompt, get_topic_clusters_prompt
+
+    query = args.query
+    started = time.perf_counter()
+    collected = run_collect_job({
+        "query": query,
+        "location_code": args.location_code, "language_code": args.language_code,
+        "location_name": args.location_name, "language_name": args.language_name,
+    }, lambda done, total, message="": None)
+    timings["Fasi 1-2 · Raccolta SERP e competitor"] = time.perf_counter() - started
+
+    items = collected["serp_result"].get("items", [])
+    paa_items = next((item for item in items if item.get("type") == "people_also_ask"), {}).get("items", [])
+
+    started = time.perf_counter()
+    texts = [t for t in competitor_texts(collected["parsed_contents"], {}) if t.strip()]
+    mapped, errors = run_map(query, {content_hash(t): t for t in texts}, True)
+    if errors:
+        print(f"Attenzione: {len(errors)} competitor non analizzati: {next(iter(errors.values()))}", file=sys.stderr)
+    hashes = [h for h in (content_hash(t) for t in texts) if h in mapped]
+    tables = [parse_markdown_tables(mapped[h]["entities_md"]) for h in hashes]
+    entities = merge_entity_tables([dfs[0] for dfs in tables if dfs])
+    notes = "\n\n".join(f"**Competitor {i}:**\n{mapped[h]['notes']}" for i, h in enumerate(hashes, 1) if mapped[h]["notes"])
+    strat_text = generate_text(get_strategica_reduce_prompt(query, notes)) if hashes else ""
+    timings["Fase 3 · NLU map-reduce"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    headings = [h for res in collected["parsed_contents"] for h in sections_headings(res["sections"])]
+    topic_text = generate_text(get_topic_clusters_prompt(
+        query, entities.to_markdown(index=False),
+        "\n".join(list(dict.fromkeys(headings))[:30]),
+        "\n".join(paa.get("title", "") for paa in paa_items),
+    ))
+    timings["Fase 4 · Topic cluster"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    dfs_strat = parse_markdown_tables(strat_text.split("### Analisi Approfondita Audience ###")[0])
+    dfs_topics = parse_markdown_tables(topic_text)
+    kw_items = [item for result in collected["ranked_keywords_results"] if result["status"] == "ok" for item in result.get("items", [])]
+    kw_rows = [{"Keyword": i.get("keyword_data", {}).get("keyword"), "Volume": i.get("keyword_data", {}).get("search_volume")} for i in kw_items]
+    ranked_md = (pd.DataFrame(kw_rows).dropna().drop_duplicates().sort_values("Volume", ascending=False).head(15).to_markdown(index=False)
+                 if kw_rows else "Nessun dato sulle keyword.")
+    generate_text(get_content_brief_prompt(
+        keyword=query,
+        strat_analysis_str=dfs_strat[0].to_markdown(index=False) if dfs_strat else "N/D",
+        topic_clusters_md=dfs_topics[0].to_markdown(index=False) if dfs_topics else "",
+        ranked_keywords_md=ranked_md,
+        paa_str="\n".join(f"- {paa.get('title', '')}" for paa in paa_items),
+    ))
+    timings["Fase 5 · Content brief"] = time.perf_counter() - started
+
+
+def run_fanout(args, timings: dict) -> None:
+    """Generazione dei blueprint del Query Fan-Out (stesso batch della pagina)."""
+    from pages.fanout.batch import run_batch
+
+    queries = args.fanout_query or [args.query]
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        summary = run_batch([{"query": q, "destination": args.destination} for q in queries], Path(tmp) / "batch.jsonl")
+        timings["Fan-Out · Blueprint"] = time.perf_counter() - started
+    if summary["errors"]:
+        print(f"Attenzione: {summary['errors']} blueprint non generati", file=sys.stderr)
+
+
+def span_summary(spans: list[dict]) -> dict:
+    """Numero di chiamate e tempo totale per tipo di span (escluse le fasi)."""
+    summary = {}
+    for s in spans:
+        if s["kind"] == "phase":
+            continue
+        entry = summary.setdefault(s["kind"], {"calls": 0, "total_s": 0.0, "errors": 0})
+        entry["calls"] += 1
+        entry["total_s"] += s["duration_ms"] / 1000
+        entry["errors"] += s["status"] == "error"
+    return summary
+
+
+def _fixture_page(index: int, size_kb: int, declare_charset: bool) -> bytes:
+    """Pagina windows-1252 con testo accentato, con o senza <meta charset>."""
+    meta = '<meta charset="windows-1252">' if declare_charset else ""
+    paragraph = "<p>Perché è così difficile trovare un caffè già pronto? Società, città, qualità.</p>\n"
+    body = paragraph * (size_kb * 1024 // len(paragraph))
+    html = (f"<html><head>{meta}<title>Pagina {index} – più è meglio</title></head><body><main>"
+            f"<h1>Titolo {index} à è ì</h1><h2>Sezione</h2>{body}</main></body></html>")
+    return html.encode("windows-1252")
+
+
+def run_extract_fixture(args) -> dict:
+    """CPU (del thread chiamante) per URL: percorso attuale contro resp.text + BeautifulSoup su stringa."""
+    os.environ["ANNALECT_REPLAY_MODE"] = "off"
+    from pages.extractor.extract import BASE_HEADERS, analyze_html, extract_page, session
+
+    # Metà delle pagine dichiara il charset in un <meta>, l'altra metà non lo dichiara affatto
+    pages = {f"/p{i}": _fixture_page(i, args.page_kb, declare_charset=i % 2 == 0) for i in range(args.pages)}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = pages.get(self.path)
+            self.send_response(200 if body else 404)
+            # Nessun Content-Type: è il caso che attiva il rilevamento del charset di requests
+            self.send_header("Content-Length", str(len(body or b"")))
+            self.end_headers()
+            self.wfile.write(body or b"")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_port}{path}" for path in pages]
+
+    def previous(url):
+        # Percorso precedente: corpo intero, resp.text (con rilevamento del charset), poi stessa analisi
+        resp = session.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
+        resp.raise_for_status()
+        return analyze_html(url, resp.text, resp.url)
+
+    report = {}
+    try:
+        for name, fn in (("resp.text + BeautifulSoup", previous), ("fetch_html (decodifica unica)", extract_page)):
+            cpu = []
+            for url in urls:
+                started = time.thread_time()
+                fn(url)
+                cpu.append((time.thread_time() - started) * 1000)
+            report[name] = {"median_cpu_ms": round(statistics.median(cpu), 1), "total_cpu_s": round(sum(cpu) / 1000, 2)}
+    finally:
+        server.shutdown()
+    return {"pages": len(urls), "page_kb": args.page_kb, "accept_encoding": BASE_HEADERS["Accept-Encoding"], "paths": report}
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.extract_fixture:
+        report = run_extract_fixture(args)
+        if args.json:
+            print(json.dumps(report, indent=2, ensure_ascii=False))
+        else:
+            print(f"{report['pages']} pagine da {report['page_kb']} KB (windows-1252, senza Content-Type)")
+            for name, r in report["paths"].items():
+                print(f"{name:<34}{r['median_cpu_ms']:>10.1f} ms/URL (mediana){r['total_cpu_s']:>10.2f} s totali")
+        return 0
+    configure_environment(args)
+
+    import google.generativeai as genai
+    import streamlit as st
+
+    from pages.common import tracing
+
+    if args.record:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            print("GEMINI_API_KEY mancante: necessaria per registrare le cassette.", file=sys.stderr)
+            return 2
+        genai.configure(api_key=api_key)
+
+    runs = []
+    for _ in range(max(args.repeat, 1)):
+        # Ogni ripetizione parte a cache fredda: contano solo le cassette
+        st.cache_data.clear()
+        run_id = tracing.new_run_id()
+        tracing.set_run(run_id)
+        timings = {}
+        started = time.perf_counter()
+        if not args.skip_rankboost:
+            run_rankboost(args, timings)
+        if not args.skip_fanout:
+            run_fanout(args, timings)
+        timings["Totale"] = time.perf_counter() - started
+        runs.append({"timings": timings, "calls": span_summary(tracing.get_spans(run_id))})
+
+    phases = list(runs[0]["timings"])
+    report = {
+        "mode": os.environ["ANNALECT_REPLAY_MODE"],
+        "repeat": len(runs),
+        "phases": {
+            name: {
+                "median_s": round(statistics.median(r["timings"][name] for r in runs), 3),
+                "min_s": round(min(r["timings"][name] for r in runs), 3),
+                "max_s": round(max(r["timings"][name] for r in runs), 3),
+            }
+            for name in phases
+        },
+        "calls": runs[-1]["calls"],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0
+    print(f"Modalità: {report['mode']} · ripetizioni: {report['repeat']}")
+    print(f"{'Fase':<42}{'mediana (s)':>12}{'min (s)':>10}{'max (s)':>10}")
+    for name, t in report["phases"].items():
+        print(f"{name:<42}{t['median_s']:>12.3f}{t['min_s']:>10.3f}{t['max_s']:>10.3f}")
+    print(f"\n{'Tipo chiamata':<42}{'chiamate':>12}{'totale (s)':>10}{'errori':>10}")
+    for kind, c in sorted(report["calls"].items()):
+        print(f"{kind:<42}{c['calls']:>12}{c['total_s']:>10.2f}{c['errors']:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import time
+from io import BytesIO
+
+import pandas as pd
+import streamlit as st
+
+from pages.common.jobs import DONE, FAILED, PAGE_POLL_SECONDS, ensure_workers, get_job
+from pages.common.jobs import submit as submit_job
+from pages.common.metering import current_session_id, set_streamlit_context
+from pages.rankboost.serp_clusters import SERP_CLUSTER_SIMILARITY
+
+# Mercati principali (location_code e language_code di DataForSEO)
+MARKETS = {
+    "Italia · Italiano": (2380, "it"),
+    "Stati Uniti · Inglese": (2840, "en"),
+    "Regno Unito · Inglese": (2826, "en"),
+    "Germania · Tedesco": (2276, "de"),
+    "Francia · Francese": (2250, "fr"),
+    "Spagna · Spagnolo": (2724, "es"),
+}
+
+def main():
+    st.title("🧩 Keyword Clustering (SERP)")
+    st.markdown(
+        "Raggruppa le keyword in base ai risultati organici che condividono in SERP: "
+        "keyword con SERP simili possono essere coperte dalla stessa pagina."
+    )
+    st.divider()
+
+    col1, col2 = st.columns([2, 1], gap="large")
+    with col1:
+        keywords = st.text_area("Incolla le keyword (una per riga)", height=250, placeholder="scarpe running\nscarpe da corsa uomo")
+    with col2:
+        market = st.selectbox("Mercato", list(MARKETS))
+        similarity = st.slider(
+            "Sovrapposizione minima delle SERP", min_value=0.1, max_value=0.9, value=float(SERP_CLUSTER_SIMILARITY), step=0.05,
+            help="Similarità di Jaccard tra i primi URL organici di due keyword: più alta = cluster più piccoli e coesi."
+        )
+
+    # Le SERP già scaricate sono riusate dalla cache: rilanciare il clustering con
+    # un'altra soglia non ripete le chiamate a DataForSEO
+    if st.query_params.get("job", "").isdigit() and "cluster_job_id" not in st.session_state:
+        st.session_state.cluster_job_id = int(st.query_params["job"])
+
+    if st.button("🚀 Avvia Clustering"):
+        keyword_list = list(dict.fromkeys(k.strip() for k in keywords.splitlines() if k.strip()))
+        if len(keyword_list) < 2:
+            st.error("Inserisci almeno due keyword.")
+            return
+        location_code, language_code = MARKETS[market]
+        set_streamlit_context()
+        ensure_workers()
+        st.session_state.cluster_job_id = submit_job("serp_cluster", {
+            "keywords": keyword_list, "location_code": location_code,
+            "language_code": language_code, "similarity": similarity,
+        }, current_session_id())
+        st.query_params["job"] = str(st.session_state.cluster_job_id)
+
+    if "cluster_job_id" not in st.session_state:
+        return
+    job = get_job(st.session_state.cluster_job_id)
+    if job is None or job["kind"] != "serp_cluster":
+        st.session_state.pop("cluster_job_id")
+        st.query_params.pop("job", None)
+        return
+    if job["status"] == FAILED:
+        st.error(f"Clustering interrotto: {job['error'].splitlines()[0]}")
+        return
+    if job["status"] != DONE:
+        ensure_workers()
+        fraction = job["progress_done"] / job["progress_total"] if job["progress_total"] else 0.0
+        st.progress(fraction, text=job["progress_message"] or "In coda...")
+        time.sleep(PAGE_POLL_SECONDS)
+        st.rerun()
+
+    clusters, errors = job["result"]["clusters"], job["result"]["errors"]
+    grouped = [c for c in clusters if len(c["keywords"]) > 1]
+    st.success(f"{sum(len(c['keywords']) for c in clusters)} keyword in {len(clusters)} cluster ({len(grouped)} con più keyword).")
+    if errors:
+        st.warning(f"⚠️ SERP non disponibile per {len(errors)} keyword: {next(iter(errors.values()))}")
+
+    df = pd.DataFrame([
+        {
+            "Cluster": c["pillar"],
+            "N. keyword": len(c["keywords"]),
+            "Keyword": ", ".join(c["keywords"]),
+            "URL condivisi": "\n".join(c["urls"][:5]),
+        }
+        for c in clusters
+    ])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+    # Una riga per keyword, più comoda da filtrare nel foglio di calcolo
+    flat = pd.DataFrame([{"Cluster": c["pillar"], "Keyword": k} for c in clusters for k in c["keywords"]])
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        flat.to_excel(writer, index=False, sheet_name="Keyword")
+        df.to_excel(writer, index=False, sheet_name="Cluster")
+    buf.seek(0)
+    st.download_button(
+        "📥 Download XLSX",
+        data=buf,
+        file_name="cluster_keyword.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 import os
 import json
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urlparse, urlunparse
+import time
+from urllib.parse import urlparse
 from collections import Counter
 
 import pandas as pd
@@ -10,20 +10,39 @@ import requests
 import streamlit as st
 import google.generativeai as genai
 from streamlit_quill import st_quill
-from bs4 import BeautifulSoup
+
+from pages.common import cassette
+from pages.common.executor import get_executor
+from pages.common.jobs import DONE, FAILED, PAGE_POLL_SECONDS, ensure_workers, get_job
+from pages.common.jobs import submit as submit_job
+from pages.common.metering import BudgetExceeded, check_budget, current_session_id, set_streamlit_context
+from pages.common.perf_panel import render_cost_panel, render_performance_panel, render_session_memory_panel
+from pages.common.session_data import get_session_data
+from pages.common.settings import get_setting
+from pages.common.tracing import add_spans, new_run_id, set_run, span
+from pages.rankboost.content import competitor_texts, html_to_text, sections_headings, sections_to_html
+from pages.rankboost.dataforseo import AIO_TYPES, has_credentials, session
+from pages.rankboost.loader import strategic_records
+from pages.rankboost.nlu import StageTracker, combine_hashes, content_hash, generate_text, merge_entity_tables, parse_markdown_tables, run_map
+from pages.rankboost.prompts import get_content_brief_prompt, get_strategica_prompt, get_strategica_reduce_prompt, get_topic_clusters_prompt
+from pages.rankboost.render import render_aio_sources, render_aio_text, render_organic_results, render_pills
+from pages.rankboost.scoring import DraftScorer
+from pages.rankboost.serp_history import diff_snapshots, list_snapshots, organic_ranks, rank_history
+from pages.rankboost.store import save_analysis
+from pages.rankboost.topics import TOPIC_COLUMNS, cluster_topics, split_entity_cells
 
 # --- 1. CONFIGURAZIONE E COSTANTI ---
 
-# Configura il client Gemini
+# Configura il client Gemini (in modalità replay le risposte arrivano dalle cassette
+# locali e le credenziali non servono)
 try:
     GEMINI_API_KEY = st.secrets.get("gemini", {}).get("api_key") or os.environ.get("GEMINI_API_KEY")
-    if not GEMINI_API_KEY:
+    if not GEMINI_API_KEY and not cassette.replaying():
         st.error("GEMINI_API_KEY non trovata. Impostala nei Secrets di Streamlit o come variabile d'ambiente.")
         st.stop()
 
-    genai.configure(api_key=GEMINI_API_KEY)
-
-    gemini_client = genai.GenerativeModel("gemini-2.5-pro")
+    if GEMINI_API_KEY:
+        genai.configure(api_key=GEMINI_API_KEY)
 
 except AttributeError:
     st.error("Errore di configurazione di Gemini (AttributeError). Assicurati di avere l'ultima versione della libreria: 'pip install --upgrade google-generativeai'")
@@ -33,17 +52,11 @@ except Exception as e:
     st.stop()
 
 
-# Configura le credenziali DataForSEO
-try:
-    DFS_AUTH = (st.secrets["dataforseo"]["username"], st.secrets["dataforseo"]["password"])
-except (KeyError, FileNotFoundError):
+# Configura le credenziali DataForSEO (la sessione HTTP è in pages/rankboost/dataforseo.py)
+if not has_credentials() and not cassette.replaying():
     st.error("Credenziali DataForSEO non trovate negli secrets di Streamlit.")
     st.stop()
 
-# Sessione HTTP globale per riutilizzo connessioni
-session = requests.Session()
-session.auth = DFS_AUTH
-
 
 # --- 2. FUNZIONI DI UTILITY E API ---
 
@@ -96,269 +109,96 @@ def get_languages_data() -> pd.DataFrame:
         ]
         return pd.DataFrame(default_data)
 
-@st.cache_data(show_spinner=False, ttl=3600)
-def fetch_main_image_url(url: str) -> str | None:
-    """Tenta di estrarre l'immagine principale (og:image) da un URL."""
-    if not url:
-        return None
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(url, timeout=5, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        og_image = soup.find("meta", property="og:image")
-        if og_image and og_image.get("content"):
-            return og_image["content"]
-
-        twitter_image = soup.find("meta", attrs={"name": "twitter:image"})
-        if twitter_image and twitter_image.get("content"):
-            return twitter_image["content"]
-
-    except requests.RequestException:
-        return None
-    return None
-
-def clean_url(url: str) -> str:
-    """Rimuove parametri e frammenti da un URL."""
-    if not isinstance(url, str): return ""
-    parsed = urlparse(url)
-    return urlunparse(parsed._replace(query="", params="", fragment=""))
-
-@st.cache_data(ttl=600, show_spinner="Analisi SERP in corso...")
-def fetch_serp_data(query: str, location_code: int, language_code: str) -> dict | None:
-    """Esegue la chiamata API a DataForSEO con la struttura del payload corretta e definitiva."""
-    post_data = [{
-        "keyword": query,
-        "location_code": location_code,
-        "language_code": language_code,
-        "device": "desktop",
-        "os": "windows",
-        "depth": 11,
-        "load_async_ai_overview": True,
-        "people_also_ask_click_depth": 4
-    }]
-    try:
-        response = session.post("https://api.dataforseo.com/v3/serp/google/organic/live/advanced", json=post_data)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("tasks_error", 0) > 0:
-             st.error("DataForSEO ha restituito un errore nel task:")
-             st.json(data["tasks"])
-             return None
-
-        if not data.get("tasks") or not data["tasks"][0].get("result"):
-            st.error("Risposta da DataForSEO non valida o senza risultati.")
-            st.json(data)
-            return None
-        return data["tasks"][0]["result"][0]
-    except requests.RequestException as e:
-        st.error(f"Errore chiamata a DataForSEO: {e}")
-        return None
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def parse_url_content(url: str) -> dict:
-    """Estrae il 'main_topic' e gli headings da una pagina."""
-    default_return = {"html_content": "", "headings": []}
-    if not url or url.lower().endswith('.pdf'):
-        return default_return
-
-    post_data = [{"url": url, "enable_javascript": True, "enable_xhr": True, "disable_cookie_popup": True}]
+def enforce_budget():
+    """Interrompe l'analisi con un messaggio se il budget di spesa è esaurito."""
     try:
-        response = session.post("https://api.dataforseo.com/v3/on_page/content_parsing/live", json=post_data)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("tasks_error", 0) > 0 or not data.get("tasks") or not data["tasks"][0].get("result"):
-            return default_return
-
-        result_list = data["tasks"][0].get("result")
-        if not result_list: return default_return
-
-        items_list = result_list[0].get("items")
-        if not items_list: return default_return
-
-        page_content = items_list[0].get("page_content")
-        if not page_content: return default_return
-
-        main_topic_data = page_content.get('main_topic')
-        if not isinstance(main_topic_data, list): return default_return
-
-        html_parts, headings = [], []
-        for section in main_topic_data:
-            h_title = section.get('h_title')
-            if h_title:
-                level = section.get('level', 2)
-                html_parts.append(f"<h{level}>{h_title}</h{level}>")
-                headings.append(f"H{level}: {h_title}")
-
-            primary_content_list = section.get('primary_content')
-            if isinstance(primary_content_list, list):
-                for item in primary_content_list:
-                    text = item.get("text", "").strip()
-                    if text:
-                        html_parts.append(f"<p>{text}</p>")
-
-        return {"html_content": "".join(html_parts), "headings": headings}
-    except (requests.RequestException, KeyError, IndexError, TypeError):
-        return default_return
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def fetch_ranked_keywords(url: str, location_name: str, language_name: str) -> dict:
-    """Estrae le keyword posizionate."""
-    payload = [{"target": url, "location_name": location_name, "language_name": language_name, "limit": 30}]
-    try:
-        response = session.post("https://api.dataforseo.com/v3/dataforseo_labs/google/ranked_keywords/live", json=payload)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("tasks_error", 0) > 0 or not data.get("tasks") or not data["tasks"][0].get("result"):
-            error_message = data.get("tasks",[{}])[0].get("status_message", "N/A")
-            return {"url": url, "status": "failed", "error": error_message, "items": []}
-
-        api_items = data["tasks"][0]["result"][0].get("items")
-        return {"url": url, "status": "ok", "items": api_items if api_items is not None else []}
-    except requests.RequestException as e:
-        return {"url": url, "status": "failed", "error": str(e), "items": []}
+        check_budget()
+    except BudgetExceeded as e:
+        st.error(f"💸 {e}. Aumenta il budget nei secrets ([tuning]) o riprova più tardi.")
+        st.stop()
+
+def nlu_error(e: Exception) -> str:
+    """Mostra l'errore di Gemini (solo dal thread dello script) e restituisce il testo segnaposto."""
+    st.error(f"Errore durante la chiamata a Gemini: {e}")
+    return f"ERRORE NLU: {e}"
 
 def run_nlu(prompt: str) -> str:
     """Esegue una singola chiamata al modello Gemini."""
     try:
-        response = gemini_client.generate_content(prompt)
-        if response.parts:
-            return response.text
-        return "Nessun contenuto generato. La risposta potrebbe essere stata bloccata per motivi di sicurezza."
+        return generate_text(prompt)
     except Exception as e:
-        st.error(f"Errore durante la chiamata a Gemini: {e}")
-        return f"ERRORE NLU: {e}"
-
-def parse_markdown_tables(text: str) -> list[pd.DataFrame]:
-    """Estrae tabelle Markdown da un testo in modo robusto."""
-    tables_md = re.findall(r"((?:\|.*\|[\r\n]+)+)", text)
-    dataframes = []
-    for table_md in tables_md:
-        lines = [l.strip() for l in table_md.strip().splitlines() if l.strip()]
-        if len(lines) < 2: continue
-
-        header_line = lines[0]
-        header = [h.strip() for h in header_line.split('|')[1:-1]]
-
-        data_lines = []
-        for line in lines[1:]:
-            if all(cell.strip().startswith(':--') for cell in line.split('|')[1:-1]):
-                continue
-            data_lines.append(line)
-
-        rows_data = []
-        for row in data_lines:
-            cells = [cell.strip() for cell in row.split('|')[1:-1]]
-            if len(cells) == len(header):
-                rows_data.append(cells)
-
-        if rows_data:
-            dataframes.append(pd.DataFrame(rows_data, columns=header))
-    return dataframes
-
-# --- 3. FUNZIONI PER LA COSTRUZIONE DEI PROMPT ---
-
-def get_strategica_prompt(keyword: str, texts: str) -> str:
-    """Costruisce il prompt per l'analisi strategica."""
-    return f"""
-## PROMPT: NLU Semantic Content Intelligence ##
-**PERSONA:** Agisci come un **Lead SEO Strategist** con 15 anni di esperienza. Il tuo approccio è data-driven e focalizzato sull'intento di ricerca per creare contenuti dominanti.
-**CONTESTO:** Ho estratto il contenuto testuale delle pagine top-ranking per la query.
-**QUERY STRATEGICA:** {keyword}
-### INIZIO TESTI DEI COMPETITOR DA ANALIZZARE ###
-<TESTI>
-{texts}
-</TESTI>
----
-**COMPITO E FORMATO DI OUTPUT:**
-**Parte 1: Tabella Sintetica**
-Analizza in modo aggregato tutti i testi forniti. Sintetizza le tue scoperte compilando la seguente tabella Markdown. Per ogni riga, la tua analisi deve rappresentare la tendenza predominante o la media osservata in TUTTI i testi. Genera **ESCLUSIVAMENTE** la tabella Markdown completa, iniziando dalla riga dell’header.| Caratteristica SEO | Analisi Sintetica |
-
-| :--- | :--- |
-| **Search Intent Primario** | `[Determina e inserisci qui: Informazionale, Commerciale, Transazionale, Navigazionale. Aggiungi tra parentesi un brevissimo approfondimenti di massimo 5/6 parole]` |
-| **Search Intent Secondario** | `[Determina e inserisci qui l'intento secondario. Aggiungi tra parentesi un brevissimo approfondimenti di massimo 5/6 parole]` |
-| **Target Audience** | `[Definisci il target audience in massimo 6 parole]` |
-| **Tone of Voice (ToV)** | `[Sintetizza il ToV predominante con 3 aggettivi chiave]` |
-**Parte 2: Analisi Approfondita Audience**
-Dopo la tabella, inserisci un separatore `---` seguito da un'analisi dettagliata del target audience. Inizia questa sezione con l'intestazione esatta: `### Analisi Approfondita Audience ###`.
-Il testo deve essere un paragrafo di 3-4 frasi che descriva il pubblico in termini di livello di conoscenza, bisogni, possibili punti deboli (pain points) e cosa si aspetta di trovare nel contenuto. Questa analisi deve servire come guida per un copywriter.
-"""
-
-def get_competitiva_prompt(keyword: str, texts: str) -> str:
-    """Costruisce il prompt per l'analisi delle entità - VERSIONE RINFORZATA."""
-    return f"""
-**RUOLO**: Agisci come un sistema di Natural Language Processing (NLP) estremamente preciso. Il tuo unico scopo è estrarre entità e formattarle in una tabella Markdown. Non sei un assistente conversazionale.
-**CONTESTO**: Analizzerò testi dei competitor per la keyword target per estrarre le entità semantiche più importanti.
-**KEYWORD TARGET**: {keyword}
-
-### INIZIO TESTI DA ANALIZZARE ###
-<TESTI>
-{texts}
-</TESTI>
-### FINE TESTI DA ANALIZZARE ###
-
-**COMPITO FONDAMENTALE**:
-1.  Estrai le entità nominate rilevanti dai testi.
-2.  Assegna una categoria (es. Prodotto, Brand, Caratteristica, Località, Concetto Astratto).
-3.  Assegna una rilevanza (Alta, Media). Ignora tutto ciò che ha rilevanza Bassa.
-4.  Raggruppa le entità con la stessa Categoria e Rilevanza sulla stessa riga, separate da virgola.
-
-**FORMATO DI OUTPUT OBBLIGATORIO**:
-Genera **ESCLUSIVAMENTE** la tabella Markdown. Non includere **ASSOLUTAMENTE NESSUN** testo prima o dopo la tabella (niente introduzioni, niente spiegazioni, niente "Ecco la tabella:"). Il tuo output deve iniziare direttamente con la riga dell'header `| Categoria | Entità |...`.
-
-| Categoria | Entità | Rilevanza Strategica |
-| :--- | :--- | :--- |
-"""
-
-def get_topic_clusters_prompt(keyword: str, entities_md: str, headings_str: str, paa_str: str) -> str:
-    """Costruisce il prompt per il Topical Modeling."""
-    return f"""
-## PROMPT: Topic Modeling & Information Architecture ##
-**PERSONA:** Agisci come un **Information Architect e Semantic SEO Strategist**. Il tuo compito è decostruire un argomento complesso nei suoi pilastri concettuali.
-**CONTESTO:** Sto pianificando un contenuto definitivo per la query `{keyword}`. Ho già estratto entità, headings e domande "People Also Ask" (PAA). Ora devo organizzarli in una struttura logica.
-### DATI DI INPUT ###
-**1. ENTITÀ RILEVANTI:**
-{entities_md}
-**2. HEADINGS STRUTTURALI:**
-{headings_str}
-**3. DOMANDE DEGLI UTENTI (PAA):**
-{paa_str}
----
-**COMPITO E FORMATO DI OUTPUT:**
-1.  **Analisi e Sintesi:** Analizza TUTTI i dati per identificare i sotto-argomenti principali.
-2.  **Clustering:** Raggruppa entità, headings e domande correlate in **5-7 cluster tematici**.
-3.  **Formattazione:** Genera **ESCLUSIVAMENTE** una tabella Markdown. Non aggiungere introduzioni o commenti.
-| Topic Cluster (Sotto-argomento Principale) | Concetti, Entità e Domande Chiave del Cluster |
-| :--- | :--- |
-"""
-
-def get_content_brief_prompt(**kwargs) -> str:
-    """Costruisce il prompt per generare il Content Brief finale."""
-    return f"""
-## PROMPT: Generatore di Content Brief SEO Strategico ##
-**PERSONA:** Agisci come un **Head of Content** con profonde competenze SEO e NLU. Il tuo lavoro è tradurre analisi complesse in un brief attuabile per un copywriter.
-**CONTESTO:** Sulla base di un'analisi approfondita della SERP per la query `{kwargs.get('keyword', '')}`, devi sintetizzare tutti i dati raccolti in un piano di contenuto dettagliato.
-### DATI DI INPUT SINTETIZZATI ###
-**1. Analisi Strategica:**
-{kwargs.get('strat_analysis_str', '')}
-**2. Architettura del Topic (Topic Clusters):**
-{kwargs.get('topic_clusters_md', '')}
-**3. Keyword Secondarie e Correlate (Opzionale):**
-{kwargs.get('ranked_keywords_md', '')}
-**4. Domande degli Utenti (PAA):**
-{kwargs.get('paa_str', '')}
----
-**COMPITO E FORMATO DI OUTPUT:**
-Genera un content brief completo **ESCLUSIVAMENTE in formato Markdown**. Sii prescrittivo e chiaro.
-1.  **Titolo e Meta Description:** Suggerisci 2 opzioni per `<title>` (60 caratteri max) e 1 opzione per `meta description` (155 caratteri max).
-2.  **Struttura del Contenuto (Outline):** Crea una struttura gerarchica dettagliata (H1, H2, H3). L'H1 deve contenere la keyword. Gli H2 devono basarsi sui Topic Cluster. Sotto ogni H2, elenca i concetti e le domande da trattare.
-3.  **Entità "Must-Have":** Elenca le 5-7 entità più importanti da includere.
-4.  **Sezione FAQ:** Proponi una sezione `## FAQ` con le domande PAA più importanti come H3.
-Inizia direttamente con `## ✍️ Content Brief: {kwargs.get('keyword', '')}`.
-"""
+        return nlu_error(e)
+
+@st.cache_resource(show_spinner=False, max_entries=20)
+def get_draft_scorer(corpus_hash: str, _texts: list[str]) -> DraftScorer:
+    """Modello TF-IDF dei competitor, riaddestrato solo quando cambia il corpus (hash dei testi)."""
+    return DraftScorer(_texts)
+
+def render_draft_scoring(organic_results: list):
+    """Confronto live tra la bozza dell'utente e i contenuti dei competitor."""
+    data = get_session_data()
+    texts = competitor_texts(data.get("parsed_contents"), data.get("edited_html_contents"))
+    if not any(t.strip() for t in texts):
+        return
+    st.subheader("✍️ Valuta la tua bozza")
+    st.caption("Incolla o scrivi il tuo testo: a ogni modifica viene confrontato con i contenuti dei competitor.")
+    draft_html = st_quill(html=True, placeholder="Scrivi qui la tua bozza...", key="draft_quill")
+    draft_text = html_to_text(draft_html)
+    if not draft_text:
+        return
+
+    scorer = get_draft_scorer(combine_hashes([content_hash(t) for t in texts]), texts)
+    start = time.perf_counter()
+    similarities, missing = scorer.score(draft_text)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    col_sim, col_missing = st.columns(2)
+    with col_sim:
+        st.markdown("**Similarità con i competitor**")
+        st.dataframe(pd.DataFrame([
+            {"Competitor": urlparse(res.get("url", "")).netloc.replace("www.", ""), "Similarità": round(float(sim) * 100, 1)}
+            for res, sim, text in zip(organic_results, similarities, texts) if text.strip()
+        ]).sort_values("Similarità", ascending=False), use_container_width=True, hide_index=True)
+    with col_missing:
+        st.markdown("**Termini rilevanti assenti nella bozza**")
+        if missing:
+            st.dataframe(pd.DataFrame([
+                {"Termine": m["term"], "Peso": round(m["weight"], 3), "Competitor che lo usano": m["competitors"]}
+                for m in missing
+            ]), use_container_width=True, hide_index=True)
+        else:
+            st.success("La bozza copre tutti i termini principali dei competitor.")
+    st.caption(f"Punteggio calcolato in {elapsed_ms:.1f} ms sul vettore della sola bozza.")
+
+def render_serp_history(query: str, location_code: int, language_code: str):
+    """Confronto tra snapshot della SERP salvati nello storico locale."""
+    snapshots = list_snapshots(query, location_code, language_code)
+    if len(snapshots) < 2:
+        st.caption("Lo storico si arricchisce a ogni nuova analisi di questa query: serve almeno un secondo snapshot per il confronto.")
+        return
+
+    st.write("**Presenza di AI Overview e PAA nel tempo:**")
+    st.dataframe(
+        snapshots.rename(columns={"fetched_at": "Data", "has_aio": "AI Overview", "has_paa": "PAA", "organic_count": "Risultati organici"}).drop(columns="id"),
+        use_container_width=True, hide_index=True
+    )
+
+    ids = snapshots["id"].tolist()
+    dates = dict(zip(ids, snapshots["fetched_at"]))
+    c1, c2 = st.columns(2)
+    before_id = c1.selectbox("Snapshot di partenza", ids[:-1], index=len(ids) - 2, format_func=dates.get, key="serp_history_before")
+    after_id = c2.selectbox("Snapshot di confronto", ids[1:], index=len(ids) - 2, format_func=dates.get, key="serp_history_after")
+    ranks = organic_ranks([before_id, after_id])
+    diff = diff_snapshots(ranks[ranks["snapshot_id"] == before_id], ranks[ranks["snapshot_id"] == after_id])
+    counts = diff["status"].value_counts()
+    st.caption(" · ".join(f"{label}: {counts.get(status, 0)}" for status, label in [("nuovo", "Nuovi entrati"), ("uscito", "Usciti"), ("salito", "Saliti"), ("sceso", "Scesi")]))
+    st.dataframe(
+        diff.rename(columns={"url": "URL", "domain": "Dominio", "rank_before": "Prima", "rank_after": "Dopo", "delta": "Variazione", "status": "Stato"}),
+        use_container_width=True, hide_index=True
+    )
+
+    st.write("**Posizione per dominio in ogni snapshot:**")
+    st.dataframe(rank_history(snapshots), use_container_width=True)
 
 # --- 4. INTERFACCIA UTENTE E FLUSSO PRINCIPALE ---
 
@@ -390,11 +230,21 @@ languages_df = get_languages_data()
 if 'analysis_started' not in st.session_state:
     st.session_state.analysis_started = False
 
+# Ripresa di un'analisi dal link (?job=ID) dopo la chiusura della tab o un nuovo accesso
+if not st.session_state.analysis_started and st.query_params.get("job", "").isdigit():
+    resumed_job = get_job(int(st.query_params["job"]), with_result=False)
+    if resumed_job and resumed_job["kind"] == "rankboost_collect":
+        for key in ['query', 'location_name', 'language_name']:
+            st.session_state[key] = resumed_job["params"][key]
+        st.session_state.collect_job_id = resumed_job["id"]
+        st.session_state.analysis_started = True
+
 def start_analysis():
     if not all([st.session_state.query, st.session_state.get('location_code'), st.session_state.get('language_code')]):
         st.warning("Tutti i campi (Query, Country, Lingua) sono obbligatori.")
         return
-    current_keys = ['query', 'location_code', 'language_code', 'location_name', 'language_name']
+    current_keys = ['query', 'location_code', 'language_code', 'location_name', 'language_name', 'nlu_map_reduce', 'topic_clusters_ai']
+    get_session_data().clear()
     for key in list(st.session_state.keys()):
         if key not in current_keys:
             del st.session_state[key]
@@ -402,11 +252,13 @@ def start_analysis():
     st.rerun() 
 
 def new_analysis():
-    current_keys = ['query', 'location_code', 'language_code', 'location_name', 'language_name']
+    current_keys = ['query', 'location_code', 'language_code', 'location_name', 'language_name', 'nlu_map_reduce', 'topic_clusters_ai']
+    get_session_data().clear()
     for key in list(st.session_state.keys()):
         if key not in current_keys:
             del st.session_state[key]
     st.session_state.analysis_started = False
+    st.query_params.pop("job", None)
     st.rerun()
 
 with st.container():
@@ -436,6 +288,22 @@ with st.container():
         else:
             st.button("🚀 Avvia Analisi", on_click=start_analysis, type="primary", use_container_width=True)
 
+    with st.expander("⚙️ Impostazioni avanzate"):
+        st.toggle(
+            "Analisi NLU map-reduce",
+            value=get_setting("nlu_map_reduce", True),
+            key="nlu_map_reduce",
+            help="Analizza ogni competitor in parallelo con un modello più veloce e aggrega i risultati con un prompt breve. "
+                 "Disattivalo per inviare tutti i testi in un unico prompt al modello principale."
+        )
+        st.toggle(
+            "Topic cluster con l'AI",
+            value=get_setting("topic_clusters_ai", True),
+            key="topic_clusters_ai",
+            help="Disattivalo per raggruppare entità, headings e domande PAA in locale (TF-IDF e clustering "
+                 "agglomerativo): meno di un secondo e nessuna chiamata a Gemini, con etichette meno descrittive."
+        )
+
 st.divider()
 
 if st.session_state.get('analysis_started', False):
@@ -445,78 +313,154 @@ if st.session_state.get('analysis_started', False):
     location_name = st.session_state.location_name
     language_name = st.session_state.language_name
 
-    if 'serp_result' not in st.session_state:
-        with st.spinner("Fase 1/5: Analizzo la SERP (attendo le AIO, può richiedere più tempo)..."):
-            st.session_state.serp_result = fetch_serp_data(query, location_code, language_code)
-
-    if not st.session_state.serp_result:
-        st.error("Analisi interrotta: i dati della SERP non sono stati recuperati. Controllare i log sopra per l'errore API.")
-        st.stop() 
-
-    items = st.session_state.serp_result.get('items', [])
+    # Una run di tracing per analisi: gli span di tutte le fasi (anche nei rerun) finiscono nel pannello prestazioni
+    if 'trace_run_id' not in st.session_state:
+        st.session_state.trace_run_id = new_run_id()
+    set_run(st.session_state.trace_run_id)
+    set_streamlit_context()
+    # SERP grezza, contenuti, keyword e testi dell'AI stanno compressi su disco (pages/common/session_data.py):
+    # in st.session_state resta solo l'handle, i payload si caricano quando servono
+    data = get_session_data()
+
+    # Fasi 1-2 (SERP, contenuti, immagini AIO, ranked keywords) in un job in background:
+    # sopravvive a rerun e tab chiuse, ed è condiviso con chi lancia la stessa analisi.
+    if 'serp_result' not in data:
+        if 'collect_job_id' not in st.session_state:
+            enforce_budget()
+            ensure_workers()
+            collect_params = {
+                "query": query, "location_code": location_code, "language_code": language_code,
+                "location_name": location_name, "language_name": language_name,
+            }
+            st.session_state.collect_job_id = submit_job("rankboost_collect", collect_params, current_session_id())
+            st.query_params["job"] = str(st.session_state.collect_job_id)
+
+        job = get_job(st.session_state.collect_job_id)
+        if job is None or job["status"] == FAILED:
+            error = job["error"].splitlines()[0] if job else "job non trovato"
+            st.error(f"Analisi interrotta: i dati della SERP non sono stati recuperati. {error}")
+            st.stop()
+        if job["status"] != DONE:
+            ensure_workers()
+            fraction = job["progress_done"] / job["progress_total"] if job["progress_total"] else 0.0
+            st.progress(fraction, text=job["progress_message"] or "In coda: l'analisi partirà appena un worker sarà libero...")
+            st.caption("Puoi chiudere la pagina: riaprendo questo link l'analisi riprende da dove è arrivata.")
+            time.sleep(PAGE_POLL_SECONDS)
+            st.rerun()
+
+        for key, value in job["result"].items():
+            data.put(key, value)
+        add_spans(st.session_state.trace_run_id, job["spans"])
+        # Solo i competitor modificati nell'editor: indice -> HTML
+        data.put("edited_html_contents", {})
+
+    serp_result = data.get("serp_result")
+    parsed_contents = data.get("parsed_contents")
+    edited_html_contents = data.get("edited_html_contents")
+    ranked_keywords_results = data.get("ranked_keywords_results", [])
+    if serp_result is None or parsed_contents is None:
+        # Payload su disco eliminati dalla pulizia delle sessioni inattive
+        st.warning("I dati di questa analisi sono scaduti: avvia una nuova analisi.")
+        st.stop()
+    items = serp_result.get('items', [])
     organic_results = [item for item in items if item.get("type") == "organic"]
-
-    AIO_TYPES = ["ai_overview", "generative_answers"]
     ai_overview = next((item for item in items if item.get("type") in AIO_TYPES), None)
 
     paa_items = next((item for item in items if item.get("type") == "people_also_ask"), {}).get("items", [])
     related_searches = next((item for item in items if item.get("type") == "related_searches"), {}).get("items", [])
 
-    if 'parsed_contents' not in st.session_state:
-        urls_to_parse = [r.get("url") for r in organic_results if r.get("url")]
-        if urls_to_parse:
-            with st.spinner(f"Fase 1.5/5: Estraggo i contenuti di {len(urls_to_parse)} pagine..."):
-                with ThreadPoolExecutor(max_workers=5) as executor:
-                    future_to_url = {executor.submit(parse_url_content, url): url for url in urls_to_parse}
-                    results = {future_to_url[future]: future.result() for future in as_completed(future_to_url)}
-
-                st.session_state.parsed_contents = [results.get(url, {"html_content": "", "headings": []}) for url in urls_to_parse]
-                st.session_state.edited_html_contents = [res['html_content'] for res in st.session_state.parsed_contents]
-        else:
-            st.session_state.parsed_contents = []
-            st.session_state.edited_html_contents = []
-
-    if 'aio_source_images' not in st.session_state and ai_overview:
-        aio_references = ai_overview.get("references", [])
-        urls_to_fetch_images = [ref.get("url") for ref in aio_references if ref.get("url")]
-        if urls_to_fetch_images:
-            with st.spinner(f"Fase 1.6/5: Estraggo le immagini per {len(urls_to_fetch_images)} fonti AIO..."):
-                 with ThreadPoolExecutor(max_workers=5) as executor:
-                    future_to_url = {executor.submit(fetch_main_image_url, url): url for url in urls_to_fetch_images}
-                    image_results = {future_to_url[future]: future.result() for future in as_completed(future_to_url)}
-                    st.session_state.aio_source_images = image_results
-    elif 'aio_source_images' not in st.session_state:
-         st.session_state.aio_source_images = {}
-
-    if 'ranked_keywords_results' not in st.session_state:
-        urls_for_ranking = [clean_url(res.get("url")) for res in organic_results if res.get("url")]
-        if urls_for_ranking:
-            with st.spinner(f"Fase 2/5: Scopro le keyword di {len(urls_for_ranking)} competitor..."):
-                with ThreadPoolExecutor(max_workers=5) as executor:
-                    futures = [executor.submit(fetch_ranked_keywords, url, location_name, language_name) for url in urls_for_ranking]
-                    st.session_state.ranked_keywords_results = [f.result() for f in as_completed(futures)]
-        else:
-            st.session_state.ranked_keywords_results = []
-
-    if 'nlu_strat_text' not in st.session_state:
-        initial_cleaned_texts = "\n\n--- SEPARATORE TESTO ---\n\n".join(
-            filter(None, [BeautifulSoup(html, "html.parser").get_text(separator="\n", strip=True) for html in st.session_state.get('edited_html_contents', [])])
-        )
-        if not initial_cleaned_texts.strip():
+    # Fase 3 incrementale e map-reduce: ogni competitor passa da una fase "map" (entità e,
+    # in modalità map-reduce, note strategiche) in cache per hash del testo; le entità sono
+    # unite localmente e l'analisi strategica è un piccolo prompt di aggregazione ("reduce").
+    # StageTracker registra l'hash degli input di ogni fase, così la modifica di un
+    # competitor nell'editor ricalcola solo quel competitor e le fasi a valle.
+    # Tracker e risultati "map" stanno in SessionData come gli altri payload: dopo ogni
+    # modifica vanno salvati di nuovo con data.put
+    tracker = data.get("stage_tracker") or StageTracker()
+    competitor_maps = data.get("competitor_maps", {})
+    map_reduce = st.session_state.get('nlu_map_reduce', True)
+
+    nonempty_texts = [t for t in competitor_texts(parsed_contents, edited_html_contents) if t.strip()]
+    text_hashes = [content_hash(t) for t in nonempty_texts]
+    corpus_hash = combine_hashes(text_hashes)
+    joined_texts = "\n\n--- SEPARATORE TESTO ---\n\n".join(nonempty_texts)
+
+    if not joined_texts.strip():
+        if 'nlu_strat_text' not in data:
             st.warning("Nessun contenuto testuale significativo recuperato dai competitor. L'analisi NLU sarà limitata.")
-            st.session_state.nlu_strat_text = ""
-            st.session_state.nlu_comp_text = ""
-        else:
-            with st.spinner("Fase 3/5: L'AI definisce l'intento e le entità..."):
-                with ThreadPoolExecutor() as executor:
-                    future_strat = executor.submit(run_nlu, get_strategica_prompt(query, initial_cleaned_texts))
-                    future_comp = executor.submit(run_nlu, get_competitiva_prompt(query, initial_cleaned_texts))
-                    st.session_state.nlu_strat_text = future_strat.result()
-                    st.session_state.nlu_comp_text = future_comp.result()
+            data.put("nlu_strat_text", "")
+            data.put("nlu_comp_text", "")
+    else:
+        to_map = {h: t for h, t in zip(text_hashes, nonempty_texts) if h not in competitor_maps}
+        direct_strat_needed = not map_reduce and 'nlu_strat_text' not in data
+        if to_map or direct_strat_needed:
+            first_run = 'nlu_strat_text' not in data
+            spinner_text = "Fase 3/5: L'AI definisce l'intento e le entità..." if first_run else f"Fase 3/5: Aggiorno {len(to_map)} competitor modificati..."
+            with st.spinner(spinner_text), span("Fase 3 · NLU map", kind="phase", competitors=len(to_map)):
+                # Nel thread dell'executor non c'è il contesto Streamlit: l'eventuale errore
+                # torna con la future e viene mostrato qui, come map_errors
+                future_strat = get_executor().submit("gemini", generate_text, get_strategica_prompt(query, joined_texts)) if direct_strat_needed else None
+                mapped, map_errors = run_map(query, to_map, map_reduce)
+                competitor_maps.update(mapped)
+                if future_strat:
+                    try:
+                        strat_text = future_strat.result()
+                    except Exception as e:
+                        strat_text = nlu_error(e)
+                    data.put("nlu_strat_text", strat_text)
+                    tracker.mark("strategic", corpus_hash)
+                    data.put("stage_tracker", tracker)
+            if map_errors:
+                st.warning(f"⚠️ {len(map_errors)} competitor non analizzati dall'AI: i risultati NLU sono parziali. Errore: {next(iter(map_errors.values()))}")
+            truncated = sum(1 for h in to_map if competitor_maps.get(h, {}).get("truncated"))
+            if truncated:
+                st.info(f"ℹ️ {truncated} pagine molto lunghe sono state troncate per l'analisi NLU.")
+        current_hashes = set(text_hashes)
+        if to_map or competitor_maps.keys() - current_hashes:
+            # Si tengono solo le mappe dei testi attuali: quelle dei competitor modificati non servono più
+            competitor_maps = {h: m for h, m in competitor_maps.items() if h in current_hashes}
+            data.put("competitor_maps", competitor_maps)
+
+        mapped_hashes = [h for h in text_hashes if h in competitor_maps]
+        entities_hash = combine_hashes(mapped_hashes)
+        if tracker.is_stale("entities", entities_hash):
+            tables = [parse_markdown_tables(competitor_maps[h]["entities_md"]) for h in mapped_hashes]
+            merged_entities = merge_entity_tables([dfs[0] for dfs in tables if dfs])
+            data.put("nlu_comp_text", merged_entities.to_markdown(index=False) if not merged_entities.empty else "")
+            if tracker.has_run("entities"):
+                # Entità cambiate dopo una modifica: si ricalcolano le fasi a valle (topic cluster)
+                for key in ['edited_df_entities', 'df_topic_clusters', 'edited_df_topic_clusters']:
+                    data.pop(key)
+                for key in ['editor_entities', 'editor_topics']:
+                    st.session_state.pop(key, None)
+            tracker.mark("entities", entities_hash)
+            data.put("stage_tracker", tracker)
+
+        if map_reduce and mapped_hashes and tracker.is_stale("strategic", entities_hash):
+            with st.spinner("Fase 3/5: Aggrego l'analisi strategica dei competitor..."), span("Fase 3 · NLU reduce", kind="phase"):
+                notes = "\n\n".join(
+                    f"**Competitor {i}:**\n{competitor_maps[h]['notes']}"
+                    for i, h in enumerate(mapped_hashes, 1) if competitor_maps[h]["notes"]
+                )
+                data.put("nlu_strat_text", run_nlu(get_strategica_reduce_prompt(query, notes)))
+                tracker.mark("strategic", entities_hash)
+                data.put("stage_tracker", tracker)
+
+        for key in ('nlu_strat_text', 'nlu_comp_text'):
+            if key not in data:
+                data.put(key, "")
 
     # --- INIZIO VISUALIZZAZIONE ---
     st.subheader("Analisi Strategica")
-    nlu_strat_text = st.session_state.nlu_strat_text
+    if not map_reduce and joined_texts.strip() and tracker.is_stale("strategic", corpus_hash):
+        st.warning("⚠️ I contenuti dei competitor sono stati modificati dopo l'analisi strategica.")
+        if st.button("🔄 Aggiorna Analisi Strategica"):
+            with st.spinner("Aggiorno l'analisi strategica sui contenuti modificati..."), span("Fase 3 · Analisi strategica", kind="phase"):
+                data.put("nlu_strat_text", run_nlu(get_strategica_prompt(query, joined_texts)))
+                tracker.mark("strategic", corpus_hash)
+                data.put("stage_tracker", tracker)
+            st.rerun()
+    nlu_strat_text = data.get("nlu_strat_text", "")
     dfs_strat = parse_markdown_tables(nlu_strat_text.split("### Analisi Approfondita Audience ###")[0])
     if dfs_strat:
         df_strat = dfs_strat[0]
@@ -531,16 +475,6 @@ if st.session_state.get('analysis_started', False):
     st.divider()
 
     if ai_overview:
-        # LOGICA "MOSTRA TUTTI"
-        all_references = ai_overview.get("references", [])
-        if 'num_aio_sources_to_show' not in st.session_state:
-            st.session_state.num_aio_sources_to_show = 3
-
-        def show_all_sources():
-            st.session_state.num_aio_sources_to_show = len(all_references)
-
-        references_to_show = all_references[:st.session_state.num_aio_sources_to_show]
-
         svg_logo = """<svg class="fWWlmf JzISke" height="24" width="24" aria-hidden="true" viewBox="0 0 471 471" xmlns="http://www.w3.org/2000/svg" style="vertical-align: middle;"><path fill="var(--m3c23)" d="M235.5 471C235.5 438.423 229.22 407.807 216.66 379.155C204.492 350.503 187.811 325.579 166.616 304.384C145.421 283.189 120.498 266.508 91.845 254.34C63.1925 241.78 32.5775 235.5 0 235.5C32.5775 235.5 63.1925 229.416 91.845 217.249C120.498 204.689 145.421 187.811 166.616 166.616C187.811 145.421 204.492 120.497 216.66 91.845C229.22 63.1925 235.5 32.5775 235.5 0C235.5 32.5775 241.584 63.1925 253.751 91.845C266.311 120.497 283.189 145.421 304.384 166.616C325.579 187.811 350.503 204.689 379.155 217.249C407.807 229.416 438.423 235.5 471 235.5C438.423 235.5 407.807 241.78 379.155 254.34C350.503 266.508 325.579 283.189 304.384 304.384C283.189 325.579 266.311 350.503 253.751 379.155C241.584 407.807 235.5 438.423 235.5 471Z"></path></svg>"""
         header_html = f'<div class="aio-header" style="display: flex; align-items: center; gap: 12px; margin-bottom: 1rem;">{svg_logo}<h2 style="margin: 0; border: none; font-size: 28px;">AI Overview</h2></div>'
         st.markdown(header_html, unsafe_allow_html=True)
@@ -549,33 +483,11 @@ if st.session_state.get('analysis_started', False):
         aio_col1, aio_col2 = st.columns([2, 1.5]) 
 
         with aio_col1:
-            main_text_html = "<div style='font-size: 16px; line-height: 1.6;'>" + "<p>" + "</p><p>".join(item.get('text', '').replace('\n', '<br>') for item in ai_overview.get('items', []) if item.get('text')) + "</p></div>"
-            st.markdown(main_text_html, unsafe_allow_html=True)
+            render_aio_text(ai_overview.get('items', []))
 
         with aio_col2:
-            for ref in references_to_show:
-                image_url = st.session_state.aio_source_images.get(ref.get("url"))
-                image_html = f'<div style="flex: 1; min-width: 100px;"><a href="{ref.get("url")}" target="_blank"><img src="{image_url}" style="width: 100%; border-radius: 8px;"></a></div>' if image_url else ''
-
-                card_html = f"""
-                <div style="background-color: #f0f4ff; border-radius: 12px; padding: 16px; margin-bottom: 1rem; display: flex; gap: 16px; align-items: stretch;">
-                    <div style="flex: 3; display: flex; flex-direction: column;">
-                        <a href="{ref.get('url')}" target="_blank" style="text-decoration: none; color: inherit; flex-grow: 1;">
-                            <div style="font-weight: 500; color: #1f1f1f; margin-bottom: 8px; font-size: 16px;">{ref.get('title')}</div>
-                        </a>
-                        <div style="font-size: 12px; color: #202124; display: flex; align-items: center; margin-top: 8px;">
-                            <img src="https://www.google.com/s2/favicons?domain={ref.get('domain')}&sz=16" style="width:16px; height:16px; margin-right: 8px;">
-                            <span>{ref.get('source', ref.get('domain'))}</span>
-                        </div>
-                    </div>
-                    {image_html}
-                </div>
-                """
-                st.markdown(card_html, unsafe_allow_html=True)
-
-            # Mostra il pulsante solo se ci sono altre fonti da vedere
-            if len(all_references) > st.session_state.num_aio_sources_to_show:
-                st.button("Mostra tutti", on_click=show_all_sources, use_container_width=True)
+            # "Mostra tutti" è nel frammento: il clic non riesegue il resto della pagina
+            render_aio_sources(ai_overview.get("references", []), data.get("aio_source_images", {}))
 
         st.divider()
 
@@ -583,46 +495,16 @@ if st.session_state.get('analysis_started', False):
 
     with left_col:
         st.markdown('<h3 style="margin-top:0; padding-top:0;">Risultati Organici</h3>', unsafe_allow_html=True)
-        html_string = ""
-        for res in organic_results:
-            url_raw = res.get("url", "")
-            if not url_raw: continue
-            p = urlparse(url_raw)
-            pretty_url = str(p.netloc + p.path).replace("www.","")
-            name = res.get("breadcrumb", "").split("›")[0].strip() if res.get("breadcrumb") else p.netloc.replace('www.','')
-            title = res.get("title", "")
-            desc = res.get("description", "")
-            html_string += f"""
-            <div style="margin-bottom: 2rem;">
-                <div style="display: flex; align-items: center; margin-bottom: 0.2rem;">
-                    <img src="https://www.google.com/s2/favicons?domain={p.netloc}&sz=64" 
-                         onerror="this.onerror=null;this.src='https://www.google.com/favicon.ico';" 
-                         style="width: 26px; height: 26px; border-radius: 50%; border: 1px solid #d2d2d2; margin-right: 0.5rem;">
-                    <div>
-                        <div style="color: #202124; font-size: 16px; line-height: 20px;">{name}</div>
-                        <div style="color: #4d5156; font-size: 14px; line-height: 18px;">{pretty_url}</div>
-                    </div>
-                </div>
-                <a href="{url_raw}" target="_blank" style="color: #1a0dab; text-decoration: none; font-size: 23px; font-weight: 500;">
-                    {title}
-                </a>
-                <div style="font-size: 16px; line-height: 22px; color: #474747;">
-                    {desc}
-                </div>
-            </div>
-            """
-        st.markdown(html_string, unsafe_allow_html=True)
+        render_organic_results(organic_results, source="serp")
 
     with right_col:
         if paa_items:
             st.markdown('<h3 style="margin-top:0; padding-top:0;">People Also Ask</h3>', unsafe_allow_html=True)
-            paa_pills = ''.join(f'<span style="background-color:#f7f8f9;padding:8px 12px;border-radius:4px;font-size:16px;margin-right:4px;margin-bottom:8px;display:inline-block;">{paa.get("title")}</span>' for paa in paa_items)
-            st.markdown(f"<div>{paa_pills}</div>", unsafe_allow_html=True)
+            render_pills([paa.get("title") for paa in paa_items])
 
         if related_searches:
             st.markdown('<h3 style="margin-top:1.5rem;">Ricerche Correlate</h3>', unsafe_allow_html=True)
-            related_pills = ''.join(f'<span style="background-color:#f7f8f9;padding:8px 12px;border-radius:4px;font-size:16px;margin-right:4px;margin-bottom:8px;display:inline-block;">{r}</span>' for r in related_searches)
-            st.markdown(f"<div>{related_pills}</div>", unsafe_allow_html=True)
+            render_pills(related_searches)
 
     st.divider()
 
@@ -631,57 +513,77 @@ if st.session_state.get('analysis_started', False):
         nav_labels = [f"{i+1}. {urlparse(res.get('url', '')).netloc.replace('www.', '')}" for i, res in enumerate(organic_results)]
         selected_index = st.radio("Seleziona un competitor da analizzare:", options=range(len(nav_labels)), format_func=lambda i: nav_labels[i], horizontal=True, label_visibility="collapsed")
 
-        if selected_index < len(st.session_state.edited_html_contents):
-            edited_content = st_quill(value=st.session_state.edited_html_contents[selected_index], html=True, key=f"quill_{selected_index}")
-            if edited_content != st.session_state.edited_html_contents[selected_index]:
-                st.session_state.edited_html_contents[selected_index] = edited_content
+        if selected_index < len(parsed_contents):
+            current_html = edited_html_contents.get(selected_index)
+            if current_html is None:
+                current_html = sections_to_html(parsed_contents[selected_index]["sections"])
+            edited_content = st_quill(value=current_html, html=True, key=f"quill_{selected_index}")
+            if edited_content != current_html:
+                edited_html_contents[selected_index] = edited_content
+                data.put("edited_html_contents", edited_html_contents)
                 st.rerun()
     else:
         st.write("Nessun contenuto da analizzare.")
 
+    render_draft_scoring(organic_results)
+
     st.header("4. Analisi NLU Avanzata")
 
     st.subheader("Entità Rilevanti (Common Ground dei Competitor)")
     with st.expander("🔬 Clicca qui per vedere la risposta grezza dell'AI per le Entità"):
-        st.text_area("Output NLU (Entità)", st.session_state.get('nlu_comp_text', 'N/A'), height=200)
+        st.text_area("Output NLU (Entità)", data.get('nlu_comp_text', 'N/A'), height=200)
 
-    dfs_comp = parse_markdown_tables(st.session_state.nlu_comp_text)
+    dfs_comp = parse_markdown_tables(data.get("nlu_comp_text", ""))
     df_entities = dfs_comp[0] if dfs_comp else pd.DataFrame(columns=['Categoria', 'Entità', 'Rilevanza Strategica'])
 
     st.info("ℹ️ Puoi modificare le entità. Le tue modifiche guideranno la fase successiva.")
-    if 'edited_df_entities' not in st.session_state:
-        st.session_state.edited_df_entities = df_entities.copy()
-
-    st.session_state.edited_df_entities = st.data_editor(st.session_state.edited_df_entities, use_container_width=True, hide_index=True, num_rows="dynamic", key="editor_entities")
-
-    if 'df_topic_clusters' not in st.session_state:
-         with st.spinner("Fase 4/5: Raggruppo le entità in Topic Cluster semantici..."):
-            all_headings = [h for res in st.session_state.parsed_contents for h in res['headings']]
-            headings_str = "\n".join(list(dict.fromkeys(all_headings))[:30])
-            paa_str = "\n".join([paa.get('title', '') for paa in paa_items])
-            entities_md = st.session_state.edited_df_entities.to_markdown(index=False)
-
-            topic_prompt = get_topic_clusters_prompt(query, entities_md, headings_str, paa_str)
-            nlu_topic_text = run_nlu(topic_prompt)
-
-            dfs_topics = parse_markdown_tables(nlu_topic_text)
-            st.session_state.df_topic_clusters = dfs_topics[0] if dfs_topics else pd.DataFrame(columns=['Topic Cluster (Sotto-argomento Principale)', 'Concetti, Entità e Domande Chiave del Cluster'])
+    stored_entities = data.get("edited_df_entities")
+    if stored_entities is None:
+        stored_entities = df_entities.copy()
+    edited_df_entities = st.data_editor(stored_entities, use_container_width=True, hide_index=True, num_rows="dynamic", key="editor_entities")
+    if 'edited_df_entities' not in data or not edited_df_entities.equals(stored_entities):
+        data.put("edited_df_entities", edited_df_entities)
+
+    df_topic_clusters = data.get("df_topic_clusters")
+    if df_topic_clusters is None:
+         use_ai = st.session_state.get('topic_clusters_ai', True)
+         with st.spinner("Fase 4/5: Raggruppo le entità in Topic Cluster semantici..."), span("Fase 4 · Topic cluster", kind="phase", mode="gemini" if use_ai else "locale"):
+            all_headings = list(dict.fromkeys(h for res in parsed_contents for h in sections_headings(res['sections'])))[:30]
+            paa_titles = [paa.get('title', '') for paa in paa_items]
+
+            if use_ai:
+                headings_str = "\n".join(all_headings)
+                paa_str = "\n".join(paa_titles)
+                entities_md = edited_df_entities.to_markdown(index=False)
+
+                topic_prompt = get_topic_clusters_prompt(query, entities_md, headings_str, paa_str)
+                nlu_topic_text = run_nlu(topic_prompt)
+
+                dfs_topics = parse_markdown_tables(nlu_topic_text)
+                df_topic_clusters = dfs_topics[0] if dfs_topics else pd.DataFrame(columns=TOPIC_COLUMNS)
+            else:
+                entity_col = 'Entità' if 'Entità' in edited_df_entities.columns else None
+                entities = split_entity_cells(edited_df_entities[entity_col].dropna().tolist()) if entity_col else []
+                df_topic_clusters = cluster_topics(query, entities, all_headings, paa_titles)
+            data.put("df_topic_clusters", df_topic_clusters)
 
     st.subheader("Architettura del Topic (Topic Modeling)")
     st.info("ℹ️ Questa è la mappa concettuale. Gli H2 del tuo articolo dovrebbero basarsi su questi cluster.")
 
-    if 'edited_df_topic_clusters' not in st.session_state:
-        st.session_state.edited_df_topic_clusters = st.session_state.df_topic_clusters.copy()
-
-    st.session_state.edited_df_topic_clusters = st.data_editor(st.session_state.edited_df_topic_clusters, use_container_width=True, hide_index=True, num_rows="dynamic", key="editor_topics")
+    stored_topics = data.get("edited_df_topic_clusters")
+    if stored_topics is None:
+        stored_topics = df_topic_clusters.copy()
+    edited_df_topic_clusters = st.data_editor(stored_topics, use_container_width=True, hide_index=True, num_rows="dynamic", key="editor_topics")
+    if 'edited_df_topic_clusters' not in data or not edited_df_topic_clusters.equals(stored_topics):
+        data.put("edited_df_topic_clusters", edited_df_topic_clusters)
 
     st.header("5. Content Brief Strategico Finale")
     if st.button("✍️ Genera Brief Dettagliato", type="primary", use_container_width=True):
-        with st.spinner("Fase 5/5: Sto scrivendo il brief per il tuo copywriter..."):
+        with st.spinner("Fase 5/5: Sto scrivendo il brief per il tuo copywriter..."), span("Fase 5 · Content brief", kind="phase"):
             strat_analysis_str = dfs_strat[0].to_markdown(index=False) if dfs_strat else "N/D"
-            topic_clusters_md = st.session_state.edited_df_topic_clusters.to_markdown(index=False)
+            topic_clusters_md = edited_df_topic_clusters.to_markdown(index=False)
 
-            all_kw_data = [item for result in st.session_state.ranked_keywords_results if result['status'] == 'ok' for item in result.get('items', [])]
+            all_kw_data = [item for result in ranked_keywords_results if result['status'] == 'ok' for item in result.get('items', [])]
             if all_kw_data:
                 kw_list = [{"Keyword": item.get("keyword_data", {}).get("keyword"), "Volume": item.get("keyword_data", {}).get("search_volume")} for item in all_kw_data]
                 ranked_keywords_df = pd.DataFrame(kw_list).dropna().drop_duplicates().sort_values("Volume", ascending=False).head(15)
@@ -697,17 +599,60 @@ if st.session_state.get('analysis_started', False):
             }
 
             final_brief = run_nlu(get_content_brief_prompt(**brief_prompt_args))
-            st.session_state.final_brief = final_brief
+            data.put("final_brief", final_brief)
 
-    if 'final_brief' in st.session_state:
-        st.markdown(st.session_state.final_brief)
+    if 'final_brief' in data:
+        st.markdown(data.get("final_brief"))
+
+    st.header("6. Archivio Analisi")
+    st.info("ℹ️ Salva l'analisi nell'archivio locale per riaprirla in **Rank Booster Processing** senza scaricare o caricare file.")
+    if st.button("💾 Salva nell'archivio", use_container_width=True):
+        kw_rows = [
+            {
+                "Keyword": item.get("keyword_data", {}).get("keyword"),
+                "Volume": item.get("keyword_data", {}).get("search_volume"),
+                "Competitor": urlparse(result['url']).netloc.removeprefix('www.'),
+            }
+            for result in ranked_keywords_results if result['status'] == 'ok'
+            for item in result.get('items', [])
+        ]
+        df_gap = pd.DataFrame(kw_rows, columns=["Keyword", "Volume", "Competitor"]).dropna()
+        if not df_gap.empty:
+            df_gap = df_gap.groupby("Keyword", as_index=False).agg(
+                Volume=("Volume", "max"), Competitor=("Competitor", lambda c: ", ".join(sorted(set(c))))
+            ).sort_values("Volume", ascending=False).head(50)
+
+        topic_cols = list(edited_df_topic_clusters.columns)
+        export_payload = {
+            "query": query,
+            "country": location_name,
+            "language": language_name,
+            "organic": [
+                {"URL": res.get("url", ""), "Meta Title": res.get("title", ""), "Meta Description": res.get("description", "")}
+                for res in organic_results
+            ],
+            "people_also_ask": [paa.get("title", "") for paa in paa_items if paa.get("title")],
+            "related_searches": [r for r in related_searches if isinstance(r, str)],
+            "analysis_strategica": strategic_records(dfs_strat[0] if dfs_strat else None),
+            "common_ground": edited_df_entities.to_dict("records"),
+            "content_gap": df_gap.to_dict("records"),
+            "keyword_mining": [
+                {"Categoria Keyword": row[topic_cols[0]], "Keywords / Concetti / Domande": row[topic_cols[1]]}
+                for row in edited_df_topic_clusters.to_dict("records")
+            ] if len(topic_cols) >= 2 else [],
+            "content_brief": data.get("final_brief", ""),
+        }
+        st.session_state.saved_analysis_id = save_analysis(export_payload)
+
+    if 'saved_analysis_id' in st.session_state:
+        st.success(f"✅ Analisi salvata con ID #{st.session_state.saved_analysis_id}. Aprila da Rank Booster Processing → Archivio analisi.")
 
     st.markdown("---")
     st.header("Appendice: Dati di Dettaglio")
 
     with st.expander("Visualizza Keyword Ranking dei Competitor e Matrice di Copertura"):
         all_keywords_data = []
-        for result in st.session_state.ranked_keywords_results:
+        for result in ranked_keywords_results:
             if result['status'] == 'ok' and result.get('items'):
                 competitor_domain = urlparse(result['url']).netloc.removeprefix('www.')
                 for item in result['items']:
@@ -736,6 +681,13 @@ if st.session_state.get('analysis_started', False):
         else:
             st.write("_Nessuna keyword posizionata trovata per i competitor._")
 
+    with st.expander("📈 Storico della SERP (movimenti di rank, nuovi entrati, AIO e PAA)"):
+        render_serp_history(query, location_code, language_code)
+
     with st.expander("🕵️‍♂️ ISPEZIONE DATI GREZZI DALLA SERP (DEBUG)"):
         st.info("Usa questo box per verificare la risposta completa dell'API DataForSEO.")
-        st.json(st.session_state.serp_result)
+        st.json(serp_result)
+
+    render_performance_panel(st.session_state.trace_run_id)
+    render_cost_panel(current_session_id())
+    render_session_memory_panel(data)
@@ -2,18 +2,18 @@ import streamlit as st
 import json
 import re
 import pandas as pd
-from urllib.parse import urlparse
 
-# Funzione per pulire le etichette per la visualizzazione
-def clean_label(raw_label):
-    return re.sub(r'\*+', '', raw_label).strip()
+from pages.rankboost.loader import AnalysisValidationError, load_analysis_data
+from pages.rankboost.render import render_organic_results, render_pills
+from pages.rankboost.store import list_analyses, load_analysis_bytes
 
 # --- Configurazione Pagina ---
 st.set_page_config(layout="wide")
 st.title("📝 Analisi e Scrittura Contenuti SEO")
 st.markdown(
     """
-    In questa pagina puoi caricare il JSON generato dalla pagina di raccolta dati SEO,
+    In questa pagina puoi aprire un'analisi dall'archivio locale (o caricare il JSON
+    generato dalla pagina di raccolta dati SEO),
     visualizzare i dettagli della query, le People Also Ask, le Ricerche Correlate,
     i primi 10 risultati organici in stile SERP, selezionare le singole keywords,
     e infine scegliere righe da Common Ground e Content Gap,
@@ -56,22 +56,60 @@ if "step" not in st.session_state:
 if "keyword_widgets_map" not in st.session_state:
     st.session_state.keyword_widgets_map = {}
 
-# --- Logica di Caricamento File ---
+# --- Logica di Caricamento Dati (archivio locale o file JSON) ---
+def set_data(raw):
+    """Esegue parsing e validazione una sola volta; le viste dei singoli step vengono memoizzate."""
+    try:
+        loaded = load_analysis_data(raw)
+    except json.JSONDecodeError as e:
+        st.error(f"❌ Errore nel parsing del JSON: {e}")
+        st.stop()
+    except AnalysisValidationError as e:
+        st.error("❌ Il JSON non ha la struttura attesa:\n\n" + "\n".join(f"- {err}" for err in e.errors))
+        st.stop()
+    st.session_state.data = loaded
+    st.session_state.step = 1
+    # Pulisce tutto lo stato vecchio per evitare conflitti
+    keys_to_clear = list(st.session_state.keys())
+    for key in keys_to_clear:
+        if key not in ['data', 'step']:
+            del st.session_state[key]
+
 if st.session_state.data is None:
-    uploaded_file = st.file_uploader("Carica il file JSON", type="json", help="Carica qui il file JSON generato dalla pagina precedente")
-    if uploaded_file:
-        try:
-            st.session_state.data = json.load(uploaded_file)
-            st.session_state.step = 1
-            # Pulisce tutto lo stato vecchio per evitare conflitti
-            keys_to_clear = list(st.session_state.keys())
-            for key in keys_to_clear:
-                if key not in ['data', 'step']:
-                    del st.session_state[key]
+    requested_id = st.query_params.get("analysis_id")
+    if requested_id and requested_id.isdigit():
+        archived = load_analysis_bytes(int(requested_id))
+        if archived is not None:
+            set_data(archived)
             st.rerun()
-        except json.JSONDecodeError as e:
-            st.error(f"❌ Errore nel parsing del JSON: {e}")
+        st.warning(f"Analisi #{requested_id} non trovata nell'archivio.")
+
+    source = st.radio("Origine dei dati", ["Archivio analisi", "Carica file JSON"], horizontal=True)
+    if source == "Archivio analisi":
+        col_q, col_c = st.columns([2, 1])
+        filter_query = col_q.text_input("Filtra per query", placeholder="Inizio della query...")
+        saved = list_analyses(query=filter_query.strip())
+        countries = sorted({a["country"] for a in saved if a["country"]})
+        filter_country = col_c.selectbox("Country", ["Tutte"] + countries)
+        if filter_country != "Tutte":
+            saved = [a for a in saved if a["country"] == filter_country]
+        if not saved:
+            st.info("⏳ Nessuna analisi in archivio. Salvala dalla pagina Rank Booster Analysis oppure carica un file JSON.")
             st.stop()
+        selected = st.selectbox(
+            "Analisi salvate",
+            options=saved,
+            format_func=lambda a: f"#{a['id']} · {a['query']} · {a['country']} · {a['language']} · {a['created_at'][:16].replace('T', ' ')}"
+        )
+        if st.button("Apri analisi", type="primary"):
+            set_data(load_analysis_bytes(selected["id"]))
+            st.rerun()
+        st.stop()
+
+    uploaded_file = st.file_uploader("Carica il file JSON", type="json", help="Carica qui il file JSON generato dalla pagina precedente")
+    if uploaded_file:
+        set_data(uploaded_file.getvalue())
+        st.rerun()
     else:
         st.info("⏳ Carica un file JSON per procedere con l'analisi.")
         st.stop()
@@ -96,8 +134,7 @@ if st.session_state.step == 1:
 
     st.markdown('<h3 style="margin-top:0.5rem; padding-top:0;">Dettagli della Query</h3>', unsafe_allow_html=True)
 
-    analysis_list = data.get("analysis_strategica", [])
-    analysis_map = {clean_label(item.get("Caratteristica SEO", "")): clean_label(item.get("Analisi Sintetica", "")) for item in analysis_list}
+    analysis_map = data.analysis_map
 
     raw_signals = analysis_map.get("Segnali E-E-A-T", "")
     signals_val = re.sub(r"\s*\([^)]*\)", "", raw_signals).strip()
@@ -133,32 +170,7 @@ if st.session_state.step == 1:
         st.markdown('<h3 style="margin-top:0; padding-top:0;">Risultati Organici (Top 10)</h3>', unsafe_allow_html=True)
         organic = data.get("organic", [])
         if organic:
-            html = '<div style="padding-right:3.5rem;">'
-            for it in organic[:10]:
-                url_raw = it.get("URL", "")
-                p = urlparse(url_raw)
-                base = f"{p.scheme}://{p.netloc}"
-                segs = [s for s in p.path.split("/") if s]
-                pretty = base + (" › " + " › ".join(segs) if segs else "")
-                hn = p.netloc.split('.')
-                name = (hn[1] if len(hn) > 2 else hn[0]).replace('-', ' ').title()
-                title = it.get("Meta Title", "")
-                desc = it.get("Meta Description", "")
-                html += (
-                    '<div style="margin-bottom:2rem;">'
-                      '<div style="display:flex;align-items:center;margin-bottom:0.2rem;">'
-                        f'<img src="https://www.google.com/s2/favicons?domain={p.netloc}&sz=64" onerror="this.src=\'https://www.google.com/favicon.ico\';" style="width:26px;height:26px;border-radius:50%;border:1px solid #d2d2d2;margin-right:0.5rem;"/>'
-                        '<div>'
-                          f'<div style="color:#202124;font-size:16px;line-height:20px;">{name}</div>'
-                          f'<div style="color:#4d5156;font-size:14px;line-height:18px;">{pretty}</div>'
-                        '</div>'
-                      '</div>'
-                      f'<a href="{url_raw}" style="color:#1a0dab;text-decoration:none;font-size:23px;font-weight:500;">{title}</a>'
-                      f'<div style="font-size:16px;line-height:22px;color:#474747;">{desc}</div>'
-                    '</div>'
-                )
-            html += '</div>'
-            st.markdown(html, unsafe_allow_html=True)
+            render_organic_results(organic[:10], source="export")
         else:
             st.warning("⚠️ Nessun risultato organico trovato.")
             
@@ -166,16 +178,14 @@ if st.session_state.step == 1:
         st.markdown('<h3 style="margin-top:0; padding-top:0;">People Also Ask</h3>', unsafe_allow_html=True)
         paa = data.get("people_also_ask", [])
         if paa:
-            pills = ''.join(f'<span style="background-color:#f7f8f9;padding:8px 12px;border-radius:4px;font-size:16px;margin-right:4px;margin-bottom:8px;display:inline-block;">{q}</span>' for q in paa)
-            st.markdown(f"<div>{pills}</div>", unsafe_allow_html=True)
+            render_pills(paa)
         else:
             st.write("_Nessuna PAA trovata_")
             
         st.markdown('<h3 style="margin-top:1.5rem;">Ricerche Correlate</h3>', unsafe_allow_html=True)
         related = data.get("related_searches", [])
         if related:
-            pills = ''.join(f'<span style="background-color:#f7f8f9;padding:8px 12px;border-radius:4px;font-size:16px;margin-right:4px;margin-bottom:8px;display:inline-block;">{r}</span>' for r in related)
-            st.markdown(f"<div>{pills}</div>", unsafe_allow_html=True)
+            render_pills(related)
         else:
             st.write("_Nessuna ricerca correlata trovata_")
 
@@ -184,16 +194,10 @@ if st.session_state.step == 1:
 # ==================== STEP 2: Analisi Semantica (Ex-Step 3) ====================
 elif st.session_state.step == 2:
     st.markdown('<h3 style="margin-top:0.5rem; padding-top:0;">Analisi Semantica Avanzata</h3>', unsafe_allow_html=True)
-    df_common_initial = pd.DataFrame(data.get("common_ground", []))
-    if not df_common_initial.empty:
-        df_common_initial.insert(0, "Seleziona", False)
-    df_gap_initial = pd.DataFrame(data.get("content_gap", []))
-    if not df_gap_initial.empty:
-        df_gap_initial.insert(0, "Seleziona", False)
     st.subheader("Common Ground Analysis")
-    st.data_editor(df_common_initial, use_container_width=True, hide_index=True, key="editor_common", height=300)
+    st.data_editor(data.common_ground_df, use_container_width=True, hide_index=True, key="editor_common", height=300)
     st.subheader("Content Gap Opportunity")
-    st.data_editor(df_gap_initial, use_container_width=True, hide_index=True, key="editor_gap", height=300)
+    st.data_editor(data.content_gap_df, use_container_width=True, hide_index=True, key="editor_gap", height=300)
     c1, c2 = st.columns(2)
     c1.button("Indietro", on_click=go_back, key="back_btn_2")
     c2.button("Avanti", on_click=go_next, key="next_btn_2", type="primary")
@@ -222,12 +226,10 @@ elif st.session_state.step == 3:
 # ==================== STEP 4: Selezione Keywords (Ex-Step 2) ====================
 elif st.session_state.step == 4:
     st.markdown('<h3 style="margin-top:0; padding-top:0;">Seleziona le singole keywords per l\'analisi</h3>', unsafe_allow_html=True)
-    keyword_mining = data.get("keyword_mining", [])
-    if keyword_mining:
+    keyword_groups = data.keyword_groups
+    if keyword_groups:
         st.session_state.keyword_widgets_map.clear()
-        for i, entry in enumerate(keyword_mining):
-            display_label = clean_label(entry.get("Categoria Keyword", ""))
-            kws = [k.strip(" `") for k in entry.get("Keywords / Concetti / Domande", "").split(",")]
+        for i, (display_label, kws) in enumerate(keyword_groups):
             widget_key = f"ms_keyword_{i}"
             st.session_state.keyword_widgets_map[widget_key] = display_label
             st.markdown(f'<p style="font-size:1.25rem; font-weight:600; margin:1rem 0 0.75rem 0;">{display_label}</p>', unsafe_allow_html=True)
@@ -251,8 +253,7 @@ elif st.session_state.step == 5:
             recap_data[f"{display_label} Selezionate"] = ", ".join(st.session_state.get(widget_key, []))
 
     # Analisi Strategica
-    analysis_list = data.get("analysis_strategica", [])
-    analysis_map = {clean_label(item.get("Caratteristica SEO", "")): clean_label(item.get("Analisi Sintetica", "")) for item in analysis_list}
+    analysis_map = data.analysis_map
     for key in ["Search Intent Primario", "Search Intent Secondario", "Target Audience & Leggibilità", "Tone of Voice (ToV)"]:
         recap_data[key] = re.sub(r"\s*\([^)]*\)", "", analysis_map.get(key, "")).strip()
 
@@ -1,12 +1,15 @@
 import streamlit as st
 import google.generativeai as genai
 import pandas as pd
-import json
-import re
 import spacy
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
 
+from pages.common import cassette
+from pages.common.settings import data_path, get_setting
+from pages.fanout.batch import BlueprintError, batch_id, generate_blueprint, read_results, results_to_xlsx, run_batch
+from pages.fanout.prompts import DESTINATION_MAP
+
 # --- 1. CONFIGURAZIONE INIZIALE E API KEY ---
 
 st.set_page_config(
@@ -20,8 +23,10 @@ try:
     GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
     genai.configure(api_key=GEMINI_API_KEY)
 except (KeyError, AttributeError):
-    st.error("Chiave API di Gemini non trovata! Aggiungi 'GEMINI_API_KEY = \"tua_chiave\"' al tuo file .streamlit/secrets.toml.")
-    st.stop()
+    # In modalità replay le risposte di Gemini arrivano dalle cassette locali
+    if not cassette.replaying():
+        st.error("Chiave API di Gemini non trovata! Aggiungi 'GEMINI_API_KEY = \"tua_chiave\"' al tuo file .streamlit/secrets.toml.")
+        st.stop()
 
 # --- CACHING E INIZIALIZZAZIONE ---
 
@@ -42,12 +47,7 @@ if 'history' not in st.session_state:
 st.markdown("""<h1>♟️ Qforia - GEO & AI Content Architect</h1><p>Blueprint Strategici su Misura per Ogni Contesto</p>""", unsafe_allow_html=True)
 st.sidebar.markdown("""<h2>⚙️ Configurazione Strategica</h2>""", unsafe_allow_html=True)
 
-destination_map = {
-    "Articolo del Blog (Pillar Page)": "BLOG_POST",
-    "Landing Page di Conversione": "LANDING_PAGE",
-    "PLP (Pagina Elenco Prodotti)": "PLP",
-    "PDP (Pagina Dettaglio Prodotto)": "PDP"
-}
+destination_map = DESTINATION_MAP
 selected_destination_name = st.sidebar.selectbox(
     "📍 Destinazione del Contenuto",
     options=list(destination_map.keys()),
@@ -62,95 +62,89 @@ selected_model = language_map[selected_language_name]
 user_query = st.sidebar.text_area("💭 Inserisci la tua query o prodotto principale", "vestiti eleganti donna", height=100)
 user_industry = st.sidebar.text_input("🎯 Qual è il tuo settore?", placeholder="Es. E-commerce di moda")
 exclude_brands = st.sidebar.toggle("🚫 Escludi Brand Specifici", value=False)
+batch_mode = st.sidebar.toggle("📦 Modalità Batch", value=False, help="Genera i blueprint per una lista di query e destinazioni.")
 
-# --- 3. PROMPT STRATEGICI DINAMICI ---
-
-def get_strategic_prompt(destination_code, query, industry, exclude_brands):
-    """
-    Costruisce un prompt dinamico che mantiene la struttura a 3 pilastri,
-    ma adatta la "persona" e le istruzioni in base alla destinazione scelta.
-    """
-    
-    # Mappatura delle personalizzazioni
-    persona_map = {
-        "BLOG_POST": "You are an 'Expert SEO & AI Content Architect'. Your mission is to create a content strategy to build topical authority and dominate organic search.",
-        "LANDING_PAGE": "You are a 'Direct Response Copywriter & Conversion Rate Optimization (CRO) Specialist'. Your goal is to design a high-converting landing page strategy that persuades users to take action.",
-        "PLP": "You are an 'E-commerce SEO & UX Specialist'. Your task is to provide a strategy to optimize an existing Product Listing Page (PLP) to improve rankings and user experience.",
-        "PDP": "You are an 'E-commerce Product Merchandiser & Copywriter'. Your goal is to create a blueprint to enrich a Product Detail Page (PDP), answer all user questions, and drive sales."
-    }
-    
-    # Mappatura dei nomi delle sezioni per chiarezza
-    structure_name_map = {
-        "BLOG_POST": "Pillar Page Structure",
-        "LANDING_PAGE": "Core Landing Page Content Structure",
-        "PLP": "PLP On-Page Content Structure",
-        "PDP": "PDP Content Enhancement Structure"
-    }
-    
-    cluster_name_map = {
-        "BLOG_POST": "Cluster Content Ideas (Supporting Articles)",
-        "LANDING_PAGE": "Supporting Assets (e.g., Case Studies, Webinars)",
-        "PLP": "Supporting Content to Link from PLP",
-        "PDP": "Supporting Content to build trust (e.g., a detailed review)"
-    }
-    
-    # Seleziona la personalizzazione corretta, con un default sicuro
-    persona = persona_map.get(destination_code, persona_map["BLOG_POST"])
-    structure_name = structure_name_map.get(destination_code, "Core Content Structure")
-    cluster_name = cluster_name_map.get(destination_code, "Supporting Content Ideas")
-    
-    brand_instruction = "IMPORTANT CONSTRAINT: Do NOT mention any commercial brands." if exclude_brands else "You can mention relevant brand names."
-    industry_context = f"The user is in the '{industry}' sector. All recommendations must be tailored to this context." if industry else ""
-
-    # Costruzione del prompt finale
-    return (
-        f"{persona}\n\n"
-        f"**User Query/Topic:** \"{query}\"\n"
-        f"**Content Destination:** \"{selected_destination_name}\"\n"
-        f"{industry_context}\n{brand_instruction}\n\n"
-        f"**Your Task:** Generate a complete strategic blueprint in a valid JSON format ONLY. Do not include any text before or after the JSON object. The blueprint must have three main keys, adapting their content to the chosen destination:\n\n"
-        f"1.  **`core_content_structure`**: Outline the sections of the main content. The title of this section in your output should be '{structure_name}'. Each item must have `section_title` and `content_to_include`.\n"
-        f"2.  **`supporting_content_ideas`**: Propose 2-4 supporting assets. The title of this section should be '{cluster_name}'. Each item must have `asset_title` and `strategic_goal`.\n"
-        f"3.  **`technical_and_ecommerce_recommendations`**: Provide 2-4 actionable recommendations for the website. Each item must have `recommendation_type` and `actionable_step`.\n\n"
-        f"**JSON Format:**\n"
-        "{\n"
-        f"  \"strategic_blueprint\": {{\n"
-        f"    \"{structure_name}\": [\n"
-        "      { \"section_title\": \"...\", \"content_to_include\": \"...\" }\n"
-        "    ],\n"
-        f"    \"{cluster_name}\": [\n"
-        "      { \"asset_title\": \"...\", \"strategic_goal\": \"...\" }\n"
-        "    ],\n"
-        f"    \"Technical and E-commerce Recommendations\": [\n"
-        "      { \"recommendation_type\": \"...\", \"actionable_step\": \"...\" }\n"
-        "    ]\n"
-        "  }\n"
-        "}"
-    )
+# --- 3. GENERAZIONE DEL BLUEPRINT ---
 
 @st.cache_data(show_spinner=False)
 def generate_fanout_cached(query, industry, exclude_brands, destination_code):
-    prompt = get_strategic_prompt(destination_code, query, industry, exclude_brands)
-    raw_response_text = ""
     try:
-        model = genai.GenerativeModel("gemini-2.5-pro")
-        response = model.generate_content(prompt, generation_config=genai.types.GenerationConfig(temperature=0.7))
-        raw_response_text = response.text
-        
-        json_text = raw_response_text.strip().replace('```json', '').replace('```', '')
-        json_text = re.sub(r'}\s*,?\s*{', '},{', json_text)
-        
-        data = json.loads(json_text)
-        return data, getattr(response, 'usage_metadata', None)
-        
+        return generate_blueprint(query, industry, exclude_brands, destination_code)
+    except BlueprintError as e:
+        st.error(f"🔴 Errore durante l'analisi della risposta: {e}")
+        st.expander("🔍 Visualizza Risposta Grezza").text(e.raw_text)
+        return None, None
     except Exception as e:
         st.error(f"🔴 Errore durante l'analisi della risposta: {e}")
-        st.expander("🔍 Visualizza Risposta Grezza").text(raw_response_text)
         return None, None
 
 # --- 4. ESECUZIONE E VISUALIZZAZIONE ---
 
-if st.sidebar.button("🚀 Avvia Analisi GEO", type="primary"):
+def render_batch_mode():
+    """Interfaccia della modalità batch: lista di query x destinazioni con concorrenza e ripresa."""
+    st.markdown("### 📦 Generazione Batch")
+    queries_raw = st.text_area("Query o prodotti (una per riga)", height=200, placeholder="vestiti eleganti donna\nscarpe running uomo")
+    selected_destinations = st.multiselect(
+        "Destinazioni",
+        options=list(destination_map.keys()),
+        default=[selected_destination_name]
+    )
+    col_conc, col_rpm = st.columns(2)
+    max_concurrency = col_conc.number_input(
+        "Chiamate in parallelo", min_value=1, max_value=64,
+        value=get_setting("fanout_concurrency", 4),
+        help="Limite di concorrenza verso Gemini: aumentalo fino alla quota della tua API."
+    )
+    requests_per_minute = col_rpm.number_input(
+        "Richieste al minuto", min_value=1, max_value=2000,
+        value=get_setting("fanout_rpm", 60)
+    )
+
+    queries = list(dict.fromkeys(q.strip() for q in queries_raw.splitlines() if q.strip()))
+    jobs = [{"query": q, "destination": destination_map[d]} for q in queries for d in selected_destinations]
+    if not jobs:
+        st.info("Inserisci almeno una query e una destinazione.")
+        return
+
+    output_path = data_path("fanout_batches", f"{batch_id(jobs, user_industry, exclude_brands)}.jsonl")
+    already_done = sum(1 for r in read_results(output_path) if r.get("status") == "ok")
+    st.caption(f"{len(jobs)} job ({len(queries)} query × {len(selected_destinations)} destinazioni). "
+               f"Già completati in una sessione precedente: {already_done}.")
+
+    if st.button("🚀 Avvia Batch", type="primary"):
+        prog = st.progress(0)
+        status = st.empty()
+
+        def on_result(done, total, record):
+            prog.progress(int(done / total * 100))
+            icon = "✅" if record["status"] == "ok" else "🔴"
+            status.write(f"{icon} {done}/{total} · {record['query']} → {record['destination_name']}")
+
+        summary = run_batch(
+            jobs, output_path, industry=user_industry, exclude_brands=exclude_brands,
+            max_concurrency=max_concurrency, requests_per_minute=requests_per_minute, on_result=on_result
+        )
+        prog.progress(100)
+        st.success(f"Batch completato: {summary['ok']} generati, {summary['skipped']} ripresi, {summary['errors']} errori.")
+        if summary["errors"]:
+            st.warning("I job in errore verranno ritentati rilanciando lo stesso batch.")
+
+    if output_path.exists():
+        col_jsonl, col_xlsx = st.columns(2)
+        col_jsonl.download_button(
+            "📥 Download JSONL", data=output_path.read_bytes(),
+            file_name="fanout_batch.jsonl", mime="application/json"
+        )
+        col_xlsx.download_button(
+            "📥 Download XLSX", data=results_to_xlsx(output_path),
+            file_name="fanout_batch.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+if batch_mode:
+    render_batch_mode()
+
+elif st.sidebar.button("🚀 Avvia Analisi GEO", type="primary"):
     with st.spinner(f"Caricamento modello linguistico ({selected_language_name})..."):
         nlp = load_spacy_model(selected_model)
 
@@ -0,0 +1,224 @@
+import base64
+import hashlib
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from requests import ConnectionError as RequestsConnectionError, Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from pages.common.settings import DATA_DIR, get_setting
+
+# Registrazione e riproduzione ("cassette") delle chiamate esterne, per eseguire le
+# pagine e il benchmark senza rete né credenziali.
+#   replay_mode = "off"     chiamate reali (default)
+#   replay_mode = "record"  chiamate reali, risposte salvate in CASSETTE_DIR
+#   replay_mode = "replay"  nessuna chiamata reale: risposte lette da CASSETTE_DIR
+# replay_latency = "recorded" riproduce la durata registrata (moltiplicata per
+# replay_latency_scale), un numero impone una latenza fissa in secondi.
+REPLAY_MODE = get_setting("replay_mode", "off")
+CASSETTE_DIR = Path(get_setting("cassette_dir", str(DATA_DIR / "cassettes")))
+REPLAY_LATENCY = get_setting("replay_latency", "recorded")
+REPLAY_LATENCY_SCALE = get_setting("replay_latency_scale", 1.0)
+
+
+class CassetteMiss(RequestsConnectionError):
+    """
+    In modalità replay non esiste una registrazione per questa richiesta. È un
+    errore di connessione di requests, così i chiamanti lo gestiscono come la rete assente.
+    """
+
+
+def enabled() -> bool:
+    return REPLAY_MODE in ("record", "replay")
+
+
+def replaying() -> bool:
+    return REPLAY_MODE == "replay"
+
+
+def _key(*parts) -> str:
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _path(kind: str, key: str) -> Path:
+    return CASSETTE_DIR / kind / f"{key}.json"
+
+
+def _save(kind: str, key: str, record: dict) -> None:
+    path = _path(kind, key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(record, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _load(kind: str, key: str, description: str) -> dict:
+    try:
+        return json.loads(_path(kind, key).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        raise CassetteMiss(f"Nessuna registrazione {kind} per {description} (chiave {key})") from None
+
+
+def simulated_latency(recorded: float) -> float:
+    if REPLAY_LATENCY == "recorded":
+        return max(0.0, recorded * REPLAY_LATENCY_SCALE)
+    try:
+        return max(0.0, float(REPLAY_LATENCY))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# --- HTTP (requests) ---
+
+def _canonical_body(body) -> str:
+    if body is None:
+        return ""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        return body
+
+
+class CassetteAdapter(HTTPAdapter):
+    """Transport adapter di requests che registra o riproduce le risposte."""
+
+    def send(self, request, **kwargs):
+        key = _key(request.method, request.url, _canonical_body(request.body))
+        if replaying():
+            record = _load("http", key, f"{request.method} {request.url}")
+            time.sleep(simulated_latency(record["elapsed"]))
+            return self._build_response(request, record)
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        content = response.content  # legge il corpo anche con stream=True
+        _save("http", key, {
+            "method": request.method,
+            "url": request.url,
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "body_b64": base64.b64encode(content).decode("ascii"),
+            "elapsed": time.monotonic() - started,
+        })
+        return response
+
+    def _build_response(self, request, record: dict) -> Response:
+        response = Response()
+        response.status_code = record["status_code"]
+        # Il corpo è salvato già decompresso
+        headers = {k: v for k, v in record["headers"].items() if k.lower() not in ("content-encoding", "transfer-encoding")}
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = base64.b64decode(record["body_b64"])
+        response._content_consumed = True  # iter_content e close funzionano anche con stream=True
+        response.url = record["url"]
+        response.request = request
+        response.reason = "Replay"
+        response.connection = self
+        return response
+
+
+def install(session) -> None:
+    """Monta l'adapter di registrazione/riproduzione su una requests.Session (se attivo)."""
+    if enabled():
+        adapter = CassetteAdapter()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+
+# --- Gemini (google-generativeai) ---
+
+def _usage_to_namespace(usage: dict | None):
+    return SimpleNamespace(**usage) if usage else None
+
+
+class ReplayResponse:
+    """Risposta Gemini riprodotta: espone text, parts, usage_metadata e l'iterazione sui chunk."""
+
+    def __init__(self, record: dict, latency: float):
+        self._chunks = record["chunks"]
+        self._latency = latency
+        self.usage_metadata = _usage_to_namespace(record.get("usage"))
+        self.text = "".join(self._chunks)
+        self.parts = [self.text] if self.text else []
+
+    def __iter__(self):
+        step = self._latency / max(len(self._chunks), 1)
+        for chunk in self._chunks:
+            time.sleep(step)
+            yield SimpleNamespace(text=chunk)
+
+
+def _usage_dict(usage) -> dict | None:
+    if usage is None:
+        return None
+    return {
+        name: getattr(usage, name, None)
+        for name in ("prompt_token_count", "candidates_token_count", "thoughts_token_count", "total_token_count")
+    }
+
+
+def _config_repr(generation_config) -> str:
+    if generation_config is None:
+        return ""
+    return json.dumps({k: str(v) for k, v in sorted(vars(generation_config).items())}, ensure_ascii=False) \
+        if hasattr(generation_config, "__dict__") else str(generation_config)
+
+
+class _RecordingStream:
+    """Inoltra i chunk dello stream reale salvandoli, e registra a stream concluso."""
+
+    def __init__(self, response, key: str, started: float):
+        self._response = response
+        self._key = key
+        self._started = started
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __iter__(self):
+        chunks = []
+        for chunk in self._response:
+            try:
+                chunks.append(chunk.text)
+            except ValueError:
+                pass
+            yield chunk
+        _save("gemini", self._key, {
+            "chunks": chunks,
+            "usage": _usage_dict(getattr(self._response, "usage_metadata", None)),
+            "elapsed": time.monotonic() - self._started,
+        })
+
+
+def generate_content(model, model_name: str, prompt: str, generation_config=None, stream: bool = False):
+    """
+    Equivalente di model.generate_content(prompt, ...) che, se la modalità cassette
+    è attiva, registra o riproduce la risposta (chiave: modello, prompt, config, stream).
+    """
+    kwargs = {"generation_config": generation_config} if generation_config is not None else {}
+    if not enabled():
+        return model.generate_content(prompt, stream=stream, **kwargs)
+    key = _key(model_name, prompt, _config_repr(generation_config), stream)
+    if replaying():
+        record = _load("gemini", key, f"{model_name} ({len(prompt)} caratteri di prompt)")
+        latency = simulated_latency(record["elapsed"])
+        if not stream:
+            time.sleep(latency)
+        return ReplayResponse(record, latency)
+    started = time.monotonic()
+    response = model.generate_content(prompt, stream=stream, **kwargs)
+    if stream:
+        return _RecordingStream(response, key, started)
+    try:
+        chunks = [response.text] if response.parts else []
+    except ValueError:
+        chunks = []
+    _save("gemini", key, {"chunks": chunks, "usage": _usage_dict(response.usage_metadata), "elapsed": time.monotonic() - started})
+    return response
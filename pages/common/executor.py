@@ -0,0 +1,173 @@
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pages.common.settings import get_setting
+from pages.common.tracing import bind
+
+# Executor condiviso per le chiamate di I/O verso i servizi esterni. Ogni "upstream"
+# (dataforseo, gemini, web) ha un limite di concorrenza adattivo AIMD: cresce di
+# circa 1 ogni `limite` chiamate riuscite e si riduce (x0.7) quando la latenza supera
+# il target o arrivano errori/429/5xx. I task oltre il limite restano in una coda
+# per upstream, senza occupare thread del pool.
+
+MAX_WORKERS = get_setting("executor_max_workers", 64)
+
+# upstream -> (concorrenza iniziale, massima, latenza target in secondi)
+UPSTREAM_DEFAULTS = {
+    "dataforseo": (10, 40, 30.0),
+    "gemini": (8, 16, 60.0),
+    "web": (10, 30, 5.0),
+}
+MIN_CONCURRENCY = 2
+DECREASE_FACTOR = 0.7
+
+# I worker dei job (pages/common/jobs.py) sono processi separati, ciascuno col proprio
+# executor: all'avvio dichiarano quanti sono con set_process_share e si dividono i
+# limiti iniziali e massimi, così la concorrenza totale verso un upstream resta quella
+# configurata. Il processo Streamlit, che esegue solo le chiamate interattive delle
+# pagine, mantiene i limiti interi.
+_process_share = 1
+
+_task_status: contextvars.ContextVar[dict | None] = contextvars.ContextVar("executor_task_status", default=None)
+
+
+def report_http_status(status_code: int) -> None:
+    """Segnala al limitatore del task corrente una risposta di throttling o errore del server."""
+    status = _task_status.get()
+    if status is not None and (status_code == 429 or status_code >= 500):
+        status["error"] = True
+
+
+def set_process_share(processes: int) -> None:
+    """Divide i limiti degli upstream tra `processes` processi worker (da chiamare prima del primo submit)."""
+    global _process_share
+    _process_share = max(1, int(processes))
+
+
+class AdaptiveLimit:
+    """Stato AIMD di un upstream (da usare sotto il lock dell'executor)."""
+
+    def __init__(self, name: str, initial: int, maximum: int, target_latency: float):
+        self.name = name
+        self.maximum = max(maximum, MIN_CONCURRENCY)
+        self.limit = float(min(max(initial, MIN_CONCURRENCY), self.maximum))
+        self.target_latency = target_latency
+        self.queue: deque = deque()
+        self.in_flight = 0
+        self.completed = 0
+        self.errors = 0
+        self.latency_ewma: float | None = None
+        self._last_decrease = 0.0
+
+    def on_result(self, latency: float, ok: bool) -> None:
+        self.completed += 1
+        self.errors += 0 if ok else 1
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        now = time.monotonic()
+        if not ok or latency > self.target_latency:
+            # Una sola riduzione per "ondata" di risposte lente o errori
+            if now - self._last_decrease > min(self.latency_ewma, self.target_latency):
+                self.limit = max(MIN_CONCURRENCY, self.limit * DECREASE_FACTOR)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def stats(self) -> dict:
+        return {
+            "upstream": self.name,
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": len(self.queue),
+            "utilization": round(self.in_flight / int(self.limit), 2),
+            "completed": self.completed,
+            "errors": self.errors,
+            "latency_ms": round(self.latency_ewma * 1000) if self.latency_ewma is not None else None,
+        }
+
+
+class ExecutorService:
+    """Pool di thread condiviso dal processo, con una coda e un limite adattivo per upstream."""
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="annalect-io")
+        self._lock = threading.Lock()
+        self._upstreams: dict[str, AdaptiveLimit] = {}
+
+    def _upstream(self, name: str) -> AdaptiveLimit:
+        if name not in self._upstreams:
+            initial, maximum, target = UPSTREAM_DEFAULTS.get(name, (10, 20, 30.0))
+            self._upstreams[name] = AdaptiveLimit(
+                name,
+                math.ceil(get_setting(f"{name}_concurrency", initial) / _process_share),
+                math.ceil(get_setting(f"{name}_max_concurrency", maximum) / _process_share),
+                get_setting(f"{name}_target_latency", target),
+            )
+        return self._upstreams[name]
+
+    def submit(self, upstream: str, fn, *args, **kwargs) -> Future:
+        """Accoda fn(*args, **kwargs) sull'upstream indicato; run e span correnti sono propagati."""
+        future = Future()
+        status = {"error": False}
+
+        def call():
+            # Eseguita nel contesto copiato da bind: lo stato è visibile a report_http_status
+            _task_status.set(status)
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            up = self._upstream(upstream)
+            up.queue.append((bind(call), status, future))
+            self._drain(up)
+        return future
+
+    def map(self, upstream: str, fn, *iterables) -> list[Future]:
+        return [self.submit(upstream, fn, *args) for args in zip(*iterables)]
+
+    def _drain(self, up: AdaptiveLimit) -> None:
+        while up.queue and up.in_flight < int(up.limit):
+            task = up.queue.popleft()
+            up.in_flight += 1
+            self._pool.submit(self._run, up, task)
+
+    def _run(self, up: AdaptiveLimit, task) -> None:
+        call, status, future = task
+        ok, started = True, time.monotonic()
+        ran = future.set_running_or_notify_cancel()
+        try:
+            if ran:
+                try:
+                    result = call()
+                except BaseException as e:
+                    ok = False
+                    future.set_exception(e)
+                else:
+                    ok = not status["error"]
+                    future.set_result(result)
+        finally:
+            with self._lock:
+                up.in_flight -= 1
+                if ran:
+                    up.on_result(time.monotonic() - started, ok)
+                self._drain(up)
+
+    def stats(self) -> list[dict]:
+        """Limite, task in corso e in coda, utilizzo e latenza media per upstream."""
+        with self._lock:
+            return [up.stats() for up in self._upstreams.values()]
+
+
+_service: ExecutorService | None = None
+_service_lock = threading.Lock()
+
+
+def get_executor() -> ExecutorService:
+    """Executor condiviso del processo (creato alla prima richiesta)."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ExecutorService()
+        return _service
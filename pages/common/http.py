@@ -0,0 +1,32 @@
+from urllib.parse import urlparse
+
+import requests
+
+from pages.common import cassette
+from pages.common.executor import report_http_status
+from pages.common.metering import mark_call
+from pages.common.tracing import span
+
+
+class TracedSession(requests.Session):
+    """
+    requests.Session che registra uno span per ogni richiesta (endpoint, stato,
+    dimensione della risposta), così le chiamate DataForSEO lente sono visibili
+    nel pannello prestazioni senza modificare i singoli punti di chiamata.
+    Con replay_mode="record"/"replay" le risposte passano dalle cassette locali.
+    """
+
+    def __init__(self):
+        super().__init__()
+        cassette.install(self)
+
+    def request(self, method, url, *args, **kwargs):
+        mark_call()
+        parsed = urlparse(url)
+        with span(f"{method} {parsed.netloc}{parsed.path}", kind="http", method=method, url=url) as s:
+            response = super().request(method, url, *args, **kwargs)
+            # Con stream=True il corpo non va letto qui: lo consuma il chiamante
+            size = response.headers.get("Content-Length") if kwargs.get("stream") else len(response.content)
+            s.set(status_code=response.status_code, response_bytes=size)
+            report_http_status(response.status_code)
+            return response
@@ -0,0 +1,291 @@
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import zlib
+from contextlib import closing
+from pathlib import Path
+
+from pages.common import executor, metering, tracing
+from pages.common.settings import data_path, get_setting
+
+# Coda di job locale su SQLite, eseguita da processi worker separati dallo script
+# Streamlit: le pagine inviano un job e ne leggono stato e risultato a ogni rerun,
+# così un'analisi lunga sopravvive a rerun, cambi di widget e tab chiuse.
+# I job con gli stessi parametri sono deduplicati: più sessioni che chiedono la
+# stessa cosa condividono un'unica esecuzione.
+DB_PATH = data_path("jobs.sqlite3")
+
+NUM_WORKERS = get_setting("job_workers", 2)
+# Un job "running" senza heartbeat da più di così è considerato orfano e rimesso in coda
+STALE_AFTER_SECONDS = get_setting("job_stale_seconds", 600)
+# Ogni quanto il worker rinnova l'heartbeat di un job in corso, anche se il job non
+# chiama progress(): deve restare ben sotto STALE_AFTER_SECONDS
+HEARTBEAT_SECONDS = get_setting("job_heartbeat_seconds", 30)
+# Per quanto tempo un job completato viene riusato per richieste identiche
+RESULT_TTL_SECONDS = get_setting("job_result_ttl", 3600)
+POLL_INTERVAL = 0.5
+# Ogni quanto le pagine rileggono lo stato di un job in corso
+PAGE_POLL_SECONDS = get_setting("job_poll_seconds", 1.0)
+
+# Tipo di job -> funzione "modulo:funzione", importata solo nel worker.
+# La funzione riceve (params: dict, progress: Callable[[int, int, str], None]) e
+# restituisce un risultato serializzabile in JSON; progress va chiamata dal thread del job.
+HANDLERS = {
+    "seo_extract": "pages.extractor.extract:run_extract_job",
+    "seo_extract_sitemap": "pages.extractor.sitemap:run_sitemap_job",
+    "seo_crawl": "pages.extractor.crawler:run_crawl_job",
+    "rankboost_collect": "pages.rankboost.dataforseo:run_collect_job",
+    "serp_cluster": "pages.rankboost.serp_clusters:run_serp_cluster_job",
+}
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    job_key TEXT NOT NULL UNIQUE,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress_done INTEGER NOT NULL DEFAULT 0,
+    progress_total INTEGER NOT NULL DEFAULT 0,
+    progress_message TEXT,
+    result BLOB,
+    error TEXT,
+    session_id TEXT,
+    user TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL,
+    worker_pid INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+"""
+
+
+def _connect(db_path: Path = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def job_key(kind: str, params: dict) -> str:
+    """Hash stabile di tipo e parametri, usato per la deduplicazione."""
+    raw = json.dumps([kind, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def submit(kind: str, params: dict, session_id: str | None = None, user: str | None = None,
+           db_path: Path = None) -> int:
+    """
+    Accoda un job e ne restituisce l'ID. Se esiste già un job identico in coda, in
+    esecuzione o completato da meno di RESULT_TTL_SECONDS, restituisce quello.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Tipo di job sconosciuto: {kind}")
+    key = job_key(kind, params)
+    now = time.time()
+    with closing(_connect(db_path)) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id, status, finished_at FROM jobs WHERE job_key = ?", (key,)).fetchone()
+            if row and (row["status"] in (QUEUED, RUNNING)
+                        or (row["status"] == DONE and now - row["finished_at"] < RESULT_TTL_SECONDS)):
+                conn.execute("COMMIT")
+                return row["id"]
+            if row:
+                # Job fallito o risultato scaduto: si riaccoda la stessa riga
+                conn.execute(
+                    "UPDATE jobs SET status = ?, result = NULL, error = NULL, progress_done = 0, progress_total = 0, "
+                    "progress_message = NULL, session_id = ?, user = ?, created_at = ?, started_at = NULL, "
+                    "finished_at = NULL, heartbeat_at = NULL, worker_pid = NULL WHERE id = ?",
+                    (QUEUED, session_id, user, now, row["id"]),
+                )
+                job_id = row["id"]
+            else:
+                cur = conn.execute(
+                    "INSERT INTO jobs (kind, job_key, params, status, session_id, user, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (kind, key, json.dumps(params, ensure_ascii=False, default=str), QUEUED, session_id, user, now),
+                )
+                job_id = cur.lastrowid
+            conn.execute("COMMIT")
+            return job_id
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def get_job(job_id: int, with_result: bool = True, db_path: Path = None) -> dict | None:
+    """Stato di un job (e, se completato e richiesto, il risultato decodificato)."""
+    with closing(_connect(db_path)) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = {k: row[k] for k in row.keys() if k != "result"}
+    job["params"] = json.loads(row["params"])
+    payload = json.loads(zlib.decompress(row["result"])) if with_result and row["result"] else {}
+    job["result"] = payload.get("result")
+    job["spans"] = payload.get("spans", [])
+    return job
+
+
+def queue_depth(db_path: Path = None) -> dict:
+    """Numero di job per stato (per diagnostica)."""
+    with closing(_connect(db_path)) as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+# --- Lato worker ---
+
+def _claim(conn: sqlite3.Connection) -> sqlite3.Row | None:
+    """Prende in carico il prossimo job in coda (o un job orfano) in modo atomico."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? OR (status = ? AND heartbeat_at < ?) ORDER BY id LIMIT 1",
+            (QUEUED, RUNNING, now - STALE_AFTER_SECONDS),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ?, worker_pid = ? WHERE id = ?",
+                (RUNNING, now, now, os.getpid(), row["id"]),
+            )
+        conn.execute("COMMIT")
+        return row
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _resolve(kind: str):
+    module_name, func_name = HANDLERS[kind].split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _heartbeat(job_id: int, stop: threading.Event, db_path: Path = None) -> None:
+    """Rinnova heartbeat_at finché il job è in corso su questo worker (connessione propria)."""
+    with closing(_connect(db_path)) as conn:
+        while not stop.wait(HEARTBEAT_SECONDS):
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ? AND worker_pid = ?",
+                (time.time(), job_id, RUNNING, os.getpid()),
+            )
+
+
+def _run_one(conn: sqlite3.Connection, row: sqlite3.Row, db_path: Path = None) -> None:
+    job_id = row["id"]
+
+    def progress(done: int, total: int, message: str = "") -> None:
+        conn.execute(
+            "UPDATE jobs SET progress_done = ?, progress_total = ?, progress_message = ?, heartbeat_at = ? WHERE id = ?",
+            (done, total, message, time.time(), job_id),
+        )
+
+    # Costi e tracing del job attribuiti alla sessione che lo ha inviato
+    metering.set_context(row["session_id"], row["user"])
+    run_id = tracing.new_run_id()
+    tracing.set_run(run_id)
+    # Un job lungo che non segnala progressi (una singola chiamata lenta) non deve
+    # sembrare orfano ed essere ripreso da un altro worker mentre è ancora in corso
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, stop, db_path), daemon=True,
+                     name=f"annalect-job-heartbeat-{job_id}").start()
+    try:
+        result = _resolve(row["kind"])(json.loads(row["params"]), progress)
+        # Gli span del worker viaggiano col risultato, per il pannello prestazioni della pagina
+        payload = {"result": result, "spans": tracing.get_spans(run_id)}
+        payload = zlib.compress(json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"), 6)
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, finished_at = ?, heartbeat_at = ? WHERE id = ?",
+            (DONE, payload, time.time(), time.time(), job_id),
+        )
+    except Exception as e:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (FAILED, f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}", time.time(), job_id),
+        )
+    finally:
+        stop.set()
+
+
+def worker_loop(db_path: str | None = None, workers: int = 1) -> None:
+    """
+    Ciclo di un processo worker: prende un job alla volta finché il processo vive.
+    `workers` è il numero di processi worker, che si dividono i limiti dell'executor.
+    """
+    executor.set_process_share(workers)
+    db_path = Path(db_path) if db_path else None
+    with closing(_connect(db_path)) as conn:
+        while True:
+            row = _claim(conn)
+            if row is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+            _run_one(conn, row, db_path)
+
+
+class WorkerPool:
+    """Processi worker (spawn) avviati dal server Streamlit e riavviati se terminano."""
+
+    def __init__(self, size: int = NUM_WORKERS):
+        self.size = size
+        self._ctx = multiprocessing.get_context("spawn")
+        self._processes: list = []
+
+    def ensure_running(self) -> None:
+        self._processes = [p for p in self._processes if p.is_alive()]
+        while len(self._processes) < self.size:
+            p = self._ctx.Process(target=worker_loop, args=(str(DB_PATH), self.size), daemon=True, name="annalect-job-worker")
+            p.start()
+            self._processes.append(p)
+
+    def alive(self) -> int:
+        return sum(1 for p in self._processes if p.is_alive())
+
+
+# Un solo pool per processo server (come get_executor): il modulo non dipende da
+# streamlit e si importa anche nei worker e nei test
+_pool: WorkerPool | None = None
+_pool_lock = threading.Lock()
+
+
+def _worker_pool() -> WorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(NUM_WORKERS)
+        return _pool
+
+
+def ensure_workers() -> WorkerPool | None:
+    """
+    Avvia (una sola volta per server) il pool di worker e riavvia quelli terminati.
+    Con job_workers=0 i worker vanno avviati a parte con `python -m pages.common.jobs`.
+    """
+    if NUM_WORKERS <= 0:
+        return None
+    pool = _worker_pool()
+    pool.ensure_running()
+    return pool
+
+
+if __name__ == "__main__":
+    # Worker esterni al server Streamlit: python -m pages.common.jobs [numero_processi]
+    import sys
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else max(NUM_WORKERS, 1)
+    processes = [multiprocessing.get_context("spawn").Process(target=worker_loop, args=(None, size)) for _ in range(size)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
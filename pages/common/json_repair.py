@@ -0,0 +1,310 @@
+import json
+import re
+
+# Numero JSON valido (usato per normalizzare numeri troncati o malformati)
+_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_LITERALS = {"true": "true", "false": "false", "null": "null",
+             "True": "true", "False": "false", "None": "null",
+             "NaN": "null", "nan": "null", "undefined": "null"}
+_ESCAPES = set('"\\/bfnrtu')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+
+# Stati di un contenitore aperto
+_EXPECT_KEY, _EXPECT_COLON, _EXPECT_VALUE, _AFTER_VALUE = "key", "colon", "value", "after_value"
+
+
+class _Frame:
+    __slots__ = ("kind", "state", "key_index")
+
+    def __init__(self, kind: str):
+        self.kind = kind  # "{" oppure "["
+        self.state = _EXPECT_KEY if kind == "{" else _EXPECT_VALUE
+        self.key_index = 0  # posizione in out dove inizia la coppia chiave/valore corrente
+
+
+class StreamingJsonParser:
+    """
+    Parser JSON tollerante e incrementale, pensato per le risposte degli LLM.
+    Riceve il testo a pezzi con feed() e mantiene in un'unica passata un JSON
+    "riparato": ignora il testo prima/dopo il valore (code fence, commenti) e i
+    commenti // e /* */ tra i token, aggiunge le virgole mancanti, rimuove quelle in eccesso, accetta apici singoli,
+    chiavi non quotate e letterali Python, esegue l'escape dei caratteri di
+    controllo nelle stringhe. value() restituisce in ogni momento l'oggetto
+    parziale ricostruibile dal testo ricevuto finora (chiudendo stringhe e
+    contenitori rimasti aperti e scartando le chiavi senza valore).
+    """
+
+    def __init__(self):
+        self._out: list[str] = []
+        self._stack: list[_Frame] = []
+        self._started = False
+        self._done = False
+        self._mode = None          # None | "string" | "number" | "word" | "comment"
+        self._buf: list[str] = []  # token in corso (stringa, numero o parola)
+        self._quote = '"'
+        self._escape = False
+        self._is_key = False
+        self._pending_quote = False  # virgolette di chiusura in attesa di conferma
+        self._pending_len = 0
+        self._comment = ""  # "/" appena letto, "//" o "/*" in corso ("/**" dopo un "*")
+
+    # --- API pubblica ---
+
+    def feed(self, chunk: str) -> None:
+        for c in chunk:
+            if self._done:
+                return
+            self._consume(c)
+
+    def text(self) -> str:
+        """Restituisce il JSON riparato corrispondente al testo ricevuto finora."""
+        if not self._started:
+            return ""
+        parser = self._clone()
+        parser._flush_token()
+        while parser._stack:
+            parser._close_frame()
+        return "".join(parser._out)
+
+    def value(self):
+        """Restituisce il valore (anche parziale) ricostruito, oppure None."""
+        text = self.text()
+        if not text:
+            return None
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
+
+    @property
+    def complete(self) -> bool:
+        """True se il valore JSON di primo livello è stato chiuso."""
+        return self._done
+
+    def _clone(self) -> "StreamingJsonParser":
+        clone = StreamingJsonParser.__new__(StreamingJsonParser)
+        clone.__dict__.update(self.__dict__)
+        clone._out = list(self._out)
+        clone._buf = list(self._buf)
+        clone._stack = []
+        for frame in self._stack:
+            copy = _Frame(frame.kind)
+            copy.state, copy.key_index = frame.state, frame.key_index
+            clone._stack.append(copy)
+        return clone
+
+    def _flush_token(self) -> None:
+        """Chiude il token rimasto a metà alla fine del testo ricevuto."""
+        if self._mode == "string":
+            body = self._buf[:self._pending_len] if self._pending_quote else self._buf
+            self._pending_quote = False
+            if self._is_key:
+                self._mode = None  # chiave troncata: la coppia viene scartata
+            else:
+                self._end_string("".join(body))
+        elif self._mode == "number":
+            self._emit_value(self._finish_number("".join(self._buf)))
+        elif self._mode == "word":
+            word = "".join(self._buf)
+            if self._is_key:
+                self._mode = None
+            else:
+                completed = next((lit for lit in ("true", "false", "null") if lit.startswith(word)), None)
+                self._emit_value(completed or self._finish_word(word))
+
+    # --- Scanner ---
+
+    def _consume(self, c: str) -> None:
+        if self._mode == "string":
+            self._consume_string(c)
+            return
+        if self._mode == "comment":
+            self._consume_comment(c)
+            return
+        if self._mode == "number":
+            if c in "0123456789+-.eE":
+                self._buf.append(c)
+                return
+            self._emit_value(self._finish_number("".join(self._buf)))
+        elif self._mode == "word":
+            if c.isalnum() or c in "_-":
+                self._buf.append(c)
+                return
+            word = "".join(self._buf)
+            if self._is_key:
+                self._emit_key('"' + word + '"')
+            else:
+                self._emit_value(self._finish_word(word))
+        self._consume_default(c)
+
+    def _consume_default(self, c: str) -> None:
+        if not self._started:
+            if c not in "{[":
+                return
+            self._started = True
+
+        if c.isspace():
+            return
+        frame = self._stack[-1] if self._stack else None
+
+        if c in "{[":
+            self._before_value()
+            self._out.append(c)
+            self._stack.append(_Frame(c))
+        elif c in "}]":
+            if frame is None:
+                return
+            self._close_frame()
+        elif c == ",":
+            if frame is not None and frame.state == _AFTER_VALUE:
+                self._out.append(",")
+                frame.state = _EXPECT_KEY if frame.kind == "{" else _EXPECT_VALUE
+        elif c == ":":
+            if frame is not None and frame.kind == "{" and frame.state == _EXPECT_COLON:
+                self._out.append(":")
+                frame.state = _EXPECT_VALUE
+        elif c in "\"'":
+            self._mode, self._quote, self._buf, self._escape = "string", c, [], False
+            self._is_key = self._starts_key()
+        elif c.isdigit() or c == "-":
+            self._mode, self._buf = "number", [c]
+            self._is_key = False
+        elif c.isalpha() or c == "_":
+            self._mode, self._buf = "word", [c]
+            self._is_key = self._starts_key()
+        elif c == "/":
+            self._mode, self._comment = "comment", "/"
+
+    def _consume_comment(self, c: str) -> None:
+        if self._comment == "/":
+            if c in "/*":
+                self._comment += c
+                return
+            # "/" isolato, non seguito da "/" o "*": viene ignorato
+            self._mode = None
+            self._consume(c)
+        elif self._comment == "//":
+            if c == "\n":
+                self._mode = None
+        elif self._comment == "/**" and c == "/":
+            self._mode = None
+        else:
+            self._comment = "/**" if c == "*" else "/*"
+
+    def _consume_string(self, c: str) -> None:
+        if self._pending_quote:
+            if c.isspace():
+                self._buf.append(self._escape_char(c))
+                return
+            self._pending_quote = False
+            if c in ',}]:"{[/':
+                # Le virgolette erano davvero di chiusura (anche se seguite da un commento)
+                self._end_string("".join(self._buf[:self._pending_len]))
+                self._consume(c)
+                return
+            # Virgolette interne non escapate: diventano parte della stringa
+            self._buf.insert(self._pending_len, '\\"' if self._quote == '"' else "'")
+
+        if self._escape:
+            self._escape = False
+            if c in _ESCAPES:
+                self._buf.append("\\" + c)
+            elif c == "'":
+                self._buf.append("'")
+            else:
+                self._buf.append("\\\\" + self._escape_char(c))
+            return
+        if c == "\\":
+            self._escape = True
+        elif c == self._quote:
+            self._pending_quote = True
+            self._pending_len = len(self._buf)
+        elif c == '"':
+            self._buf.append('\\"')
+        else:
+            self._buf.append(self._escape_char(c))
+
+    @staticmethod
+    def _escape_char(c: str) -> str:
+        if c in _CONTROL_ESCAPES:
+            return _CONTROL_ESCAPES[c]
+        if ord(c) < 0x20:
+            return f"\\u{ord(c):04x}"
+        return c
+
+    def _end_string(self, body: str) -> None:
+        self._mode = None
+        token = '"' + body + '"'
+        if self._is_key:
+            self._emit_key(token)
+        else:
+            self._emit_value(token)
+
+    # --- Gestione della struttura ---
+
+    def _starts_key(self) -> bool:
+        frame = self._stack[-1] if self._stack else None
+        return frame is not None and frame.kind == "{" and frame.state in (_EXPECT_KEY, _AFTER_VALUE)
+
+    def _before_value(self) -> None:
+        frame = self._stack[-1] if self._stack else None
+        if frame is None:
+            return
+        if frame.state == _AFTER_VALUE:
+            # virgola mancante tra due valori, es. "}{" oppure "} {"
+            self._out.append(",")
+            frame.state = _EXPECT_KEY if frame.kind == "{" else _EXPECT_VALUE
+        if frame.kind == "{" and frame.state == _EXPECT_COLON:
+            self._out.append(":")
+            frame.state = _EXPECT_VALUE
+
+    def _emit_key(self, token: str) -> None:
+        self._mode = None
+        frame = self._stack[-1]
+        if frame.state == _AFTER_VALUE:
+            self._out.append(",")
+        frame.key_index = len(self._out)
+        self._out.append(token)
+        frame.state = _EXPECT_COLON
+
+    def _emit_value(self, token: str) -> None:
+        self._mode = None
+        self._before_value()
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame.kind == "{" and frame.state == _EXPECT_KEY:
+            # valore dove ci si aspettava una chiave: lo si scarta
+            return
+        self._out.append(token)
+        if frame is not None:
+            frame.state = _AFTER_VALUE
+
+    def _close_frame(self) -> None:
+        frame = self._stack.pop()
+        if frame.kind == "{" and frame.state in (_EXPECT_COLON, _EXPECT_VALUE):
+            # chiave senza valore: la coppia viene scartata
+            del self._out[frame.key_index:]
+        while self._out and self._out[-1] == ",":
+            self._out.pop()
+        self._out.append("}" if frame.kind == "{" else "]")
+        if self._stack:
+            self._stack[-1].state = _AFTER_VALUE
+        else:
+            self._done = True
+
+    @staticmethod
+    def _finish_number(raw: str) -> str:
+        match = _NUMBER_RE.match(raw.rstrip("+-.eE"))
+        return match.group(0) if match else "null"
+
+    @staticmethod
+    def _finish_word(word: str) -> str:
+        if word in _LITERALS:
+            return _LITERALS[word]
+        return json.dumps(word)
+
+
+def repair_json(text: str) -> str:
+    """Ripara il testo e restituisce una stringa JSON valida (vuota se non c'è alcun oggetto/array)."""
+    parser = StreamingJsonParser()
+    parser.feed(text)
+    return parser.text()
@@ -0,0 +1,211 @@
+import contextvars
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pages.common import cassette
+from pages.common.settings import data_path, get_setting
+
+# Contabilità di costi e quote delle chiamate esterne (DataForSEO, Gemini).
+# Ogni chiamata reale è una riga in SQLite con costo in USD; i risultati serviti
+# dalla cache sono registrati con cached=1 e un costo stimato (il risparmio).
+DB_PATH = data_path("metering.sqlite3")
+
+# Budget in USD (0 = nessun limite)
+BUDGET_DAILY_USD = get_setting("budget_daily_usd", 0.0)
+BUDGET_SESSION_USD = get_setting("budget_session_usd", 0.0)
+
+# Prezzi Gemini in USD per milione di token (input, output)
+GEMINI_PRICES = {
+    "gemini-2.5-pro": (1.25, 10.0),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    session_id TEXT,
+    user TEXT,
+    service TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    cached INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_usage_day ON usage (day);
+CREATE INDEX IF NOT EXISTS idx_usage_session ON usage (session_id);
+CREATE INDEX IF NOT EXISTS idx_usage_op ON usage (service, operation, cached);
+"""
+
+_context: contextvars.ContextVar[tuple[str | None, str | None]] = contextvars.ContextVar("meter_context", default=(None, None))
+# Conteggio delle chiamate reali dentro cached_call (per riconoscere i cache hit)
+_scope: contextvars.ContextVar[dict | None] = contextvars.ContextVar("meter_scope", default=None)
+
+
+class BudgetExceeded(RuntimeError):
+    """Il budget giornaliero o di sessione è esaurito."""
+
+
+def _connect(db_path: Path = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def set_context(session_id: str | None, user: str | None = None) -> None:
+    """Sessione e utente a cui attribuire le chiamate (propagati ai thread con tracing.bind)."""
+    _context.set((session_id, user))
+
+
+def set_streamlit_context() -> None:
+    """Attribuisce le chiamate alla sessione Streamlit corrente e, se autenticato, all'utente."""
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    try:
+        user = getattr(st, "user", None) and st.user.get("email")
+    except Exception:
+        user = None
+    set_context(ctx.session_id if ctx else None, user)
+
+
+def current_session_id() -> str | None:
+    return _context.get()[0]
+
+
+def gemini_cost(model_name: str, input_tokens: int | None, output_tokens: int | None) -> float:
+    price_in, price_out = GEMINI_PRICES.get(model_name, GEMINI_PRICES["gemini-2.5-pro"])
+    return ((input_tokens or 0) * price_in + (output_tokens or 0) * price_out) / 1_000_000
+
+
+def mark_call() -> None:
+    """
+    Segnala che è partita una chiamata reale (anche se poi fallisce), così
+    cached_call non la scambia per un risultato servito dalla cache.
+    """
+    scope = _scope.get()
+    if scope is not None:
+        scope["calls"] += 1
+
+
+def record(service: str, operation: str, cost_usd: float = 0.0, input_tokens: int | None = None,
+           output_tokens: int | None = None, cached: bool = False, db_path: Path = None) -> None:
+    """Registra una chiamata (o, con cached=True, un risparmio da cache)."""
+    if not cached:
+        mark_call()
+    if cassette.replaying():
+        return  # le risposte riprodotte dalle cassette non hanno costo reale
+    session_id, user = _context.get()
+    try:
+        with closing(_connect(db_path)) as conn, conn:
+            conn.execute(
+                "INSERT INTO usage (ts, day, session_id, user, service, operation, input_tokens, output_tokens, cost_usd, cached) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), today(), session_id, user, service, operation,
+                 input_tokens, output_tokens, float(cost_usd or 0), int(cached)),
+            )
+    except sqlite3.Error:
+        pass  # la contabilità non deve interrompere l'analisi
+
+
+def record_dataforseo(operation: str, data: dict) -> None:
+    """Registra una risposta DataForSEO usando il campo `cost` (USD) del payload."""
+    record("dataforseo", operation, cost_usd=(data or {}).get("cost") or 0.0)
+
+
+def record_gemini(model_name: str, usage) -> None:
+    """Registra una chiamata Gemini a partire dallo usage_metadata della risposta."""
+    input_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    # I modelli "thinking" fatturano i token di ragionamento come output
+    thoughts_tokens = getattr(usage, "thoughts_token_count", None) or 0
+    if thoughts_tokens:
+        output_tokens = (output_tokens or 0) + thoughts_tokens
+    record("gemini", model_name, gemini_cost(model_name, input_tokens, output_tokens), input_tokens, output_tokens)
+
+
+def _average_cost(service: str, operation: str, db_path: Path = None) -> float:
+    with closing(_connect(db_path)) as conn:
+        row = conn.execute(
+            "SELECT AVG(cost_usd) FROM (SELECT cost_usd FROM usage WHERE service = ? AND operation = ? AND cached = 0 "
+            "ORDER BY id DESC LIMIT 200)",
+            (service, operation),
+        ).fetchone()
+    return row[0] or 0.0
+
+
+def cached_call(service: str, operation: str, fn, *args, **kwargs):
+    """
+    Esegue una funzione in cache (es. st.cache_data): se al suo interno non viene
+    registrata nessuna chiamata reale il risultato arrivava dalla cache, e il costo
+    medio recente dell'operazione viene contato come risparmio.
+    """
+    scope = {"calls": 0}
+    token = _scope.set(scope)
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        _scope.reset(token)
+    if scope["calls"] == 0:
+        try:
+            record(service, operation, cost_usd=_average_cost(service, operation), cached=True)
+        except sqlite3.Error:
+            pass
+    return result
+
+
+def totals(session_id: str | None = None, day: str | None = None, db_path: Path = None) -> dict:
+    """Speso, risparmiato e numero di chiamate, filtrati per sessione e/o giorno."""
+    sql = ("SELECT COALESCE(SUM(CASE WHEN cached = 0 THEN cost_usd END), 0), "
+           "COALESCE(SUM(CASE WHEN cached = 1 THEN cost_usd END), 0), "
+           "COALESCE(SUM(cached = 0), 0), COALESCE(SUM(cached = 1), 0) FROM usage WHERE 1=1")
+    params = []
+    if session_id:
+        sql += " AND session_id = ?"
+        params.append(session_id)
+    if day:
+        sql += " AND day = ?"
+        params.append(day)
+    with closing(_connect(db_path)) as conn:
+        spent, saved, calls, hits = conn.execute(sql, params).fetchone()
+    return {"spent_usd": spent, "saved_usd": saved, "calls": calls, "cache_hits": hits}
+
+
+def usage_summary(group_by: str = "day", days: int = 30, db_path: Path = None) -> list[dict]:
+    """Aggregati per giorno, sessione, utente o servizio sugli ultimi `days` giorni."""
+    column = {"day": "day", "session": "session_id", "user": "user", "service": "service || ' · ' || operation"}[group_by]
+    with closing(_connect(db_path)) as conn:
+        rows = conn.execute(
+            f"SELECT {column} AS k, SUM(cached = 0), SUM(cached = 1), "
+            "SUM(CASE WHEN cached = 0 THEN cost_usd ELSE 0 END), SUM(CASE WHEN cached = 1 THEN cost_usd ELSE 0 END), "
+            "SUM(COALESCE(input_tokens, 0)), SUM(COALESCE(output_tokens, 0)) "
+            "FROM usage WHERE ts >= ? GROUP BY k ORDER BY k DESC",
+            (time.time() - days * 86400,),
+        ).fetchall()
+    keys = ["key", "calls", "cache_hits", "spent_usd", "saved_usd", "input_tokens", "output_tokens"]
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def check_budget(db_path: Path = None) -> None:
+    """Solleva BudgetExceeded se il budget giornaliero o della sessione corrente è esaurito."""
+    if BUDGET_DAILY_USD > 0:
+        spent = totals(day=today(), db_path=db_path)["spent_usd"]
+        if spent >= BUDGET_DAILY_USD:
+            raise BudgetExceeded(f"Budget giornaliero esaurito: {spent:.2f}$ su {BUDGET_DAILY_USD:.2f}$")
+    session_id, _ = _context.get()
+    if BUDGET_SESSION_USD > 0 and session_id:
+        spent = totals(session_id=session_id, db_path=db_path)["spent_usd"]
+        if spent >= BUDGET_SESSION_USD:
+            raise BudgetExceeded(f"Budget di sessione esaurito: {spent:.2f}$ su {BUDGET_SESSION_USD:.2f}$")
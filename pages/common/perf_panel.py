@@ -0,0 +1,117 @@
+import pandas as pd
+import streamlit as st
+
+from pages.common.executor import get_executor
+from pages.common.metering import BUDGET_DAILY_USD, today, totals, usage_summary
+from pages.common.session_data import SessionData, memory_usage
+from pages.common.tracing import get_spans
+
+# Tipi di span che corrispondono a chiamate verso servizi esterni
+EXTERNAL_KINDS = ("http", "llm")
+
+
+def spans_dataframe(spans: list[dict]) -> pd.DataFrame:
+    """Una riga per span, con gli attributi più utili portati in colonna."""
+    rows = []
+    for s in spans:
+        attrs = s.get("attributes") or {}
+        rows.append({
+            "Tipo": s["kind"],
+            "Operazione": s["name"],
+            "Durata (s)": round(s["duration_ms"] / 1000, 2),
+            "Esito": s["status"],
+            "Target": attrs.get("target") or attrs.get("url") or attrs.get("model") or "",
+            "Token input": attrs.get("prompt_tokens"),
+            "Token output": attrs.get("output_tokens"),
+            "Errore": s.get("error") or "",
+        })
+    return pd.DataFrame(rows)
+
+
+def render_performance_panel(run_id: str | None, slowest: int = 15):
+    """Pannello comprimibile con i tempi di fasi e chiamate esterne di una run."""
+    spans = get_spans(run_id)
+    with st.expander("⏱️ Prestazioni dell'analisi", expanded=False):
+        if not spans:
+            st.caption("Nessuna chiamata esterna registrata per questa analisi (risultati dalla cache).")
+            render_executor_stats()
+            return
+        df = spans_dataframe(spans)
+        phases = df[df["Tipo"] == "phase"]
+        calls = df[df["Tipo"] != "phase"]
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Chiamate esterne", int(calls["Tipo"].isin(EXTERNAL_KINDS).sum()))
+        col2.metric("Errori", int((calls["Esito"] == "error").sum()))
+        col3.metric("Token Gemini (in/out)", f"{int(calls['Token input'].fillna(0).sum())} / {int(calls['Token output'].fillna(0).sum())}")
+
+        if not phases.empty:
+            st.markdown("**Fasi**")
+            st.dataframe(phases[["Operazione", "Durata (s)", "Esito"]], use_container_width=True, hide_index=True)
+        if not calls.empty:
+            st.markdown("**Totale per tipo di chiamata**")
+            summary = calls.groupby("Tipo")["Durata (s)"].agg(["count", "sum", "mean", "max"]).round(2)
+            summary.columns = ["Chiamate", "Totale (s)", "Media (s)", "Max (s)"]
+            st.dataframe(summary, use_container_width=True)
+            st.markdown(f"**Le {slowest} chiamate più lente**")
+            st.dataframe(
+                calls.sort_values("Durata (s)", ascending=False).head(slowest),
+                use_container_width=True, hide_index=True
+            )
+        render_executor_stats()
+        st.caption(f"ID run: `{run_id}` — gli span completi sono in `.data/traces/` (JSONL).")
+
+
+def render_executor_stats():
+    """Concorrenza adattiva, code e utilizzo per upstream dell'executor di questo processo."""
+    stats = get_executor().stats()
+    if not stats:
+        return
+    st.markdown("**Concorrenza per upstream** (processo corrente)")
+    df = pd.DataFrame(stats)
+    df.columns = ["Upstream", "Limite", "In corso", "In coda", "Utilizzo", "Completate", "Errori", "Latenza media (ms)"]
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+
+def render_cost_panel(session_id: str | None):
+    """Pannello comprimibile con spesa, risparmi da cache e budget (sessione e giorno)."""
+    with st.expander("💰 Costi e quote", expanded=False):
+        session = totals(session_id=session_id)
+        today_totals = totals(day=today())
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Spesa sessione", f"{session['spent_usd']:.3f} $")
+        col2.metric("Risparmio da cache (sessione)", f"{session['saved_usd']:.3f} $", help=f"{session['cache_hits']} risultati serviti dalla cache")
+        col3.metric("Spesa oggi", f"{today_totals['spent_usd']:.2f} $")
+        col4.metric("Budget giornaliero", f"{BUDGET_DAILY_USD:.2f} $" if BUDGET_DAILY_USD > 0 else "Illimitato")
+        if BUDGET_DAILY_USD > 0:
+            st.progress(min(today_totals['spent_usd'] / BUDGET_DAILY_USD, 1.0))
+
+        group_by = st.radio("Raggruppa per", ["service", "day", "user", "session"], horizontal=True,
+                            format_func=lambda g: {"service": "Servizio", "day": "Giorno", "user": "Utente", "session": "Sessione"}[g],
+                            key="cost_panel_group_by")
+        summary = pd.DataFrame(usage_summary(group_by))
+        if summary.empty:
+            st.caption("Nessuna chiamata registrata negli ultimi 30 giorni.")
+            return
+        summary.columns = ["Chiave", "Chiamate", "Cache hit", "Speso ($)", "Risparmiato ($)", "Token input", "Token output"]
+        st.dataframe(summary.round(4), use_container_width=True, hide_index=True)
+
+
+def render_session_memory_panel(data: SessionData):
+    """Pannello comprimibile con l'occupazione dei payload della sessione e della cache di processo."""
+    with st.expander("💾 Memoria della sessione", expanded=False):
+        report = data.report()
+        usage = memory_usage()
+        mb = 1024 * 1024
+        col1, col2, col3 = st.columns(3)
+        col1.metric("In memoria (sessione)", f"{usage['sessions'].get(data.session_id, 0) / mb:.1f} MB")
+        col2.metric("Su disco (sessione)", f"{sum(r['stored_bytes'] for r in report) / mb:.1f} MB")
+        col3.metric("Cache del processo", f"{usage['used_bytes'] / mb:.0f} / {usage['budget_bytes'] / mb:.0f} MB",
+                    help=f"{len(usage['sessions'])} sessioni con payload in memoria")
+        if report:
+            df = pd.DataFrame(report)
+            df["raw_bytes"] = (df["raw_bytes"] / 1024).round(1)
+            df["stored_bytes"] = (df["stored_bytes"] / 1024).round(1)
+            df.columns = ["Dato", "Dimensione (KB)", "Compresso su disco (KB)", "In memoria"]
+            st.dataframe(df, use_container_width=True, hide_index=True)
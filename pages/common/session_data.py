@@ -0,0 +1,178 @@
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from pages.common.settings import data_path, get_setting
+
+# Dati voluminosi di una sessione (SERP grezza, contenuti dei competitor, testi
+# dell'AI, ...) fuori da st.session_state: nella sessione resta solo un piccolo
+# oggetto SessionData con i metadati, mentre i payload sono salvati compressi
+# (pickle + zlib) in DATA_DIR/sessions/<id>/ e tenuti in una cache LRU di processo
+# con un budget in byte condiviso da tutte le sessioni. Oltre il budget i payload
+# usati meno di recente lasciano la memoria e vengono riletti dal disco alla lettura.
+
+SESSION_MEMORY_MB = get_setting("session_memory_mb", 256)
+# Le cartelle delle sessioni non più usate da questo tempo vengono eliminate
+SESSION_DATA_TTL_HOURS = get_setting("session_data_ttl_hours", 24)
+COMPRESSION_LEVEL = 3
+
+
+class _MemoryCache:
+    """LRU thread-safe con budget in byte (dimensione dei payload serializzati)."""
+
+    def __init__(self, budget_bytes: int):
+        self.budget = budget_bytes
+        self._lock = threading.Lock()
+        self._items: OrderedDict = OrderedDict()  # (sessione, chiave) -> (valore, byte)
+        self.used = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            self._items.move_to_end(key)
+            return entry
+
+    def put(self, key, value, size: int) -> None:
+        with self._lock:
+            self._discard(key)
+            if size > self.budget:
+                return  # più grande dell'intero budget: resta solo su disco
+            self._items[key] = (value, size)
+            self.used += size
+            while self.used > self.budget:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.used -= evicted
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key) -> None:
+        entry = self._items.pop(key, None)
+        if entry is not None:
+            self.used -= entry[1]
+
+    def usage_by_session(self) -> dict[str, int]:
+        with self._lock:
+            usage = {}
+            for (session, _), (_, size) in self._items.items():
+                usage[session] = usage.get(session, 0) + size
+            return usage
+
+
+_cache = _MemoryCache(SESSION_MEMORY_MB * 1024 * 1024)
+_cleanup_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+def cleanup_expired(max_age_hours: float = SESSION_DATA_TTL_HOURS) -> int:
+    """Elimina le cartelle delle sessioni inattive da più di max_age_hours; restituisce quante."""
+    root = data_path("sessions")
+    if not root.is_dir():
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for folder in root.iterdir():
+        if folder.is_dir() and folder.stat().st_mtime < cutoff:
+            shutil.rmtree(folder, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+class SessionData:
+    """Payload di una sessione: su disco compressi, in memoria finché il budget lo consente."""
+
+    def __init__(self, session_id: str | None = None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.folder = data_path("sessions", self.session_id)
+        # chiave -> {"raw_bytes": dimensione serializzata, "stored_bytes": dimensione su disco}
+        self.meta: dict[str, dict] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.meta
+
+    def _path(self, key: str):
+        return self.folder / f"{key}.bin"
+
+    def put(self, key: str, value) -> None:
+        """
+        Salva un payload. Gli oggetti letti con get() e poi modificati vanno
+        salvati di nuovo con put(), altrimenti la modifica si perde quando il
+        payload esce dalla memoria.
+        """
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        blob = zlib.compress(raw, COMPRESSION_LEVEL)
+        self.folder.mkdir(exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(blob)
+        tmp.replace(path)
+        self.meta[key] = {"raw_bytes": len(raw), "stored_bytes": len(blob)}
+        _cache.put((self.session_id, key), value, len(raw))
+
+    def get(self, key: str, default=None):
+        if key not in self.meta:
+            return default
+        entry = _cache.get((self.session_id, key))
+        try:
+            # La data di modifica della cartella segna la sessione come attiva per la pulizia
+            os.utime(self.folder)
+            if entry is not None:
+                return entry[0]
+            value = pickle.loads(zlib.decompress(self._path(key).read_bytes()))
+        except FileNotFoundError:
+            # Cartella eliminata dalla pulizia delle sessioni inattive
+            self.meta.pop(key)
+            return default
+        _cache.put((self.session_id, key), value, self.meta[key]["raw_bytes"])
+        return value
+
+    def pop(self, key: str, default=None):
+        value = self.get(key, default)
+        if self.meta.pop(key, None) is not None:
+            _cache.discard((self.session_id, key))
+            self._path(key).unlink(missing_ok=True)
+        return value
+
+    def clear(self) -> None:
+        for key in list(self.meta):
+            _cache.discard((self.session_id, key))
+        self.meta.clear()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def report(self) -> list[dict]:
+        """Per ogni payload: dimensione serializzata, dimensione su disco e presenza in memoria."""
+        return [
+            {"key": key, **meta, "in_memory": (self.session_id, key) in _cache}
+            for key, meta in self.meta.items()
+        ]
+
+
+def memory_usage() -> dict:
+    """Occupazione della cache di processo: totale, budget e byte per sessione."""
+    return {"used_bytes": _cache.used, "budget_bytes": _cache.budget, "sessions": _cache.usage_by_session()}
+
+
+def get_session_data() -> SessionData:
+    """SessionData della sessione Streamlit corrente (creato al primo accesso)."""
+    import streamlit as st
+
+    global _last_cleanup
+    if "session_data" not in st.session_state:
+        st.session_state.session_data = SessionData()
+        with _cleanup_lock:
+            if time.time() - _last_cleanup > 3600:
+                _last_cleanup = time.time()
+                cleanup_expired()
+    return st.session_state.session_data
@@ -0,0 +1,40 @@
+import os
+from pathlib import Path
+
+# Cartella radice del progetto e cartella dei dati locali (database, file di batch, ecc.)
+ROOT_DIR = Path(__file__).resolve().parents[2]
+DATA_DIR = Path(os.environ.get("ANNALECT_DATA_DIR", ROOT_DIR / ".data"))
+
+
+def data_path(*parts: str) -> Path:
+    """
+    Restituisce un percorso dentro DATA_DIR, creando le cartelle intermedie.
+    """
+    path = DATA_DIR.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def get_setting(name: str, default):
+    """
+    Legge un parametro di tuning, nell'ordine:
+    - variabile d'ambiente ANNALECT_<NAME> (es. ANNALECT_FANOUT_CONCURRENCY)
+    - sezione [tuning] dei secrets di Streamlit
+    - default
+    Il valore viene convertito nel tipo del default.
+    """
+    raw = os.environ.get(f"ANNALECT_{name.upper()}")
+    if raw is None:
+        try:
+            import streamlit as st
+            raw = st.secrets.get("tuning", {}).get(name)
+        except Exception:
+            raw = None
+    if raw is None or default is None:
+        return default if raw is None else raw
+    if isinstance(default, bool):
+        return str(raw).strip().lower() in ("1", "true", "yes", "on")
+    try:
+        return type(default)(raw)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,57 @@
+import functools
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Coalescenza delle chiamate identiche in corso: finché una chiamata con una certa
+    chiave non è terminata, le altre richieste con la stessa chiave ne attendono il
+    risultato (o l'eccezione) invece di ripetere la chiamata a monte.
+    Vale all'interno di un processo (tutte le sessioni Streamlit del server).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: dict = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
+
+
+def single_flight(fn):
+    """
+    Decoratore: le chiamate concorrenti con gli stessi argomenti condividono
+    un'unica esecuzione. Va applicato sotto @st.cache_data, che non evita le
+    chiamate duplicate quando più miss della cache arrivano insieme.
+    """
+    group = SingleFlight()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        return group.do(key, fn, *args, **kwargs)
+
+    wrapper.single_flight = group
+    return wrapper
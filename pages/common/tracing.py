@@ -0,0 +1,138 @@
+import contextvars
+import functools
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from pages.common.settings import data_path, get_setting
+
+# Tracing minimale delle chiamate esterne (DataForSEO, Gemini, fetch di pagine, parsing).
+# Ogni span appartiene a una "run" (un'analisi); i record sono tenuti in memoria per il
+# pannello prestazioni e, se abilitato, esportati in JSONL con campi in stile OpenTelemetry
+# (trace_id, span_id, parent_span_id, start/end in nanosecondi, attributes, status).
+
+TRACE_EXPORT = get_setting("trace_export", "jsonl")  # "jsonl" oppure "off"
+MAX_RUNS_IN_MEMORY = get_setting("trace_max_runs", 50)
+
+_current_run: contextvars.ContextVar[str | None] = contextvars.ContextVar("trace_run", default=None)
+_current_span: contextvars.ContextVar[str | None] = contextvars.ContextVar("trace_span", default=None)
+
+_runs: OrderedDict[str, list[dict]] = OrderedDict()
+_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+def set_run(run_id: str | None) -> None:
+    """Imposta la run corrente per il thread dello script (i thread dei pool usano bind)."""
+    _current_run.set(run_id)
+
+
+def current_run() -> str | None:
+    return _current_run.get()
+
+
+def bind(fn):
+    """
+    Propaga run e span correnti a una funzione eseguita in un altro thread
+    (es. ThreadPoolExecutor.submit(bind(fn), ...)).
+    """
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+class Span:
+    """Span in corso: gli attributi si possono aggiungere fino alla chiusura."""
+
+    def __init__(self, name: str, kind: str, attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def set(self, **attributes) -> None:
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """
+    Misura il blocco come span della run corrente. Senza run attiva non registra nulla,
+    così le funzioni strumentate restano utilizzabili anche fuori dalle pagine tracciate.
+    """
+    run_id = _current_run.get()
+    current = Span(name, kind, {k: v for k, v in attributes.items() if v is not None})
+    if run_id is None:
+        yield current
+        return
+    parent_id = _current_span.get()
+    token = _current_span.set(current.span_id)
+    start_ns = time.time_ns()
+    perf_start = time.perf_counter()
+    status, error = "ok", None
+    try:
+        yield current
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        duration_ms = (time.perf_counter() - perf_start) * 1000
+        _record({
+            "trace_id": run_id,
+            "span_id": current.span_id,
+            "parent_span_id": parent_id,
+            "name": name,
+            "kind": kind,
+            "start_time_unix_nano": start_ns,
+            "end_time_unix_nano": start_ns + int(duration_ms * 1e6),
+            "duration_ms": round(duration_ms, 1),
+            "status": status,
+            "error": error,
+            "attributes": current.attributes,
+            "thread": threading.current_thread().name,
+        })
+
+
+def _record(record: dict) -> None:
+    with _lock:
+        spans = _runs.setdefault(record["trace_id"], [])
+        spans.append(record)
+        _runs.move_to_end(record["trace_id"])
+        while len(_runs) > MAX_RUNS_IN_MEMORY:
+            _runs.popitem(last=False)
+    if TRACE_EXPORT == "jsonl":
+        _export_jsonl(record)
+
+
+def _export_jsonl(record: dict) -> None:
+    path = data_path("traces", time.strftime("%Y-%m-%d") + ".jsonl")
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    try:
+        with _export_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError:
+        pass  # il tracing non deve mai interrompere l'analisi
+
+
+def get_spans(run_id: str | None) -> list[dict]:
+    """Copia degli span registrati per una run (in ordine di chiusura)."""
+    with _lock:
+        return list(_runs.get(run_id, []))
+
+
+def add_spans(run_id: str, spans: list[dict]) -> None:
+    """Aggiunge a una run span registrati altrove (es. in un processo worker)."""
+    with _lock:
+        _runs.setdefault(run_id, []).extend(spans)
+        _runs.move_to_end(run_id)
@@ -0,0 +1,18 @@
+class UnionFind:
+    """Insiemi disgiunti con compressione del cammino (duplicati, cluster di keyword)."""
+
+    def __init__(self):
+        self.parent: dict = {}
+
+    def find(self, x):
+        parent = self.parent.setdefault(x, x)
+        while parent != x:
+            grandparent = self.parent[parent]
+            self.parent[x] = grandparent  # dimezzamento del cammino
+            x, parent = parent, self.parent[grandparent]
+        return x
+
+    def union(self, a, b) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
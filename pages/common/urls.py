@@ -0,0 +1,62 @@
+import posixpath
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+
+# Normalizzazione degli URL condivisa (Rank Booster, crawler del SEO Extractor).
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+# Parametri di tracciamento che non cambiano il contenuto della pagina
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "yclid", "dclid", "_ga", "mc_cid", "mc_eid"}
+
+
+def clean_url(url: str) -> str:
+    """Rimuove parametri e frammenti da un URL."""
+    if not isinstance(url, str): return ""
+    parsed = urlparse(url)
+    return urlunparse(parsed._replace(query="", params="", fragment=""))
+
+
+def normalize_url(url: str, base: str | None = None, keep_query: bool = True) -> str:
+    """
+    Forma canonica di un URL http(s), per riconoscere la stessa pagina scritta in modi
+    diversi: risolve gli URL relativi rispetto a `base`, porta schema e host in
+    minuscolo, toglie porta di default, frammento, segmenti "." e "..", parametri di
+    tracciamento (utm_*, gclid, ...) e ordina quelli rimanenti.
+    Restituisce "" per URL non http(s) (mailto:, javascript:, tel:, ...).
+    """
+    if not isinstance(url, str) or not url.strip():
+        return ""
+    url = urljoin(base, url.strip()) if base else url.strip()
+    try:
+        parsed = urlparse(url)
+        port = parsed.port
+    except ValueError:  # porta o host IPv6 non validi
+        return ""
+    scheme = parsed.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parsed.hostname:
+        return ""
+    host = parsed.hostname.rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"  # IPv6
+    if port and str(port) != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+    path = parsed.path or "/"
+    if "/." in path or "//" in path:
+        trailing = path.endswith("/")
+        path = posixpath.normpath(path)
+        path = "/" if path in (".", "/") else path + ("/" if trailing else "")
+        if path.startswith("//"):
+            path = "/" + path.lstrip("/")
+    query = ""
+    if keep_query and parsed.query:
+        params = [
+            (k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+            if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+        ]
+        query = urlencode(sorted(params), doseq=True)
+    return urlunparse((scheme, host, path, "", query, ""))
+
+
+def site_host(url: str) -> str:
+    """Host senza "www.", per considerare interni i link tra www e dominio nudo."""
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
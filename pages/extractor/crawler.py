@@ -0,0 +1,228 @@
+import hashlib
+import heapq
+import itertools
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from pages.common.executor import get_executor
+from pages.common.settings import get_setting
+from pages.common.urls import normalize_url, site_host
+from pages.extractor.duplicates import DuplicateIndex
+from pages.extractor.extract import BASE_HEADERS, analyze_html, error_info, fetch_html, session
+
+# Crawler dei link interni a partire da un URL seed, per gli audit di sito:
+# - frontiera a priorità (prima le pagine meno profonde, poi i path più corti);
+# - URL normalizzati (pages/common/urls.py) e insieme dei visitati in un Bloom filter,
+#   pochi byte per URL anche su siti da 100k+ pagine;
+# - cortesia per host: al massimo CRAWL_HOST_CONCURRENCY richieste in corso, almeno
+#   CRAWL_DELAY secondi tra una partenza e l'altra (o il Crawl-delay di robots.txt);
+# - i link arrivano dallo stesso parse dei campi SEO (extract_page).
+
+CRAWL_DELAY = get_setting("crawl_delay", 0.5)
+CRAWL_HOST_CONCURRENCY = get_setting("crawl_host_concurrency", 2)
+CRAWL_MAX_PAGES = get_setting("crawl_max_pages", 100000)
+# Probabilità di falso positivo del Bloom filter (una pagina mai vista scambiata per visitata)
+BLOOM_ERROR_RATE = 0.001
+
+SKIPPED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico", ".bmp", ".avif",
+    ".pdf", ".zip", ".gz", ".rar", ".7z", ".mp3", ".mp4", ".avi", ".mov", ".webm",
+    ".css", ".js", ".json", ".xml", ".txt", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
+}
+
+
+class BloomFilter:
+    """Insieme probabilistico compatto: nessun falso negativo, falsi positivi con probabilità ~error_rate."""
+
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Doppio hashing (Kirsch-Mitzenmacher) da un solo digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> bool:
+        """Aggiunge l'elemento; restituisce False se era (probabilmente) già presente."""
+        added = False
+        for pos in self._positions(item):
+            byte, bit = divmod(pos, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                added = True
+        self.count += added
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos // 8] & (1 << (pos % 8)) for pos in self._positions(item))
+
+
+class _Host:
+    """Coda a priorità e stato di cortesia di un host."""
+
+    def __init__(self, name: str, delay: float):
+        self.name = name
+        self.delay = delay
+        self.queue: list = []
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.robots: RobotFileParser | None = None
+
+    def ready_at(self) -> float | None:
+        if not self.queue or self.in_flight >= CRAWL_HOST_CONCURRENCY:
+            return None
+        return self.next_start
+
+
+def _priority(url: str, depth: int) -> tuple[int, int]:
+    path = urlparse(url).path
+    return depth, path.count("/") * 100 + len(path)
+
+
+def _crawlable(url: str) -> bool:
+    path = urlparse(url).path.lower()
+    return not any(path.endswith(ext) for ext in SKIPPED_EXTENSIONS)
+
+
+def _load_robots(url: str) -> RobotFileParser:
+    parsed = urlparse(url)
+    robots = RobotFileParser(f"{parsed.scheme}://{parsed.netloc}/robots.txt")
+    try:
+        response = session.get(robots.url, headers=BASE_HEADERS, timeout=10)
+        if response.status_code in (401, 403):
+            robots.disallow_all = True
+        elif response.ok:
+            robots.parse(response.text.splitlines())
+        else:
+            robots.allow_all = True
+    except Exception:
+        robots.allow_all = True  # robots.txt irraggiungibile: nessuna restrizione
+    return robots
+
+
+def _fetch_page(url: str) -> tuple[dict, list[str], str]:
+    """Come extract_page, restituendo anche l'URL finale dopo i redirect."""
+    html, final_url = fetch_html(url)
+    return (*analyze_html(url, html, final_url), final_url)
+
+
+class Crawler:
+    """
+    Crawl in ampiezza "a priorità" dei link interni al sito del seed, fino a
+    max_depth livelli e max_pages pagine. Le pagine sono scaricate in parallelo
+    sull'executor condiviso (upstream "web"), nel rispetto della cortesia per host.
+    """
+
+    def __init__(self, seed: str, max_depth: int = 3, max_pages: int = 500, respect_robots: bool = True):
+        self.seed = normalize_url(seed)
+        if not self.seed:
+            raise ValueError(f"URL seed non valido: {seed}")
+        self.site = site_host(self.seed)
+        self.max_depth = max_depth
+        self.max_pages = min(max_pages, CRAWL_MAX_PAGES)
+        self.respect_robots = respect_robots
+        # Nel filtro finiscono solo gli URL accodati (al massimo max_pages) e le
+        # destinazioni dei loro redirect (al massimo una per pagina scaricata)
+        self.seen = BloomFilter(self.max_pages * 2)
+        self.hosts: dict[str, _Host] = {}
+        self.enqueued = 0
+        self._seq = itertools.count()
+
+    def _host(self, url: str) -> _Host:
+        netloc = urlparse(url).netloc
+        host = self.hosts.get(netloc)
+        if host is None:
+            host = self.hosts[netloc] = _Host(netloc, CRAWL_DELAY)
+            if self.respect_robots:
+                host.robots = _load_robots(url)
+                host.delay = max(CRAWL_DELAY, float(host.robots.crawl_delay(BASE_HEADERS["User-Agent"]) or 0))
+        return host
+
+    def enqueue(self, url: str, depth: int) -> bool:
+        if (depth > self.max_depth or self.enqueued >= self.max_pages
+                or site_host(url) != self.site or not _crawlable(url) or url in self.seen):
+            return False
+        host = self._host(url)
+        if host.robots is not None and not host.robots.can_fetch(BASE_HEADERS["User-Agent"], url):
+            return False
+        # Solo gli URL davvero accodati occupano il filtro: gli esclusi non ne alzano i falsi positivi
+        self.seen.add(url)
+        heapq.heappush(host.queue, (*_priority(url, depth), next(self._seq), url))
+        self.enqueued += 1
+        return True
+
+    def _next_ready(self, now: float) -> _Host | None:
+        ready = [h for h in self.hosts.values() if h.ready_at() is not None and h.ready_at() <= now]
+        return min(ready, key=lambda h: h.queue[0]) if ready else None
+
+    def _next_wakeup(self, now: float) -> float | None:
+        times = [h.ready_at() for h in self.hosts.values() if h.ready_at() is not None]
+        return max(0.0, min(times) - now) if times else None
+
+    def run(self, progress=None, on_row=None) -> list[dict]:
+        """
+        Esegue il crawl e restituisce una riga per pagina, nell'ordine di visita;
+        on_row(indice, riga) è chiamata appena una pagina è analizzata.
+        """
+        self.enqueue(self.seed, 0)
+        executor = get_executor()
+        rows, in_flight = [], {}
+        done = 0
+        while True:
+            now = time.monotonic()
+            while host := self._next_ready(now):
+                depth, _, _, url = heapq.heappop(host.queue)
+                host.in_flight += 1
+                host.next_start = now + host.delay
+                future = executor.submit("web", _fetch_page, url)
+                in_flight[future] = (host, url, depth, len(rows))
+                rows.append(None)
+            if not in_flight:
+                wakeup = self._next_wakeup(now)
+                if wakeup is None:
+                    break  # frontiera esaurita
+                time.sleep(wakeup)
+                continue
+            finished, _ = wait(in_flight, timeout=self._next_wakeup(now), return_when=FIRST_COMPLETED)
+            for future in finished:
+                host, url, depth, index = in_flight.pop(future)
+                host.in_flight -= 1
+                try:
+                    info, links, final_url = future.result()
+                except Exception as e:
+                    info, links, final_url = error_info(e), [], None
+                # La destinazione di un redirect è già stata scaricata: se la si trova
+                # linkata direttamente non va accodata di nuovo
+                final_url = normalize_url(final_url) if final_url else None
+                if final_url and final_url != url:
+                    self.seen.add(final_url)
+                rows[index] = {"URL": url, "Profondità": depth, **info}
+                if on_row:
+                    on_row(index, rows[index])
+                for link in links:
+                    self.enqueue(link, depth + 1)
+                done += 1
+                if progress:
+                    progress(done, self.enqueued, f"Analizzate {done} pagine, {self.enqueued} scoperte")
+        return rows
+
+
+def run_crawl_job(params: dict, progress) -> dict:
+    """Job "seo_crawl": crawl dei link interni a partire da params["seed"]."""
+    crawler = Crawler(
+        params["seed"],
+        max_depth=int(params.get("max_depth", 3)),
+        max_pages=int(params.get("max_pages", 500)),
+        respect_robots=params.get("respect_robots", True),
+    )
+    duplicates = DuplicateIndex()
+    rows = crawler.run(progress, on_row=duplicates.add)
+    return {"rows": rows, "duplicates": duplicates.report(rows)}
@@ -0,0 +1,119 @@
+import hashlib
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+from pages.common.settings import get_setting
+from pages.common.unionfind import UnionFind
+
+# Indice dei duplicati tra URL su Meta title, Meta description e H1, aggiornato riga
+# per riga durante l'estrazione:
+# - duplicati esatti: hash del testo normalizzato;
+# - quasi duplicati: MinHash sui trigrammi di caratteri con LSH a bande, verifica della
+#   similarità di Jaccard stimata e union-find sui candidati. Su testi brevi come i title
+#   MinHash è più stabile di SimHash (una parola cambiata sposta molti bit).
+# Il costo è quasi lineare nel numero di testi distinti, invece dei confronti a coppie O(n²).
+
+DUPLICATE_FIELDS = ["Meta title", "Meta description", "H1"]
+# Similarità di Jaccard (stimata) minima tra i trigrammi di due testi quasi duplicati
+NEAR_DUPLICATE_SIMILARITY = get_setting("near_duplicate_similarity", 0.6)
+SHINGLE_SIZE = 3
+# 16 bande da 4 righe: soglia di collisione LSH ~ (1/16)^(1/4) = 0.5
+NUM_BANDS, ROWS_PER_BAND = 16, 4
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+
+_NON_WORD = re.compile(r"[^\w]+")
+# Hash universale (a*x + b) mod p con p primo di Mersenne a 31 bit: a*x sta in uint64
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def normalize_text(text: str) -> str:
+    """Minuscolo, senza accenti né punteggiatura, spazi compattati."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def minhash(text: str) -> np.ndarray:
+    """Firma MinHash (NUM_PERM valori) dei trigrammi di caratteri di un testo già normalizzato."""
+    padded = f" {text} "
+    shingles = {padded[i:i + SHINGLE_SIZE] for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))}
+    # hash() basta: le firme sono confrontate solo all'interno dello stesso processo
+    hashes = np.fromiter((hash(s) & _PRIME for s in shingles), dtype=np.uint64, count=len(shingles))
+    # Permutazioni (a*x + b) mod p, vettorizzate: matrice NUM_PERM x trigrammi
+    return ((np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+class FieldIndex:
+    """Duplicati esatti e quasi duplicati di un singolo campo."""
+
+    def __init__(self, similarity: float = NEAR_DUPLICATE_SIMILARITY):
+        self.similarity = similarity
+        # hash del testo normalizzato -> (testo originale del primo URL, indici degli URL)
+        self.exact: dict[str, tuple[str, list[int]]] = {}
+        self.signatures: dict[str, np.ndarray] = {}
+        self.buckets: dict[tuple[int, bytes], list[str]] = defaultdict(list)
+
+    def add(self, row_index: int, text: str) -> None:
+        normalized = normalize_text(text)
+        if not normalized:
+            return
+        key = hashlib.blake2b(normalized.encode("utf-8"), digest_size=12).hexdigest()
+        if key in self.exact:
+            self.exact[key][1].append(row_index)
+            return
+        self.exact[key] = (text.strip(), [row_index])
+        signature = self.signatures[key] = minhash(normalized)
+        for band in range(NUM_BANDS):
+            self.buckets[(band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())].append(key)
+
+    def _similar(self, a: str, b: str) -> bool:
+        return np.count_nonzero(self.signatures[a] == self.signatures[b]) >= self.similarity * NUM_PERM
+
+    def groups(self) -> list[dict]:
+        """Gruppi con almeno due URL: "esatto" (stesso testo) o "quasi" (testi simili)."""
+        uf = UnionFind()
+        for keys in self.buckets.values():
+            # Ogni testo è confrontato con il primo e con il precedente del bucket: O(m)
+            # anche per bucket enormi (title da template), la transitività la dà l'union-find
+            for i in range(1, len(keys)):
+                for other in {keys[0], keys[i - 1]}:
+                    if uf.find(keys[i]) != uf.find(other) and self._similar(keys[i], other):
+                        uf.union(keys[i], other)
+        clusters = defaultdict(list)
+        for key in self.exact:
+            clusters[uf.find(key)].append(key)
+
+        groups = []
+        for keys in clusters.values():
+            rows = sorted(r for k in keys for r in self.exact[k][1])
+            if len(rows) < 2:
+                continue
+            texts = [self.exact[k][0] for k in sorted(keys, key=lambda k: -len(self.exact[k][1]))]
+            groups.append({"type": "esatto" if len(keys) == 1 else "quasi", "texts": texts, "rows": rows})
+        groups.sort(key=lambda g: -len(g["rows"]))
+        return groups
+
+
+class DuplicateIndex:
+    """Indice incrementale dei duplicati sui campi DUPLICATE_FIELDS delle righe estratte."""
+
+    def __init__(self, fields: list[str] = DUPLICATE_FIELDS):
+        self.fields = {field: FieldIndex() for field in fields}
+
+    def add(self, row_index: int, row: dict) -> None:
+        for field, index in self.fields.items():
+            text = row.get(field)
+            if isinstance(text, str) and not text.startswith("Errore: "):
+                index.add(row_index, text)
+
+    def report(self, rows: list[dict]) -> dict[str, list[dict]]:
+        """Per ogni campo, i gruppi di duplicati con gli URL al posto degli indici di riga."""
+        return {
+            field: [{**g, "urls": [rows[r]["URL"] for r in g.pop("rows")]} for g in index.groups()]
+            for field, index in self.fields.items()
+        }
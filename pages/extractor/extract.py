@@ -0,0 +1,203 @@
+import codecs
+import re
+from concurrent.futures import as_completed
+
+from bs4 import BeautifulSoup
+from urllib3.util import make_headers
+
+from pages.common.executor import get_executor
+from pages.common.http import TracedSession
+from pages.common.settings import get_setting
+from pages.common.urls import normalize_url
+from pages.extractor import render
+from pages.extractor.duplicates import DuplicateIndex
+
+# Header delle richieste: Accept-Encoding elenca le compressioni che urllib3 sa
+# decodificare in questo ambiente (gzip, deflate e br se è installato brotli)
+BASE_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+    "Accept-Encoding": make_headers(accept_encoding=True)["accept-encoding"],
+}
+# Oltre questa dimensione (decompressa) il corpo della pagina viene troncato
+MAX_BODY_BYTES = get_setting("extract_max_body_bytes", 5 * 1024 * 1024)
+CHARSET_SNIFF_BYTES = 4096
+
+_HEADER_CHARSET = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.IGNORECASE)
+_META_CHARSET = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+
+session = TracedSession()
+
+# Campi restituiti da estrai_info, nell'ordine di visualizzazione
+FIELDS = [
+    "H1", "H2", "H3", "H4",
+    "Meta title", "Meta title length",
+    "Meta description", "Meta description length",
+    "Canonical", "Meta robots",
+]
+
+# Sotto questa soglia di testo, senza heading, la pagina è considerata costruita
+# lato client e viene renderizzata con Chromium (se disponibile)
+RENDER_MIN_TEXT_CHARS = get_setting("render_min_text_chars", 200)
+
+
+def main_content(soup: BeautifulSoup):
+    """Contenuto principale (main/article/...), con fallback su body."""
+    return (
+        soup.find("main")
+        or soup.find("article")
+        or soup.find("div", id="content")
+        or soup.find("div", class_="entry-content")
+        or soup.find("div", class_="post-body")
+        or soup.find("body")
+        or soup
+    )
+
+
+def needs_rendering(content) -> bool:
+    """Vero se il fetch statico non ha trovato contenuto: nessun heading e quasi nessun testo."""
+    if content.find(["h1", "h2", "h3", "h4"]):
+        return False
+    return len(content.get_text(" ", strip=True)) < RENDER_MIN_TEXT_CHARS
+
+
+def estrai_info(url: str) -> dict:
+    """
+    Fa GET con la sessione condivisa, parsea con BeautifulSoup e restituisce
+    dizionario con H1–H4, Meta title/description, canonical e robots.
+    Se la pagina statica è vuota (rendering lato client) usa il pool di Chromium.
+    """
+    return extract_page(url)[0]
+
+
+def page_links(soup: BeautifulSoup, base_url: str) -> list[str]:
+    """Link <a href> della pagina, assoluti e normalizzati, senza duplicati."""
+    base = soup.find("base", href=True)
+    base_url = (normalize_url(base["href"], base_url) or base_url) if base else base_url
+    links = (normalize_url(a["href"], base_url) for a in soup.find_all("a", href=True))
+    return list(dict.fromkeys(link for link in links if link))
+
+
+def _known_charset(name: str | None) -> str | None:
+    try:
+        return codecs.lookup(name).name if name else None
+    except LookupError:
+        return None
+
+
+def decode_html(body: bytes, content_type: str = "") -> str:
+    """
+    Decodifica il corpo una sola volta, senza rilevamento statistico del charset:
+    BOM, poi charset dell'header, poi <meta charset> nei primi byte, poi UTF-8
+    con ripiego su windows-1252.
+    """
+    if body.startswith(codecs.BOM_UTF8):
+        return body[len(codecs.BOM_UTF8):].decode("utf-8", errors="replace")
+    header = _HEADER_CHARSET.search(content_type or "")
+    meta = _META_CHARSET.search(body[:CHARSET_SNIFF_BYTES])
+    charset = _known_charset(header.group(1) if header else None) or _known_charset(meta.group(1).decode("ascii") if meta else None)
+    if charset:
+        return body.decode(charset, errors="replace")
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        return body.decode("windows-1252", errors="replace")
+
+
+def fetch_html(url: str, timeout: float = 10) -> tuple[str, str]:
+    """
+    Scarica la pagina come byte (al massimo MAX_BODY_BYTES) e la decodifica una
+    volta sola. Restituisce (html, URL finale dopo i redirect).
+    """
+    with session.get(url, headers=BASE_HEADERS, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        body = bytearray()
+        for chunk in resp.iter_content(chunk_size=65536):
+            body.extend(chunk)
+            if len(body) >= MAX_BODY_BYTES:
+                del body[MAX_BODY_BYTES:]
+                break
+        return decode_html(bytes(body), resp.headers.get("Content-Type", "")), resp.url
+
+
+def extract_page(url: str) -> tuple[dict, list[str]]:
+    """
+    Come estrai_info, ma restituisce anche i link della pagina, letti dallo stesso
+    parse dei campi SEO (usato dal crawler).
+    """
+    html, final_url = fetch_html(url)
+    return analyze_html(url, html, final_url)
+
+
+def analyze_html(url: str, html: str, final_url: str | None = None) -> tuple[dict, list[str]]:
+    """Campi SEO e link da un HTML già scaricato (con il fallback di rendering)."""
+    soup = BeautifulSoup(html, "html.parser")
+    content = main_content(soup)
+    rendering = "statico"
+    if needs_rendering(content) and render.available():
+        try:
+            # URL finale: la pagina non ripassa per i redirect già seguiti dal fetch statico
+            rendered = render.get_render_pool().render(final_url or url)
+        except render.RenderError:
+            # Chromium non avviabile o timeout: restano i campi già letti dall'HTML statico
+            rendering = "statico (rendering fallito)"
+        else:
+            soup = BeautifulSoup(rendered, "html.parser")
+            content = main_content(soup)
+            rendering = "browser"
+
+    # Estrazione headings
+    h1 = content.find("h1")
+    h2s = [h.get_text(strip=True) for h in content.find_all("h2")]
+    h3s = [h.get_text(strip=True) for h in content.find_all("h3")]
+    h4s = [h.get_text(strip=True) for h in content.find_all("h4")]
+
+    # Meta SEO globali
+    title_tag = soup.title
+    desc = soup.find("meta", {"name": "description"})
+    canonical = soup.find("link", rel="canonical")
+    robots = soup.find("meta", {"name": "robots"})
+
+    info = {
+        "H1": h1.get_text(strip=True) if h1 else "",
+        "H2": " | ".join(h2s),
+        "H3": " | ".join(h3s),
+        "H4": " | ".join(h4s),
+        "Meta title": title_tag.get_text(strip=True) if title_tag else "",
+        "Meta title length": len(title_tag.get_text(strip=True)) if title_tag else 0,
+        "Meta description": desc["content"].strip() if desc and desc.has_attr("content") else "",
+        "Meta description length": len(desc["content"].strip()) if desc and desc.has_attr("content") else 0,
+        "Canonical": canonical["href"].strip() if canonical and canonical.has_attr("href") else "",
+        "Meta robots": robots["content"].strip() if robots and robots.has_attr("content") else "",
+        "Rendering": rendering,
+    }
+    return info, page_links(soup, final_url or url)
+
+
+def error_info(error: Exception) -> dict:
+    """Riga di risultato per un URL non estraibile."""
+    return {k: (f"Errore: {error}" if not k.endswith("length") else 0) for k in FIELDS}
+
+
+def run_extract_job(params: dict, progress) -> dict:
+    """
+    Job "seo_extract": estrae tutti i campi per ogni URL; la selezione dei campi
+    da mostrare resta alla pagina, così job con gli stessi URL sono condivisi.
+    Gli URL sono elaborati in parallelo sull'executor condiviso (upstream "web"),
+    così anche i rendering si distribuiscono sui browser del pool.
+    Restituisce {"rows": righe, "duplicates": gruppi di duplicati per campo}.
+    """
+    urls = params["urls"]
+    future_to_index = {get_executor().submit("web", estrai_info, url): i for i, url in enumerate(urls)}
+    rows = [None] * len(urls)
+    duplicates = DuplicateIndex()
+    for done, future in enumerate(as_completed(future_to_index), 1):
+        i = future_to_index[future]
+        try:
+            info = future.result()
+        except Exception as e:
+            info = error_info(e)
+        rows[i] = {"URL": urls[i], **info}
+        duplicates.add(i, rows[i])
+        progress(done, len(urls), f"Analizzati {done} di {len(urls)} URL")
+    return {"rows": rows, "duplicates": duplicates.report(rows)}
@@ -0,0 +1,142 @@
+import queue
+import shutil
+import threading
+from concurrent.futures import Future
+
+from pages.common import cassette
+from pages.common.settings import get_setting
+from pages.common.tracing import span
+
+try:
+    from playwright.sync_api import Error as PlaywrightError
+    from playwright.sync_api import TimeoutError as PlaywrightTimeout
+    from playwright.sync_api import sync_playwright
+except ImportError:  # senza Playwright l'estrazione resta solo statica
+    sync_playwright = None
+    PlaywrightError = PlaywrightTimeout = Exception
+
+# Rendering con Chromium headless per le pagine costruite lato client, usato solo
+# quando il fetch statico non trova contenuto principale. Ogni thread del pool
+# possiede un browser con un contesto "caldo" riusato tra gli URL (Playwright sync
+# non è thread-safe): il throughput cresce con render_pool_size.
+# Immagini, font e media non vengono scaricati.
+
+RENDER_ENABLED = get_setting("render_enabled", True)
+POOL_SIZE = get_setting("render_pool_size", 2)
+RENDER_TIMEOUT = get_setting("render_timeout", 15.0)
+# Dopo quante pagine un contesto viene ricreato (limita la memoria di Chromium)
+CONTEXT_MAX_PAGES = get_setting("render_context_max_pages", 50)
+# Chromium di sistema (packages.txt); se assente si usa quello installato da Playwright
+CHROMIUM_PATH = get_setting("chromium_path", "") or shutil.which("chromium") or shutil.which("chromium-browser")
+
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+
+class RenderError(RuntimeError):
+    """Il rendering della pagina non è riuscito."""
+
+
+def available() -> bool:
+    # In replay (cassette) niente rete: il browser non potrebbe caricare la pagina
+    return RENDER_ENABLED and sync_playwright is not None and not cassette.replaying()
+
+
+def _block_heavy_resources(route) -> None:
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        route.abort()
+    else:
+        route.continue_()
+
+
+class _RenderWorker(threading.Thread):
+    """Thread con il proprio browser e un contesto riusato tra le richieste."""
+
+    def __init__(self, tasks: queue.Queue, index: int):
+        super().__init__(daemon=True, name=f"annalect-render-{index}")
+        self._tasks = tasks
+        self._context = None
+        self._pages = 0
+
+    def _new_context(self, browser):
+        if self._context is not None:
+            self._context.close()
+        self._context = browser.new_context(user_agent=USER_AGENT, java_script_enabled=True)
+        self._context.route("**/*", _block_heavy_resources)
+        self._pages = 0
+
+    def _render(self, browser, url: str) -> str:
+        if self._context is None or self._pages >= CONTEXT_MAX_PAGES:
+            self._new_context(browser)
+        self._pages += 1
+        page = self._context.new_page()
+        try:
+            try:
+                page.goto(url, wait_until="networkidle", timeout=RENDER_TIMEOUT * 1000)
+            except PlaywrightTimeout:
+                # Pagine con richieste continue (analytics, long polling): vale il DOM già costruito
+                if page.url == "about:blank":
+                    raise
+            return page.content()
+        finally:
+            page.close()
+
+    def _serve(self, render=None, error: Exception | None = None) -> None:
+        while True:
+            url, future = self._tasks.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+            try:
+                future.set_result(render(url))
+            except PlaywrightError as e:
+                # Contesto potenzialmente compromesso: si ricrea alla prossima richiesta
+                self._pages = CONTEXT_MAX_PAGES
+                future.set_exception(RenderError(str(e).splitlines()[0]))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def run(self) -> None:
+        try:
+            with sync_playwright() as p:
+                browser = p.chromium.launch(executable_path=CHROMIUM_PATH or None, headless=True)
+                self._serve(render=lambda url: self._render(browser, url))
+        except Exception as e:
+            # Browser non avviabile: le richieste falliscono subito invece di restare in attesa
+            self._serve(error=RenderError(f"Avvio di Chromium non riuscito: {e}"))
+
+
+class RenderPool:
+    """Pool di browser headless condiviso dal processo; render() è thread-safe."""
+
+    def __init__(self, size: int = POOL_SIZE):
+        self._tasks: queue.Queue = queue.Queue()
+        self._workers = [_RenderWorker(self._tasks, i) for i in range(max(size, 1))]
+        for worker in self._workers:
+            worker.start()
+
+    def render(self, url: str) -> str:
+        """HTML della pagina dopo l'esecuzione del JavaScript."""
+        future = Future()
+        with span("render", kind="render", target=url) as s:
+            self._tasks.put((url, future))
+            html = future.result()
+            s.set(response_bytes=len(html))
+        return html
+
+
+_pool: RenderPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> RenderPool:
+    """Pool del processo (i browser partono alla prima richiesta)."""
+    global _pool
+    if not available():
+        raise RenderError("Rendering non disponibile: installare playwright")
+    with _pool_lock:
+        if _pool is None:
+            _pool = RenderPool()
+        return _pool
@@ -0,0 +1,214 @@
+import fnmatch
+import zlib
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import date, datetime, timezone
+from typing import BinaryIO, Iterator
+from urllib.parse import urlparse
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+from pages.common.executor import get_executor
+from pages.common.settings import get_setting
+from pages.extractor.duplicates import DuplicateIndex
+from pages.extractor.extract import BASE_HEADERS, error_info, estrai_info, session
+
+# Scoperta degli URL da sitemap e sitemap index (anche annidati e .gz). L'XML è
+# letto in streaming con un parser incrementale: gli elementi già letti vengono
+# rilasciati, così anche sitemap da 50.000 URL non stanno mai interamente in memoria
+# e gli URL arrivano al chiamante mentre il download è ancora in corso.
+
+CHUNK_SIZE = 64 * 1024
+MAX_DEPTH = 3
+# URL in estrazione contemporaneamente mentre la scoperta prosegue
+EXTRACT_WINDOW = get_setting("sitemap_extract_window", 64)
+
+
+class SitemapError(ValueError):
+    """Sitemap non leggibile (XML non valido o formato sconosciuto)."""
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_lastmod(value: str | None) -> datetime | None:
+    """Data W3C (YYYY-MM-DD o ISO 8601 completo) in datetime UTC; None se non valida."""
+    if not value:
+        return None
+    value = value.strip().replace("Z", "+00:00")
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = datetime.combine(date.fromisoformat(value[:10]), datetime.min.time())
+        except ValueError:
+            return None
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+
+
+def _decompressed(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Decomprime al volo i file gzip (riconosciuti dal magic number), altrimenti li passa invariati."""
+    decompressor = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if decompressor is None:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk[:2] == b"\x1f\x8b" else False
+        yield decompressor.decompress(chunk) if decompressor else chunk
+    if decompressor:
+        yield decompressor.flush()
+
+
+def iter_entries(chunks: Iterator[bytes]) -> Iterator[tuple[str, str, str | None]]:
+    """
+    Voci di una sitemap come (tipo, loc, lastmod), dove tipo è "url" (pagina) o
+    "sitemap" (sitemap figlia di un sitemap index).
+    """
+    parser = XMLPullParser(events=("start", "end"))
+    root = None
+    loc = lastmod = None
+    try:
+        for data in _decompressed(chunks):
+            parser.feed(data)
+            for event, elem in parser.read_events():
+                tag = _local(elem.tag)
+                if event == "start":
+                    if root is None:
+                        root = elem
+                        if _local(root.tag) not in ("urlset", "sitemapindex"):
+                            raise SitemapError(f"Formato non riconosciuto: <{_local(root.tag)}>")
+                    continue
+                if tag == "loc":
+                    loc = (elem.text or "").strip()
+                elif tag == "lastmod":
+                    lastmod = (elem.text or "").strip()
+                elif tag in ("url", "sitemap"):
+                    if loc:
+                        yield tag, loc, lastmod
+                    loc = lastmod = None
+                    root.clear()  # rilascia gli elementi già letti
+        parser.close()
+    except ParseError as e:
+        raise SitemapError(f"XML non valido: {e}") from None
+
+
+def fetch_chunks(url: str, timeout: float = 30) -> Iterator[bytes]:
+    """Scarica una sitemap in streaming, a blocchi."""
+    with session.get(url, headers=BASE_HEADERS, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        yield from response.iter_content(chunk_size=CHUNK_SIZE)
+
+
+def file_chunks(fileobj: BinaryIO) -> Iterator[bytes]:
+    """Legge a blocchi una sitemap caricata dall'utente."""
+    while chunk := fileobj.read(CHUNK_SIZE):
+        yield chunk
+
+
+class SitemapFilter:
+    """Filtri sugli URL scoperti: pattern sul path (stile glob) e data minima di lastmod."""
+
+    def __init__(self, include: list[str] | None = None, exclude: list[str] | None = None,
+                 since: datetime | None = None):
+        self.include = [p for p in (include or []) if p]
+        self.exclude = [p for p in (exclude or []) if p]
+        self.since = since
+
+    def fresh(self, lastmod: str | None) -> bool:
+        # Senza lastmod non si può sapere se la pagina è cambiata: si tiene
+        if self.since is None:
+            return True
+        parsed = parse_lastmod(lastmod)
+        return parsed is None or parsed >= self.since
+
+    def accepts(self, url: str, lastmod: str | None) -> bool:
+        path = urlparse(url).path or "/"
+        if self.include and not any(fnmatch.fnmatchcase(path, p) for p in self.include):
+            return False
+        if any(fnmatch.fnmatchcase(path, p) for p in self.exclude):
+            return False
+        return self.fresh(lastmod)
+
+
+def discover_urls(source_url: str | None = None, fileobj: BinaryIO | None = None,
+                  url_filter: SitemapFilter | None = None, max_urls: int | None = None,
+                  errors: list | None = None) -> Iterator[str]:
+    """
+    URL delle pagine da una sitemap o da un sitemap index (URL remoto o file caricato),
+    seguendo le sitemap annidate fino a MAX_DEPTH livelli. Gli URL sono restituiti
+    man mano che vengono letti, senza duplicati. Le sitemap figlie non leggibili
+    vengono saltate e annotate in `errors`.
+    """
+    url_filter = url_filter or SitemapFilter()
+    seen_sitemaps, seen_urls = set(), set()
+    # Pila di (sorgente di chunk, profondità): visita in profondità, una sitemap aperta per livello
+    stack = [(file_chunks(fileobj) if fileobj is not None else fetch_chunks(source_url), 0)]
+    if source_url:
+        seen_sitemaps.add(source_url)
+    while stack:
+        chunks, depth = stack.pop()
+        try:
+            for kind, loc, lastmod in iter_entries(chunks):
+                if kind == "sitemap":
+                    # Una sitemap figlia non modificata dopo "since" non contiene pagine più recenti
+                    if depth < MAX_DEPTH and loc not in seen_sitemaps and url_filter.fresh(lastmod):
+                        seen_sitemaps.add(loc)
+                        stack.append((fetch_chunks(loc), depth + 1))
+                    continue
+                if loc in seen_urls or not url_filter.accepts(loc, lastmod):
+                    continue
+                seen_urls.add(loc)
+                yield loc
+                if max_urls and len(seen_urls) >= max_urls:
+                    return
+        except Exception as e:
+            if depth == 0:
+                raise
+            if errors is not None:
+                errors.append(f"{e}")
+
+
+def run_sitemap_job(params: dict, progress) -> dict:
+    """
+    Job "seo_extract_sitemap": scopre gli URL dalla sitemap (URL o file caricato) e
+    li invia all'estrazione man mano, senza attendere la fine della scoperta.
+    Al massimo EXTRACT_WINDOW URL sono in estrazione contemporaneamente.
+    """
+    url_filter = SitemapFilter(
+        params.get("include"), params.get("exclude"),
+        parse_lastmod(params["since"]) if params.get("since") else None,
+    )
+    errors = []
+    fileobj = open(params["sitemap_file"], "rb") if params.get("sitemap_file") else None
+    executor = get_executor()
+    rows, in_flight = [], {}
+    duplicates = DuplicateIndex()
+    done = 0
+
+    def collect() -> None:
+        nonlocal done
+        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            index, url = in_flight.pop(future)
+            try:
+                info = future.result()
+            except Exception as e:
+                info = error_info(e)
+            rows[index] = {"URL": url, **info}
+            duplicates.add(index, rows[index])
+            done += 1
+            progress(done, len(rows), f"Scoperti {len(rows)} URL, analizzati {done}")
+
+    try:
+        for url in discover_urls(params.get("sitemap_url"), fileobj, url_filter, params.get("max_urls"), errors):
+            rows.append(None)
+            in_flight[executor.submit("web", estrai_info, url)] = (len(rows) - 1, url)
+            if len(in_flight) >= EXTRACT_WINDOW:
+                collect()
+    finally:
+        if fileobj is not None:
+            fileobj.close()
+    while in_flight:
+        collect()
+    if errors:
+        progress(done, len(rows), f"{len(errors)} sitemap annidate non leggibili: {errors[0]}")
+    return {"rows": rows, "duplicates": duplicates.report(rows)}
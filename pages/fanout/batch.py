@@ -0,0 +1,264 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from io import BytesIO
+from itertools import islice
+from pathlib import Path
+from typing import Callable
+
+import google.generativeai as genai
+import pandas as pd
+
+from pages.common import cassette
+from pages.common.executor import get_executor
+from pages.common.json_repair import StreamingJsonParser
+from pages.common.metering import check_budget, record_gemini
+from pages.fanout.prompts import DESTINATION_NAMES, get_blueprint_schema, get_strategic_prompt
+
+MODEL_NAME = "gemini-2.5-pro"
+
+
+class BlueprintError(Exception):
+    """Errore di generazione/parsing di un blueprint; conserva la risposta grezza."""
+
+    def __init__(self, message: str, raw_text: str = ""):
+        super().__init__(message)
+        self.raw_text = raw_text
+
+
+class RateLimiter:
+    """
+    Limita le partenze a `requests_per_minute`, distribuendole in modo uniforme.
+    Thread-safe: ogni chiamata a wait() prenota il prossimo slot libero.
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+def usage_to_dict(usage) -> dict:
+    """Converte lo usage_metadata di Gemini in un dict serializzabile."""
+    if usage is None:
+        return {}
+    return {
+        "prompt_token_count": getattr(usage, "prompt_token_count", None),
+        "candidates_token_count": getattr(usage, "candidates_token_count", None),
+        "total_token_count": getattr(usage, "total_token_count", None),
+    }
+
+
+def generate_blueprint(query: str, industry: str, exclude_brands: bool, destination_code: str,
+                       model_name: str = MODEL_NAME):
+    """
+    Esegue una singola generazione del blueprint in modalità JSON strutturata
+    (response_mime_type + response_schema) e in streaming: ogni chunk alimenta un
+    parser tollerante, così un JSON leggermente malformato o una risposta interrotta
+    a metà restituiscono comunque l'oggetto parziale invece di una nuova generazione.
+    Restituisce (data, usage_metadata); solleva BlueprintError se non è recuperabile nulla.
+    """
+    check_budget()
+    prompt = get_strategic_prompt(destination_code, query, industry, exclude_brands)
+    model = genai.GenerativeModel(model_name)
+    generation_config = genai.types.GenerationConfig(
+        temperature=0.7,
+        response_mime_type="application/json",
+        response_schema=get_blueprint_schema(destination_code),
+    )
+
+    parser = StreamingJsonParser()
+    raw_parts = []
+    response = None
+    try:
+        response = cassette.generate_content(model, model_name, prompt, generation_config=generation_config, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # chunk senza parti (es. solo finish_reason)
+                continue
+            raw_parts.append(text)
+            parser.feed(text)
+    except Exception as e:
+        if not raw_parts:
+            raise
+        stream_error = e
+    else:
+        stream_error = None
+
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        record_gemini(model_name, usage)
+
+    raw_response_text = "".join(raw_parts)
+    data = parser.value()
+    if not isinstance(data, dict) or "strategic_blueprint" not in data:
+        message = f"Risposta non valida: {stream_error}" if stream_error else "Risposta JSON non valida"
+        raise BlueprintError(message, raw_response_text)
+    return data, usage
+
+
+def job_key(query: str, destination_code: str, industry: str, exclude_brands: bool) -> str:
+    """Chiave stabile di un job, usata per la ripresa dopo un errore."""
+    payload = json.dumps([query.strip().lower(), destination_code, industry or "", bool(exclude_brands)])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def batch_id(jobs: list[dict], industry: str, exclude_brands: bool) -> str:
+    """Identificativo del batch: stesse query/destinazioni/impostazioni -> stesso file di output."""
+    keys = sorted(job_key(j["query"], j["destination"], industry, exclude_brands) for j in jobs)
+    return hashlib.sha1("|".join(keys).encode("utf-8")).hexdigest()[:12]
+
+
+def load_completed_keys(output_path: Path) -> set[str]:
+    """Legge il JSONL di output e restituisce le chiavi dei job già completati con successo."""
+    done = set()
+    if not output_path.exists():
+        return done
+    with output_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Riga troncata da un'interruzione: il job verrà rieseguito
+                continue
+            if record.get("status") == "ok":
+                done.add(record.get("key"))
+    return done
+
+
+def run_batch(jobs: list[dict], output_path: Path, industry: str = "", exclude_brands: bool = False,
+              max_concurrency: int = 4, requests_per_minute: float = 60,
+              on_result: Callable[[int, int, dict], None] | None = None,
+              model_name: str = MODEL_NAME) -> dict:
+    """
+    Genera i blueprint per una lista di job {"query": ..., "destination": <codice>}.
+    - max_concurrency: numero massimo di chiamate Gemini in parallelo per questo batch
+      (l'executor condiviso può ridurle se Gemini rallenta o restituisce errori).
+    - requests_per_minute: rate limit complessivo sulle partenze.
+    - I risultati vengono appesi a `output_path` (JSONL) appena disponibili;
+      i job già presenti con status "ok" vengono saltati (ripresa).
+    - on_result(completati, totale, record) viene invocato nel thread chiamante.
+    Restituisce un riepilogo con i conteggi.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    completed = load_completed_keys(output_path)
+
+    pending, seen = [], set(completed)
+    for job in jobs:
+        key = job_key(job["query"], job["destination"], industry, exclude_brands)
+        if key in seen:
+            continue
+        seen.add(key)
+        pending.append({**job, "key": key})
+
+    summary = {"total": len(pending) + len(completed), "skipped": len(completed), "ok": 0, "errors": 0}
+    if not pending:
+        return summary
+
+    limiter = RateLimiter(requests_per_minute)
+    write_lock = threading.Lock()
+
+    def _run(job: dict) -> dict:
+        limiter.wait()
+        started = time.monotonic()
+        record = {
+            "key": job["key"],
+            "query": job["query"],
+            "destination": job["destination"],
+            "destination_name": DESTINATION_NAMES.get(job["destination"], job["destination"]),
+        }
+        try:
+            data, usage = generate_blueprint(job["query"], industry, exclude_brands, job["destination"], model_name)
+            record.update({"status": "ok", "blueprint": data, "usage": usage_to_dict(usage)})
+        except BlueprintError as e:
+            record.update({"status": "error", "error": str(e), "raw_text": e.raw_text})
+        except Exception as e:
+            record.update({"status": "error", "error": str(e)})
+        record["elapsed_s"] = round(time.monotonic() - started, 2)
+
+        line = json.dumps(record, ensure_ascii=False)
+        with write_lock, output_path.open("a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        return record
+
+    # Executor condiviso (upstream "gemini", concorrenza adattiva): al massimo
+    # max_concurrency job del batch in corso, gli altri vengono inviati man mano
+    executor = get_executor()
+    queue = iter(pending)
+    in_flight = {executor.submit("gemini", _run, job) for job in islice(queue, max(1, int(max_concurrency)))}
+    done_count = summary["skipped"]
+    while in_flight:
+        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            record = future.result()
+            done_count += 1
+            summary["ok" if record["status"] == "ok" else "errors"] += 1
+            if on_result:
+                on_result(done_count, summary["total"], record)
+            next_job = next(queue, None)
+            if next_job is not None:
+                in_flight.add(executor.submit("gemini", _run, next_job))
+
+    return summary
+
+
+def read_results(output_path: Path) -> list[dict]:
+    """Legge i risultati del batch tenendo, per ogni job, l'ultimo record scritto."""
+    records = {}
+    if not Path(output_path).exists():
+        return []
+    with Path(output_path).open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Un "ok" successivo sostituisce un eventuale errore precedente, mai il contrario
+            previous = records.get(record.get("key"))
+            if previous is None or previous.get("status") != "ok":
+                records[record.get("key")] = record
+    return list(records.values())
+
+
+def results_to_xlsx(output_path: Path) -> bytes:
+    """
+    Appiattisce i blueprint del batch in un foglio Excel:
+    una riga per elemento (Query, Destinazione, Sezione, Titolo, Dettaglio).
+    """
+    rows = []
+    for record in read_results(output_path):
+        base = {"Query": record.get("query"), "Destinazione": record.get("destination_name")}
+        if record.get("status") != "ok":
+            rows.append({**base, "Sezione": "ERRORE", "Titolo": "", "Dettaglio": record.get("error", "")})
+            continue
+        blueprint = (record.get("blueprint") or {}).get("strategic_blueprint", {})
+        for section, items in blueprint.items():
+            for item in items if isinstance(items, list) else []:
+                values = list(item.values()) if isinstance(item, dict) else [item]
+                rows.append({
+                    **base,
+                    "Sezione": section,
+                    "Titolo": values[0] if values else "",
+                    "Dettaglio": values[1] if len(values) > 1 else "",
+                })
+
+    buf = BytesIO()
+    df = pd.DataFrame(rows, columns=["Query", "Destinazione", "Sezione", "Titolo", "Dettaglio"])
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="Blueprint")
+    buf.seek(0)
+    return buf.getvalue()
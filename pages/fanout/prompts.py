@@ -0,0 +1,110 @@
+# Destinazioni disponibili: etichetta mostrata in UI -> codice usato nei prompt
+DESTINATION_MAP = {
+    "Articolo del Blog (Pillar Page)": "BLOG_POST",
+    "Landing Page di Conversione": "LANDING_PAGE",
+    "PLP (Pagina Elenco Prodotti)": "PLP",
+    "PDP (Pagina Dettaglio Prodotto)": "PDP"
+}
+DESTINATION_NAMES = {code: name for name, code in DESTINATION_MAP.items()}
+
+# Mappatura dei nomi delle sezioni per chiarezza
+STRUCTURE_NAME_MAP = {
+    "BLOG_POST": "Pillar Page Structure",
+    "LANDING_PAGE": "Core Landing Page Content Structure",
+    "PLP": "PLP On-Page Content Structure",
+    "PDP": "PDP Content Enhancement Structure"
+}
+
+CLUSTER_NAME_MAP = {
+    "BLOG_POST": "Cluster Content Ideas (Supporting Articles)",
+    "LANDING_PAGE": "Supporting Assets (e.g., Case Studies, Webinars)",
+    "PLP": "Supporting Content to Link from PLP",
+    "PDP": "Supporting Content to build trust (e.g., a detailed review)"
+}
+
+
+def get_strategic_prompt(destination_code, query, industry, exclude_brands, destination_name=None):
+    """
+    Costruisce un prompt dinamico che mantiene la struttura a 3 pilastri,
+    ma adatta la "persona" e le istruzioni in base alla destinazione scelta.
+    """
+    if destination_name is None:
+        destination_name = DESTINATION_NAMES.get(destination_code, destination_code)
+    
+    # Mappatura delle personalizzazioni
+    persona_map = {
+        "BLOG_POST": "You are an 'Expert SEO & AI Content Architect'. Your mission is to create a content strategy to build topical authority and dominate organic search.",
+        "LANDING_PAGE": "You are a 'Direct Response Copywriter & Conversion Rate Optimization (CRO) Specialist'. Your goal is to design a high-converting landing page strategy that persuades users to take action.",
+        "PLP": "You are an 'E-commerce SEO & UX Specialist'. Your task is to provide a strategy to optimize an existing Product Listing Page (PLP) to improve rankings and user experience.",
+        "PDP": "You are an 'E-commerce Product Merchandiser & Copywriter'. Your goal is to create a blueprint to enrich a Product Detail Page (PDP), answer all user questions, and drive sales."
+    }
+    
+    # Seleziona la personalizzazione corretta, con un default sicuro
+    persona = persona_map.get(destination_code, persona_map["BLOG_POST"])
+    structure_name = STRUCTURE_NAME_MAP.get(destination_code, "Core Content Structure")
+    cluster_name = CLUSTER_NAME_MAP.get(destination_code, "Supporting Content Ideas")
+    
+    brand_instruction = "IMPORTANT CONSTRAINT: Do NOT mention any commercial brands." if exclude_brands else "You can mention relevant brand names."
+    industry_context = f"The user is in the '{industry}' sector. All recommendations must be tailored to this context." if industry else ""
+
+    # Costruzione del prompt finale
+    return (
+        f"{persona}\n\n"
+        f"**User Query/Topic:** \"{query}\"\n"
+        f"**Content Destination:** \"{destination_name}\"\n"
+        f"{industry_context}\n{brand_instruction}\n\n"
+        f"**Your Task:** Generate a complete strategic blueprint in a valid JSON format ONLY. Do not include any text before or after the JSON object. The blueprint must have three main keys, adapting their content to the chosen destination:\n\n"
+        f"1.  **`core_content_structure`**: Outline the sections of the main content. The title of this section in your output should be '{structure_name}'. Each item must have `section_title` and `content_to_include`.\n"
+        f"2.  **`supporting_content_ideas`**: Propose 2-4 supporting assets. The title of this section should be '{cluster_name}'. Each item must have `asset_title` and `strategic_goal`.\n"
+        f"3.  **`technical_and_ecommerce_recommendations`**: Provide 2-4 actionable recommendations for the website. Each item must have `recommendation_type` and `actionable_step`.\n\n"
+        f"**JSON Format:**\n"
+        "{\n"
+        f"  \"strategic_blueprint\": {{\n"
+        f"    \"{structure_name}\": [\n"
+        "      { \"section_title\": \"...\", \"content_to_include\": \"...\" }\n"
+        "    ],\n"
+        f"    \"{cluster_name}\": [\n"
+        "      { \"asset_title\": \"...\", \"strategic_goal\": \"...\" }\n"
+        "    ],\n"
+        f"    \"Technical and E-commerce Recommendations\": [\n"
+        "      { \"recommendation_type\": \"...\", \"actionable_step\": \"...\" }\n"
+        "    ]\n"
+        "  }\n"
+        "}"
+    )
+
+
+def get_blueprint_schema(destination_code):
+    """
+    Restituisce lo schema di risposta (response_schema di Gemini) del blueprint,
+    con le stesse chiavi di sezione richieste dal prompt per la destinazione.
+    """
+    structure_name = STRUCTURE_NAME_MAP.get(destination_code, "Core Content Structure")
+    cluster_name = CLUSTER_NAME_MAP.get(destination_code, "Supporting Content Ideas")
+
+    def _items(*fields):
+        return {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {field: {"type": "string"} for field in fields},
+                "required": list(fields),
+            },
+        }
+
+    sections = {
+        structure_name: _items("section_title", "content_to_include"),
+        cluster_name: _items("asset_title", "strategic_goal"),
+        "Technical and E-commerce Recommendations": _items("recommendation_type", "actionable_step"),
+    }
+    return {
+        "type": "object",
+        "properties": {
+            "strategic_blueprint": {
+                "type": "object",
+                "properties": sections,
+                "required": list(sections),
+            }
+        },
+        "required": ["strategic_blueprint"],
+    }
@@ -0,0 +1,67 @@
+from html import escape
+
+from bs4 import BeautifulSoup
+
+# Modello del contenuto di un competitor: lista di sezioni
+#   {"level": 2, "heading": "Titolo sezione", "paragraphs": ["testo", ...]}
+# Testo semplice, headings e HTML per l'editor Quill sono derivati da qui
+# solo quando servono, senza round-trip HTML -> BeautifulSoup -> testo.
+
+
+def build_sections(main_topic: list) -> list[dict]:
+    """Converte il 'main_topic' di DataForSEO (content_parsing) in una lista di sezioni."""
+    sections = []
+    for section in main_topic:
+        heading = (section.get('h_title') or "").strip()
+        paragraphs = []
+        primary_content_list = section.get('primary_content')
+        if isinstance(primary_content_list, list):
+            for item in primary_content_list:
+                text = (item.get("text") or "").strip()
+                if text:
+                    paragraphs.append(text)
+        if heading or paragraphs:
+            sections.append({"level": section.get('level', 2) or 2, "heading": heading, "paragraphs": paragraphs})
+    return sections
+
+
+def sections_to_html(sections: list[dict]) -> str:
+    """HTML (h2/h3/.. + p) da caricare nell'editor Quill."""
+    parts = []
+    for section in sections:
+        if section["heading"]:
+            level = section["level"]
+            parts.append(f"<h{level}>{escape(section['heading'])}</h{level}>")
+        parts.extend(f"<p>{escape(text)}</p>" for text in section["paragraphs"])
+    return "".join(parts)
+
+
+def sections_to_text(sections: list[dict]) -> str:
+    """Testo semplice, una riga per heading o paragrafo."""
+    lines = []
+    for section in sections:
+        if section["heading"]:
+            lines.append(section["heading"])
+        lines.extend(section["paragraphs"])
+    return "\n".join(lines)
+
+
+def sections_headings(sections: list[dict]) -> list[str]:
+    """Headings nel formato 'H2: Titolo'."""
+    return [f"H{s['level']}: {s['heading']}" for s in sections if s["heading"]]
+
+
+def html_to_text(html: str) -> str:
+    """Testo semplice da un HTML modificato dall'utente nell'editor."""
+    return BeautifulSoup(html or "", "html.parser").get_text(separator="\n", strip=True)
+
+
+def competitor_texts(parsed_contents: list[dict], edited_html: dict) -> list[str]:
+    """
+    Testo di ciascun competitor: dall'HTML modificato in Quill se presente,
+    altrimenti direttamente dalle sezioni estratte.
+    """
+    return [
+        html_to_text(edited_html[i]) if i in edited_html else sections_to_text(content["sections"])
+        for i, content in enumerate(parsed_contents)
+    ]
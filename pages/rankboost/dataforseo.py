@@ -0,0 +1,204 @@
+import os
+import sqlite3
+from concurrent.futures import as_completed
+
+import requests
+import streamlit as st
+
+from pages.common.executor import get_executor
+from pages.common.http import TracedSession
+from pages.common.metering import cached_call, check_budget, record_dataforseo
+from pages.common.singleflight import single_flight
+from pages.common.tracing import span
+from pages.common.urls import clean_url
+from pages.rankboost.content import build_sections
+from pages.rankboost.images import fetch_main_image_url, thumbnail_data_uri
+from pages.rankboost.serp_history import AIO_TYPES, record_snapshot
+
+# Chiamate DataForSEO della Rank Booster Analysis, usate sia dalla pagina sia dal
+# job "rankboost_collect" eseguito dai worker (pages/common/jobs.py).
+# @single_flight sotto @st.cache_data: miss concorrenti della cache con gli stessi
+# argomenti (es. due analisti sulla stessa query) producono una sola chiamata a monte.
+
+
+class DataForSEOError(RuntimeError):
+    """Errore restituito dall'API DataForSEO (o risposta senza risultati)."""
+
+
+def _credentials() -> tuple[str, str] | None:
+    try:
+        return (st.secrets["dataforseo"]["username"], st.secrets["dataforseo"]["password"])
+    except (KeyError, FileNotFoundError):
+        user, password = os.environ.get("DATAFORSEO_USERNAME"), os.environ.get("DATAFORSEO_PASSWORD")
+        return (user, password) if user and password else None
+
+
+# Sessione HTTP globale per riutilizzo connessioni (con uno span per ogni chiamata)
+session = TracedSession()
+session.auth = _credentials()
+
+
+def has_credentials() -> bool:
+    return session.auth is not None
+
+
+@st.cache_data(ttl=600, show_spinner="Analisi SERP in corso...")
+@single_flight
+def fetch_serp_data(query: str, location_code: int, language_code: str) -> dict:
+    """
+    Esegue la chiamata API a DataForSEO con la struttura del payload corretta e definitiva.
+    Solleva DataForSEOError se la chiamata fallisce o non restituisce risultati.
+    """
+    post_data = [{
+        "keyword": query,
+        "location_code": location_code,
+        "language_code": language_code,
+        "device": "desktop",
+        "os": "windows",
+        "depth": 11,
+        "load_async_ai_overview": True,
+        "people_also_ask_click_depth": 4
+    }]
+    try:
+        response = session.post("https://api.dataforseo.com/v3/serp/google/organic/live/advanced", json=post_data)
+        response.raise_for_status()
+        data = response.json()
+        record_dataforseo("serp_organic", data)
+
+    except requests.RequestException as e:
+        raise DataForSEOError(f"Errore chiamata a DataForSEO: {e}") from e
+
+    if data.get("tasks_error", 0) > 0:
+        messages = "; ".join(t.get("status_message", "") for t in data.get("tasks", []))
+        raise DataForSEOError(f"DataForSEO ha restituito un errore nel task: {messages}")
+    if not data.get("tasks") or not data["tasks"][0].get("result"):
+        raise DataForSEOError("Risposta da DataForSEO non valida o senza risultati.")
+    result = data["tasks"][0]["result"][0]
+    # Solo le chiamate reali (non le risposte in cache) finiscono nello storico delle SERP
+    try:
+        record_snapshot(query, location_code, language_code, result)
+    except sqlite3.Error:
+        pass
+    return result
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+@single_flight
+def parse_url_content(url: str) -> dict:
+    """Estrae il 'main_topic' di una pagina come lista di sezioni (vedi pages/rankboost/content.py)."""
+    default_return = {"sections": []}
+    if not url or url.lower().endswith('.pdf'):
+        return default_return
+
+    post_data = [{"url": url, "enable_javascript": True, "enable_xhr": True, "disable_cookie_popup": True}]
+    try:
+        with span("content_parsing", kind="fetch", target=url):
+            response = session.post("https://api.dataforseo.com/v3/on_page/content_parsing/live", json=post_data)
+        response.raise_for_status()
+        data = response.json()
+        record_dataforseo("content_parsing", data)
+
+        if data.get("tasks_error", 0) > 0 or not data.get("tasks") or not data["tasks"][0].get("result"):
+            return default_return
+
+        result_list = data["tasks"][0].get("result")
+        if not result_list: return default_return
+
+        items_list = result_list[0].get("items")
+        if not items_list: return default_return
+
+        page_content = items_list[0].get("page_content")
+        if not page_content: return default_return
+
+        main_topic_data = page_content.get('main_topic')
+        if not isinstance(main_topic_data, list): return default_return
+
+        with span("build_sections", kind="parse", target=url):
+            return {"sections": build_sections(main_topic_data)}
+    except (requests.RequestException, KeyError, IndexError, TypeError):
+        return default_return
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+@single_flight
+def fetch_ranked_keywords(url: str, location_name: str, language_name: str) -> dict:
+    """Estrae le keyword posizionate."""
+    payload = [{"target": url, "location_name": location_name, "language_name": language_name, "limit": 30}]
+    try:
+        with span("ranked_keywords", kind="fetch", target=url):
+            response = session.post("https://api.dataforseo.com/v3/dataforseo_labs/google/ranked_keywords/live", json=payload)
+        response.raise_for_status()
+        data = response.json()
+        record_dataforseo("ranked_keywords", data)
+        if data.get("tasks_error", 0) > 0 or not data.get("tasks") or not data["tasks"][0].get("result"):
+            error_message = data.get("tasks",[{}])[0].get("status_message", "N/A")
+            return {"url": url, "status": "failed", "error": error_message, "items": []}
+
+        api_items = data["tasks"][0]["result"][0].get("items")
+        return {"url": url, "status": "ok", "items": api_items if api_items is not None else []}
+    except requests.RequestException as e:
+        return {"url": url, "status": "failed", "error": str(e), "items": []}
+
+
+def source_image(url: str) -> str | None:
+    """Miniatura (data URI) dell'immagine principale di una fonte AIO."""
+    return thumbnail_data_uri(fetch_main_image_url(url))
+
+
+def run_collect_job(params: dict, progress) -> dict:
+    """
+    Job "rankboost_collect": SERP, contenuti dei competitor, immagini delle fonti AIO
+    e ranked keywords (fasi 1-2 dell'analisi), eseguito in un processo worker.
+    """
+    query, location_name, language_name = params["query"], params["location_name"], params["language_name"]
+    check_budget()
+    progress(0, 1, "Fase 1/5: Analizzo la SERP (attendo le AIO, può richiedere più tempo)...")
+    with span("Fase 1 · SERP", kind="phase", target=query):
+        serp_result = cached_call("dataforseo", "serp_organic", fetch_serp_data, query, params["location_code"], params["language_code"])
+
+    items = serp_result.get('items', [])
+    organic_urls = [item.get("url") for item in items if item.get("type") == "organic" and item.get("url")]
+    ai_overview = next((item for item in items if item.get("type") in AIO_TYPES), None)
+    image_urls = [ref.get("url") for ref in (ai_overview or {}).get("references", []) if ref.get("url")]
+    # URL che coincidono dopo clean_url (es. stessa pagina con parametri diversi) sono interrogati una volta sola
+    ranking_urls = list(dict.fromkeys(clean_url(url) for url in organic_urls))
+
+    total = 1 + len(organic_urls) + len(image_urls) + len(ranking_urls)
+    done = 1
+    progress(done, total, f"Fase 1.5/5: Estraggo i contenuti di {len(organic_urls)} pagine...")
+
+    # Executor condiviso: la concorrenza per DataForSEO e per i siti esterni si adatta
+    # a latenza ed errori osservati (pages/common/executor.py)
+    executor = get_executor()
+    check_budget()
+    with span("Fase 1.5 · Contenuti competitor", kind="phase"):
+        future_to_url = {executor.submit("dataforseo", cached_call, "dataforseo", "content_parsing", parse_url_content, url): url for url in organic_urls}
+        contents = {}
+        for future in as_completed(future_to_url):
+            contents[future_to_url[future]] = future.result()
+            done += 1
+            progress(done, total, f"Fase 1.5/5: Estraggo i contenuti di {len(organic_urls)} pagine...")
+
+    with span("Fase 1.6 · Immagini AIO", kind="phase"):
+        future_to_url = {executor.submit("web", source_image, url): url for url in image_urls}
+        images = {}
+        for future in as_completed(future_to_url):
+            images[future_to_url[future]] = future.result()
+            done += 1
+            progress(done, total, f"Fase 1.6/5: Estraggo le immagini per {len(image_urls)} fonti AIO...")
+
+    check_budget()
+    with span("Fase 2 · Ranked keywords", kind="phase"):
+        futures = [executor.submit("dataforseo", cached_call, "dataforseo", "ranked_keywords", fetch_ranked_keywords, url, location_name, language_name) for url in ranking_urls]
+        ranked = []
+        for future in as_completed(futures):
+            ranked.append(future.result())
+            done += 1
+            progress(done, total, f"Fase 2/5: Scopro le keyword di {len(ranking_urls)} competitor...")
+
+    return {
+        "serp_result": serp_result,
+        "parsed_contents": [contents.get(url, {"sections": []}) for url in organic_urls],
+        "aio_source_images": images,
+        "ranked_keywords_results": ranked,
+    }
@@ -0,0 +1,144 @@
+import base64
+import hashlib
+import os
+import re
+import threading
+from io import BytesIO
+from urllib.parse import urljoin
+
+import requests
+import streamlit as st
+from bs4 import BeautifulSoup
+
+from pages.common.http import TracedSession
+from pages.common.settings import data_path, get_setting
+from pages.common.singleflight import single_flight
+from pages.common.tracing import span
+
+try:
+    from PIL import Image
+except ImportError:  # senza Pillow si usa direttamente l'URL remoto dell'immagine
+    Image = None
+
+# Immagini delle fonti AI Overview: dell'HTML si scarica solo la <head> (dove stanno
+# og:image/twitter:image) e l'immagine viene ridotta a miniatura, salvata in una cache
+# locale LRU e servita come data URI, invece di far caricare al browser l'originale.
+
+BROWSER_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+MAX_HEAD_BYTES = 256 * 1024
+MAX_IMAGE_BYTES = get_setting("thumbnail_max_source_bytes", 8 * 1024 * 1024)
+THUMBNAIL_SIZE = (320, 200)
+THUMBNAIL_QUALITY = 70
+THUMBNAIL_CACHE_ENTRIES = get_setting("thumbnail_cache_entries", 2000)
+
+session = TracedSession()
+
+_HEAD_END = re.compile(rb"</head\s*>|<body[\s>]", re.IGNORECASE)
+_evict_lock = threading.Lock()
+
+
+def fetch_head_html(url: str, timeout: float = 5) -> str:
+    """
+    Scarica in streaming solo l'inizio della pagina, fino a </head> (o <body>),
+    senza superare MAX_HEAD_BYTES.
+    """
+    with session.get(url, timeout=timeout, headers=BROWSER_HEADERS, stream=True) as response:
+        response.raise_for_status()
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=8192):
+            buffer.extend(chunk)
+            match = _HEAD_END.search(buffer, max(0, len(buffer) - len(chunk) - 16))
+            if match:
+                del buffer[match.start():]
+                break
+            if len(buffer) >= MAX_HEAD_BYTES:
+                break
+        encoding = response.encoding if "charset" in response.headers.get("Content-Type", "").lower() else None
+    return bytes(buffer).decode(encoding or "utf-8", errors="replace")
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+@single_flight
+def fetch_main_image_url(url: str) -> str | None:
+    """Tenta di estrarre l'immagine principale (og:image) da un URL."""
+    if not url:
+        return None
+    try:
+        with span("fetch_main_image", kind="fetch", target=url) as s:
+            head_html = fetch_head_html(url)
+            s.set(response_bytes=len(head_html))
+        with span("parse_main_image", kind="parse", target=url):
+            soup = BeautifulSoup(head_html, 'html.parser')
+
+        og_image = soup.find("meta", property="og:image")
+        if og_image and og_image.get("content"):
+            return urljoin(url, og_image["content"])
+
+        twitter_image = soup.find("meta", attrs={"name": "twitter:image"})
+        if twitter_image and twitter_image.get("content"):
+            return urljoin(url, twitter_image["content"])
+
+    except requests.RequestException:
+        return None
+    return None
+
+
+def _thumbnail_path(image_url: str):
+    return data_path("thumbnails", hashlib.sha1(image_url.encode("utf-8")).hexdigest() + ".jpg")
+
+
+def _evict_thumbnails(directory) -> None:
+    """Mantiene al massimo THUMBNAIL_CACHE_ENTRIES miniature, eliminando le meno usate."""
+    with _evict_lock:
+        entries = list(os.scandir(directory))
+        if len(entries) <= THUMBNAIL_CACHE_ENTRIES:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - THUMBNAIL_CACHE_ENTRIES]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _make_thumbnail(image_url: str) -> bytes:
+    with session.get(image_url, timeout=5, headers=BROWSER_HEADERS, stream=True) as response:
+        response.raise_for_status()
+        raw = bytearray()
+        for chunk in response.iter_content(chunk_size=65536):
+            raw.extend(chunk)
+            if len(raw) > MAX_IMAGE_BYTES:
+                raise ValueError("Immagine troppo grande")
+    with Image.open(BytesIO(raw)) as image:
+        image.draft("RGB", THUMBNAIL_SIZE)  # decodifica ridotta per i JPEG
+        image = image.convert("RGB")
+        image.thumbnail(THUMBNAIL_SIZE)
+        out = BytesIO()
+        image.save(out, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+@single_flight
+def thumbnail_data_uri(image_url: str | None) -> str | None:
+    """
+    Miniatura JPEG dell'immagine come data URI, dalla cache locale se presente.
+    Se Pillow non è installato o la riduzione fallisce restituisce l'URL originale.
+    """
+    if not image_url or Image is None or image_url.startswith("data:"):
+        return image_url
+    path = _thumbnail_path(image_url)
+    try:
+        data = path.read_bytes()
+        os.utime(path)  # aggiorna l'ordine LRU
+    except OSError:
+        try:
+            with span("thumbnail", kind="fetch", target=image_url) as s:
+                data = _make_thumbnail(image_url)
+                s.set(response_bytes=len(data))
+        except (requests.RequestException, OSError, ValueError, Image.DecompressionBombError):
+            return image_url
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        _evict_thumbnails(path.parent)
+    return "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
@@ -0,0 +1,149 @@
+import json
+import re
+from functools import cached_property
+
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # fallback sulla libreria standard
+    orjson = None
+
+# Schema dichiarato del JSON di analisi: chiave -> tipo atteso.
+# Le chiavi in REQUIRED_KEYS devono essere presenti; le altre sono opzionali.
+ANALYSIS_SCHEMA = {
+    "query": str,
+    "country": str,
+    "language": str,
+    "organic": list,
+    "people_also_ask": list,
+    "related_searches": list,
+    "analysis_strategica": list,
+    "common_ground": list,
+    "content_gap": list,
+    "keyword_mining": list,
+}
+REQUIRED_KEYS = ("query",)
+
+# Campi attesi negli elementi delle liste di oggetti
+ITEM_FIELDS = {
+    "organic": ("URL",),
+    "analysis_strategica": ("Caratteristica SEO", "Analisi Sintetica"),
+    "keyword_mining": ("Categoria Keyword", "Keywords / Concetti / Domande"),
+}
+
+
+def strategic_records(df: pd.DataFrame | None) -> list[dict]:
+    """
+    Righe della tabella di analisi strategica per l'export, con le colonne attese
+    da ITEM_FIELDS: se Gemini ha usato intestazioni diverse si rinominano le prime due.
+    """
+    fields = list(ITEM_FIELDS["analysis_strategica"])
+    if df is None or df.empty or len(df.columns) < len(fields):
+        return []
+    if not all(f in df.columns for f in fields):
+        df = df.rename(columns=dict(zip(df.columns[:len(fields)], fields)))
+    return df.to_dict("records")
+
+
+class AnalysisValidationError(ValueError):
+    """Il JSON non rispetta lo schema dell'analisi; `errors` contiene i dettagli."""
+
+    def __init__(self, errors: list[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def clean_label(raw_label):
+    """Pulisce le etichette per la visualizzazione (rimuove il grassetto Markdown)."""
+    return re.sub(r'\*+', '', raw_label or "").strip()
+
+
+def loads(raw: bytes | str):
+    """Parsing JSON con orjson se disponibile, altrimenti con json della libreria standard."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def validate_analysis(data) -> list[str]:
+    """Valida il dict rispetto ad ANALYSIS_SCHEMA e restituisce la lista degli errori."""
+    if not isinstance(data, dict):
+        return ["Il JSON deve essere un oggetto con le chiavi dell'analisi."]
+    errors = [f"Chiave obbligatoria mancante: '{key}'" for key in REQUIRED_KEYS if key not in data]
+    for key, expected in ANALYSIS_SCHEMA.items():
+        value = data.get(key)
+        if value is not None and not isinstance(value, expected):
+            errors.append(f"'{key}' deve essere di tipo {expected.__name__}, trovato {type(value).__name__}")
+    for key, fields in ITEM_FIELDS.items():
+        items = data.get(key)
+        if not isinstance(items, list):
+            continue
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append(f"'{key}[{i}]' deve essere un oggetto")
+                break
+            missing = [f for f in fields if f not in item]
+            if missing:
+                errors.append(f"'{key}[{i}]' senza i campi: {', '.join(missing)}")
+                break
+    return errors
+
+
+class AnalysisData:
+    """
+    Analisi caricata una sola volta: il dict originale più le viste usate dai vari
+    step, costruite alla prima richiesta e poi memoizzate sull'oggetto (che vive in
+    st.session_state), così cambiare step non rielabora il JSON.
+    """
+
+    def __init__(self, data: dict):
+        self.raw = data
+
+    def get(self, key, default=None):
+        return self.raw.get(key, default)
+
+    @cached_property
+    def analysis_map(self) -> dict:
+        return {
+            clean_label(item.get("Caratteristica SEO", "")): clean_label(item.get("Analisi Sintetica", ""))
+            for item in self.raw.get("analysis_strategica", [])
+        }
+
+    def _selectable_df(self, key: str) -> pd.DataFrame:
+        df = pd.DataFrame(self.raw.get(key, []))
+        if not df.empty:
+            df.insert(0, "Seleziona", False)
+        return df
+
+    @cached_property
+    def common_ground_df(self) -> pd.DataFrame:
+        return self._selectable_df("common_ground")
+
+    @cached_property
+    def content_gap_df(self) -> pd.DataFrame:
+        return self._selectable_df("content_gap")
+
+    @cached_property
+    def keyword_groups(self) -> list[tuple[str, list[str]]]:
+        """Coppie (categoria, keyword) dalla sezione keyword_mining."""
+        return [
+            (
+                clean_label(entry.get("Categoria Keyword", "")),
+                [k.strip(" `") for k in entry.get("Keywords / Concetti / Domande", "").split(",")],
+            )
+            for entry in self.raw.get("keyword_mining", [])
+        ]
+
+
+def load_analysis_data(raw: bytes | str | dict) -> AnalysisData:
+    """
+    Esegue parsing (se necessario) e validazione di un'analisi.
+    Solleva json.JSONDecodeError se il JSON non è valido e
+    AnalysisValidationError se non rispetta lo schema.
+    """
+    data = raw if isinstance(raw, dict) else loads(raw)
+    errors = validate_analysis(data)
+    if errors:
+        raise AnalysisValidationError(errors)
+    return AnalysisData(data)
@@ -0,0 +1,191 @@
+import hashlib
+import re
+from concurrent.futures import as_completed
+
+import google.generativeai as genai
+import pandas as pd
+import streamlit as st
+
+from pages.common import cassette
+from pages.common.executor import get_executor
+from pages.common.metering import cached_call, check_budget, mark_call, record_gemini
+from pages.common.settings import get_setting
+from pages.common.singleflight import single_flight
+from pages.common.tracing import span
+from pages.rankboost.prompts import MAP_NOTES_HEADER, get_competitiva_prompt, get_competitor_map_prompt
+
+DEFAULT_MODEL = "gemini-2.5-pro"
+# Modello più economico/veloce per la fase "map" per competitor
+MAP_MODEL = get_setting("nlu_map_model", "gemini-2.5-flash")
+# Oltre questa soglia il testo di un competitor viene troncato (pagine enormi)
+MAX_CHARS_PER_COMPETITOR = get_setting("nlu_max_chars_per_competitor", 40000)
+
+ENTITY_COLUMNS = ['Categoria', 'Entità', 'Rilevanza Strategica']
+_RELEVANCE_ORDER = {"Alta": 0, "Media": 1}
+
+_models: dict[str, genai.GenerativeModel] = {}
+
+
+def generate_text(prompt: str, model_name: str = DEFAULT_MODEL) -> str:
+    """
+    Esegue una singola chiamata a Gemini, registrandone costo e token; le eccezioni
+    (incluso BudgetExceeded) sono lasciate al chiamante.
+    """
+    check_budget()
+    if model_name not in _models:
+        _models[model_name] = genai.GenerativeModel(model_name)
+    mark_call()
+    with span("gemini.generate_content", kind="llm", model=model_name, prompt_chars=len(prompt)) as s:
+        response = cassette.generate_content(_models[model_name], model_name, prompt)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            record_gemini(model_name, usage)
+            s.set(
+                prompt_tokens=getattr(usage, "prompt_token_count", None),
+                output_tokens=getattr(usage, "candidates_token_count", None),
+                total_tokens=getattr(usage, "total_token_count", None),
+            )
+    if response.parts:
+        return response.text
+    return "Nessun contenuto generato. La risposta potrebbe essere stata bloccata per motivi di sicurezza."
+
+
+@st.cache_data(ttl=86400, show_spinner=False, max_entries=2000)
+@single_flight
+def map_competitor(keyword: str, text: str, map_reduce: bool) -> dict:
+    """
+    Fase "map" su un singolo competitor, in cache per (keyword, testo, modalità).
+    - map_reduce=True: entità + note strategiche con il modello veloce (MAP_MODEL).
+    - map_reduce=False: solo entità con il modello principale.
+    """
+    truncated = len(text) > MAX_CHARS_PER_COMPETITOR
+    text = text[:MAX_CHARS_PER_COMPETITOR]
+    if map_reduce:
+        raw = generate_text(get_competitor_map_prompt(keyword, text), MAP_MODEL)
+        entities_md, _, notes = raw.partition(MAP_NOTES_HEADER)
+    else:
+        entities_md, notes = generate_text(get_competitiva_prompt(keyword, text)), ""
+    return {"entities_md": entities_md.strip(), "notes": notes.strip(), "truncated": truncated}
+
+
+def run_map(keyword: str, texts_by_hash: dict[str, str], map_reduce: bool) -> tuple[dict, dict]:
+    """
+    Esegue la fase map in parallelo sull'executor condiviso (upstream "gemini",
+    concorrenza adattiva). Restituisce (risultati per hash, errori per hash): un competitor che fallisce
+    non blocca gli altri, che restano disponibili come risultato parziale.
+    """
+    results, errors = {}, {}
+    if not texts_by_hash:
+        return results, errors
+    # cached_call conta i cache hit di map_competitor come risparmio
+    model_name = MAP_MODEL if map_reduce else DEFAULT_MODEL
+    future_to_hash = {
+        get_executor().submit("gemini", cached_call, "gemini", model_name, map_competitor, keyword, text, map_reduce): h
+        for h, text in texts_by_hash.items()
+    }
+    for future in as_completed(future_to_hash):
+        h = future_to_hash[future]
+        try:
+            results[h] = future.result()
+        except Exception as e:
+            errors[h] = str(e)
+    return results, errors
+
+
+def parse_markdown_tables(text: str) -> list[pd.DataFrame]:
+    """Estrae tabelle Markdown da un testo in modo robusto."""
+    tables_md = re.findall(r"((?:\|.*\|[\r\n]+)+)", text)
+    dataframes = []
+    for table_md in tables_md:
+        lines = [l.strip() for l in table_md.strip().splitlines() if l.strip()]
+        if len(lines) < 2: continue
+
+        header_line = lines[0]
+        header = [h.strip() for h in header_line.split('|')[1:-1]]
+
+        data_lines = []
+        for line in lines[1:]:
+            if all(cell.strip().startswith(':--') for cell in line.split('|')[1:-1]):
+                continue
+            data_lines.append(line)
+
+        rows_data = []
+        for row in data_lines:
+            cells = [cell.strip() for cell in row.split('|')[1:-1]]
+            if len(cells) == len(header):
+                rows_data.append(cells)
+
+        if rows_data:
+            dataframes.append(pd.DataFrame(rows_data, columns=header))
+    return dataframes
+
+
+def content_hash(text: str) -> str:
+    """Hash breve e stabile di un testo (usato come chiave di cache per competitor)."""
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+def combine_hashes(hashes: list[str]) -> str:
+    """Hash di un insieme ordinato di hash: identifica gli input di una fase."""
+    return hashlib.sha1("|".join(hashes).encode("utf-8")).hexdigest()[:16]
+
+
+class StageTracker:
+    """
+    Tiene traccia, per ogni fase della pipeline NLU, dell'hash degli input con cui
+    è stata calcolata l'ultima volta: una fase va ricalcolata solo se i suoi input
+    (es. i contenuti dei competitor) sono cambiati.
+    """
+
+    def __init__(self):
+        self.inputs: dict[str, str] = {}
+
+    def is_stale(self, stage: str, inputs_hash: str) -> bool:
+        return self.inputs.get(stage) != inputs_hash
+
+    def has_run(self, stage: str) -> bool:
+        return stage in self.inputs
+
+    def mark(self, stage: str, inputs_hash: str) -> None:
+        self.inputs[stage] = inputs_hash
+
+
+def _clean_cell(value) -> str:
+    return re.sub(r'[*`]+', '', str(value or "")).strip()
+
+
+def merge_entity_tables(tables: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Unisce le tabelle di entità estratte per singolo competitor in un'unica tabella
+    (Categoria, Entità, Rilevanza Strategica). Le entità sono deduplicate senza
+    distinzione di maiuscole e, se compaiono con rilevanze diverse, prevale la più alta.
+    """
+    best = {}  # entità normalizzata -> (categoria, entità, rilevanza, ordine di apparizione)
+    for table in tables:
+        if table is None or table.empty or len(table.columns) < 3:
+            continue
+        for category, entities, relevance in table.iloc[:, :3].itertuples(index=False):
+            category = _clean_cell(category)
+            relevance = _clean_cell(relevance).capitalize()
+            if relevance not in _RELEVANCE_ORDER:
+                continue
+            for entity in _clean_cell(entities).split(","):
+                entity = entity.strip()
+                if not entity:
+                    continue
+                key = entity.lower()
+                current = best.get(key)
+                if current is None:
+                    best[key] = (category, entity, relevance, len(best))
+                elif _RELEVANCE_ORDER[relevance] < _RELEVANCE_ORDER[current[2]]:
+                    best[key] = (current[0], current[1], relevance, current[3])
+
+    groups = {}
+    for category, entity, relevance, order in sorted(best.values(), key=lambda x: x[3]):
+        groups.setdefault((category.lower(), relevance), (category, relevance, []))[2].append(entity)
+
+    rows = [
+        {"Categoria": category, "Entità": ", ".join(entities), "Rilevanza Strategica": relevance}
+        for category, relevance, entities in sorted(groups.values(), key=lambda g: _RELEVANCE_ORDER[g[1]])
+    ]
+    return pd.DataFrame(rows, columns=ENTITY_COLUMNS)
@@ -0,0 +1,137 @@
+MAP_NOTES_HEADER = "### Note Strategiche ###"
+
+# Formato di output comune all'analisi strategica diretta e a quella aggregata (map-reduce)
+_STRATEGICA_OUTPUT_FORMAT = """**COMPITO E FORMATO DI OUTPUT:**
+**Parte 1: Tabella Sintetica**
+Analizza in modo aggregato tutti i testi forniti. Sintetizza le tue scoperte compilando la seguente tabella Markdown. Per ogni riga, la tua analisi deve rappresentare la tendenza predominante o la media osservata in TUTTI i testi. Genera **ESCLUSIVAMENTE** la tabella Markdown completa, iniziando dalla riga dell’header.| Caratteristica SEO | Analisi Sintetica |
+
+| :--- | :--- |
+| **Search Intent Primario** | `[Determina e inserisci qui: Informazionale, Commerciale, Transazionale, Navigazionale. Aggiungi tra parentesi un brevissimo approfondimenti di massimo 5/6 parole]` |
+| **Search Intent Secondario** | `[Determina e inserisci qui l'intento secondario. Aggiungi tra parentesi un brevissimo approfondimenti di massimo 5/6 parole]` |
+| **Target Audience** | `[Definisci il target audience in massimo 6 parole]` |
+| **Tone of Voice (ToV)** | `[Sintetizza il ToV predominante con 3 aggettivi chiave]` |
+**Parte 2: Analisi Approfondita Audience**
+Dopo la tabella, inserisci un separatore `---` seguito da un'analisi dettagliata del target audience. Inizia questa sezione con l'intestazione esatta: `### Analisi Approfondita Audience ###`.
+Il testo deve essere un paragrafo di 3-4 frasi che descriva il pubblico in termini di livello di conoscenza, bisogni, possibili punti deboli (pain points) e cosa si aspetta di trovare nel contenuto. Questa analisi deve servire come guida per un copywriter.
+"""
+
+
+def get_strategica_prompt(keyword: str, texts: str) -> str:
+    """Costruisce il prompt per l'analisi strategica."""
+    return f"""
+## PROMPT: NLU Semantic Content Intelligence ##
+**PERSONA:** Agisci come un **Lead SEO Strategist** con 15 anni di esperienza. Il tuo approccio è data-driven e focalizzato sull'intento di ricerca per creare contenuti dominanti.
+**CONTESTO:** Ho estratto il contenuto testuale delle pagine top-ranking per la query.
+**QUERY STRATEGICA:** {keyword}
+### INIZIO TESTI DEI COMPETITOR DA ANALIZZARE ###
+<TESTI>
+{texts}
+</TESTI>
+---
+{_STRATEGICA_OUTPUT_FORMAT}"""
+
+def get_competitiva_prompt(keyword: str, texts: str) -> str:
+    """Costruisce il prompt per l'analisi delle entità - VERSIONE RINFORZATA."""
+    return f"""
+**RUOLO**: Agisci come un sistema di Natural Language Processing (NLP) estremamente preciso. Il tuo unico scopo è estrarre entità e formattarle in una tabella Markdown. Non sei un assistente conversazionale.
+**CONTESTO**: Analizzerò testi dei competitor per la keyword target per estrarre le entità semantiche più importanti.
+**KEYWORD TARGET**: {keyword}
+
+### INIZIO TESTI DA ANALIZZARE ###
+<TESTI>
+{texts}
+</TESTI>
+### FINE TESTI DA ANALIZZARE ###
+
+**COMPITO FONDAMENTALE**:
+1.  Estrai le entità nominate rilevanti dai testi.
+2.  Assegna una categoria (es. Prodotto, Brand, Caratteristica, Località, Concetto Astratto).
+3.  Assegna una rilevanza (Alta, Media). Ignora tutto ciò che ha rilevanza Bassa.
+4.  Raggruppa le entità con la stessa Categoria e Rilevanza sulla stessa riga, separate da virgola.
+
+**FORMATO DI OUTPUT OBBLIGATORIO**:
+Genera **ESCLUSIVAMENTE** la tabella Markdown. Non includere **ASSOLUTAMENTE NESSUN** testo prima o dopo la tabella (niente introduzioni, niente spiegazioni, niente "Ecco la tabella:"). Il tuo output deve iniziare direttamente con la riga dell'header `| Categoria | Entità |...`.
+
+| Categoria | Entità | Rilevanza Strategica |
+| :--- | :--- | :--- |
+"""
+
+def get_topic_clusters_prompt(keyword: str, entities_md: str, headings_str: str, paa_str: str) -> str:
+    """Costruisce il prompt per il Topical Modeling."""
+    return f"""
+## PROMPT: Topic Modeling & Information Architecture ##
+**PERSONA:** Agisci come un **Information Architect e Semantic SEO Strategist**. Il tuo compito è decostruire un argomento complesso nei suoi pilastri concettuali.
+**CONTESTO:** Sto pianificando un contenuto definitivo per la query `{keyword}`. Ho già estratto entità, headings e domande "People Also Ask" (PAA). Ora devo organizzarli in una struttura logica.
+### DATI DI INPUT ###
+**1. ENTITÀ RILEVANTI:**
+{entities_md}
+**2. HEADINGS STRUTTURALI:**
+{headings_str}
+**3. DOMANDE DEGLI UTENTI (PAA):**
+{paa_str}
+---
+**COMPITO E FORMATO DI OUTPUT:**
+1.  **Analisi e Sintesi:** Analizza TUTTI i dati per identificare i sotto-argomenti principali.
+2.  **Clustering:** Raggruppa entità, headings e domande correlate in **5-7 cluster tematici**.
+3.  **Formattazione:** Genera **ESCLUSIVAMENTE** una tabella Markdown. Non aggiungere introduzioni o commenti.
+| Topic Cluster (Sotto-argomento Principale) | Concetti, Entità e Domande Chiave del Cluster |
+| :--- | :--- |
+"""
+
+def get_content_brief_prompt(**kwargs) -> str:
+    """Costruisce il prompt per generare il Content Brief finale."""
+    return f"""
+## PROMPT: Generatore di Content Brief SEO Strategico ##
+**PERSONA:** Agisci come un **Head of Content** con profonde competenze SEO e NLU. Il tuo lavoro è tradurre analisi complesse in un brief attuabile per un copywriter.
+**CONTESTO:** Sulla base di un'analisi approfondita della SERP per la query `{kwargs.get('keyword', '')}`, devi sintetizzare tutti i dati raccolti in un piano di contenuto dettagliato.
+### DATI DI INPUT SINTETIZZATI ###
+**1. Analisi Strategica:**
+{kwargs.get('strat_analysis_str', '')}
+**2. Architettura del Topic (Topic Clusters):**
+{kwargs.get('topic_clusters_md', '')}
+**3. Keyword Secondarie e Correlate (Opzionale):**
+{kwargs.get('ranked_keywords_md', '')}
+**4. Domande degli Utenti (PAA):**
+{kwargs.get('paa_str', '')}
+---
+**COMPITO E FORMATO DI OUTPUT:**
+Genera un content brief completo **ESCLUSIVAMENTE in formato Markdown**. Sii prescrittivo e chiaro.
+1.  **Titolo e Meta Description:** Suggerisci 2 opzioni per `<title>` (60 caratteri max) e 1 opzione per `meta description` (155 caratteri max).
+2.  **Struttura del Contenuto (Outline):** Crea una struttura gerarchica dettagliata (H1, H2, H3). L'H1 deve contenere la keyword. Gli H2 devono basarsi sui Topic Cluster. Sotto ogni H2, elenca i concetti e le domande da trattare.
+3.  **Entità "Must-Have":** Elenca le 5-7 entità più importanti da includere.
+4.  **Sezione FAQ:** Proponi una sezione `## FAQ` con le domande PAA più importanti come H3.
+Inizia direttamente con `## ✍️ Content Brief: {kwargs.get('keyword', '')}`.
+"""
+
+
+def get_competitor_map_prompt(keyword: str, text: str) -> str:
+    """Costruisce il prompt "map" per un singolo competitor: entità + note strategiche sintetiche."""
+    return f"""
+**RUOLO**: Agisci come un sistema di Natural Language Processing (NLP) estremamente preciso. Analizzi il testo di UN SOLO competitor.
+**KEYWORD TARGET**: {keyword}
+
+### INIZIO TESTO DA ANALIZZARE ###
+<TESTO>
+{text}
+</TESTO>
+### FINE TESTO DA ANALIZZARE ###
+
+**COMPITO E FORMATO DI OUTPUT OBBLIGATORIO**:
+**Parte 1: Entità.** Estrai le entità nominate rilevanti, assegna una categoria (es. Prodotto, Brand, Caratteristica, Località, Concetto Astratto) e una rilevanza (Alta, Media; ignora tutto ciò che ha rilevanza Bassa). Raggruppa sulla stessa riga, separate da virgola, le entità con la stessa Categoria e Rilevanza. Inizia direttamente con la riga dell'header:
+| Categoria | Entità | Rilevanza Strategica |
+| :--- | :--- | :--- |
+**Parte 2: Note Strategiche.** Dopo la tabella scrivi l'intestazione esatta `{MAP_NOTES_HEADER}` seguita da un elenco puntato di massimo 5 righe: search intent primario e secondario, target audience, tone of voice e livello di approfondimento del testo.
+Non aggiungere nient'altro.
+"""
+
+def get_strategica_reduce_prompt(keyword: str, notes: str) -> str:
+    """Costruisce il prompt "reduce" che aggrega le note strategiche dei singoli competitor."""
+    return f"""
+## PROMPT: NLU Semantic Content Intelligence (Aggregazione) ##
+**PERSONA:** Agisci come un **Lead SEO Strategist** con 15 anni di esperienza. Il tuo approccio è data-driven e focalizzato sull'intento di ricerca per creare contenuti dominanti.
+**CONTESTO:** Per ciascuna pagina top-ranking per la query ho già estratto delle note strategiche sintetiche.
+**QUERY STRATEGICA:** {keyword}
+### NOTE STRATEGICHE PER COMPETITOR ###
+{notes}
+---
+{_STRATEGICA_OUTPUT_FORMAT}"""
@@ -0,0 +1,148 @@
+from urllib.parse import urlparse
+
+import streamlit as st
+
+# st.fragment (>=1.37) fa sì che i widget del blocco rieseguano solo il blocco e non
+# l'intera pagina; sulle versioni precedenti si ripiega su experimental_fragment o su
+# nessun isolamento. Serve solo ai componenti con widget: i blocchi di solo HTML non
+# hanno nulla da rieseguire da soli.
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+# Fonti AI Overview mostrate prima del clic su "Mostra tutti"
+AIO_SOURCES_PREVIEW = 3
+
+PILL_STYLE = "background-color:#f7f8f9;padding:8px 12px;border-radius:4px;font-size:16px;margin-right:4px;margin-bottom:8px;display:inline-block;"
+
+
+# --- Costruttori HTML ---
+# Ogni blocco è costruito in un'unica passata (join delle parti, non html += nel ciclo):
+# per i risultati di una SERP costa meno di un millisecondo, quanto serializzare e
+# hashare i dati per una cache, che quindi non c'è.
+
+def _organic_serp_html(results: list[dict]) -> str:
+    """Risultati organici nel formato DataForSEO (url, title, description, breadcrumb)."""
+    parts = []
+    for res in results:
+        url_raw = res.get("url", "")
+        if not url_raw:
+            continue
+        p = urlparse(url_raw)
+        pretty_url = str(p.netloc + p.path).replace("www.", "")
+        name = res.get("breadcrumb", "").split("›")[0].strip() if res.get("breadcrumb") else p.netloc.replace('www.', '')
+        parts.append(f"""
+            <div style="margin-bottom: 2rem;">
+                <div style="display: flex; align-items: center; margin-bottom: 0.2rem;">
+                    <img src="https://www.google.com/s2/favicons?domain={p.netloc}&sz=64"
+                         onerror="this.onerror=null;this.src='https://www.google.com/favicon.ico';"
+                         style="width: 26px; height: 26px; border-radius: 50%; border: 1px solid #d2d2d2; margin-right: 0.5rem;">
+                    <div>
+                        <div style="color: #202124; font-size: 16px; line-height: 20px;">{name}</div>
+                        <div style="color: #4d5156; font-size: 14px; line-height: 18px;">{pretty_url}</div>
+                    </div>
+                </div>
+                <a href="{url_raw}" target="_blank" style="color: #1a0dab; text-decoration: none; font-size: 23px; font-weight: 500;">
+                    {res.get("title", "")}
+                </a>
+                <div style="font-size: 16px; line-height: 22px; color: #474747;">
+                    {res.get("description", "")}
+                </div>
+            </div>
+            """)
+    return "".join(parts)
+
+
+def _organic_export_html(results: list[dict]) -> str:
+    """Risultati organici nel formato del JSON di analisi (URL, Meta Title, Meta Description)."""
+    parts = ['<div style="padding-right:3.5rem;">']
+    for it in results:
+        url_raw = it.get("URL", "")
+        p = urlparse(url_raw)
+        base = f"{p.scheme}://{p.netloc}"
+        segs = [s for s in p.path.split("/") if s]
+        pretty = base + (" › " + " › ".join(segs) if segs else "")
+        hn = p.netloc.split('.')
+        name = (hn[1] if len(hn) > 2 else hn[0]).replace('-', ' ').title()
+        parts.append(
+            '<div style="margin-bottom:2rem;">'
+              '<div style="display:flex;align-items:center;margin-bottom:0.2rem;">'
+                f'<img src="https://www.google.com/s2/favicons?domain={p.netloc}&sz=64" onerror="this.src=\'https://www.google.com/favicon.ico\';" style="width:26px;height:26px;border-radius:50%;border:1px solid #d2d2d2;margin-right:0.5rem;"/>'
+                '<div>'
+                  f'<div style="color:#202124;font-size:16px;line-height:20px;">{name}</div>'
+                  f'<div style="color:#4d5156;font-size:14px;line-height:18px;">{pretty}</div>'
+                '</div>'
+              '</div>'
+              f'<a href="{url_raw}" style="color:#1a0dab;text-decoration:none;font-size:23px;font-weight:500;">{it.get("Meta Title", "")}</a>'
+              f'<div style="font-size:16px;line-height:22px;color:#474747;">{it.get("Meta Description", "")}</div>'
+            '</div>'
+        )
+    parts.append('</div>')
+    return "".join(parts)
+
+
+def _pills_html(items: list[str]) -> str:
+    pills = ''.join(f'<span style="{PILL_STYLE}">{item}</span>' for item in items)
+    return f"<div>{pills}</div>"
+
+
+def _aio_sources_html(references: list[dict], images: dict) -> str:
+    """Card delle fonti AI Overview, con l'immagine principale (se disponibile) di ciascuna fonte."""
+    cards = []
+    for ref in references:
+        image_url = images.get(ref.get("url"))
+        image_html = f'<div style="flex: 1; min-width: 100px;"><a href="{ref.get("url")}" target="_blank"><img src="{image_url}" style="width: 100%; border-radius: 8px;"></a></div>' if image_url else ''
+        cards.append(f"""
+                <div style="background-color: #f0f4ff; border-radius: 12px; padding: 16px; margin-bottom: 1rem; display: flex; gap: 16px; align-items: stretch;">
+                    <div style="flex: 3; display: flex; flex-direction: column;">
+                        <a href="{ref.get('url')}" target="_blank" style="text-decoration: none; color: inherit; flex-grow: 1;">
+                            <div style="font-weight: 500; color: #1f1f1f; margin-bottom: 8px; font-size: 16px;">{ref.get('title')}</div>
+                        </a>
+                        <div style="font-size: 12px; color: #202124; display: flex; align-items: center; margin-top: 8px;">
+                            <img src="https://www.google.com/s2/favicons?domain={ref.get('domain')}&sz=16" style="width:16px; height:16px; margin-right: 8px;">
+                            <span>{ref.get('source', ref.get('domain'))}</span>
+                        </div>
+                    </div>
+                    {image_html}
+                </div>
+                """)
+    return "".join(cards)
+
+
+def _aio_text_html(items: list[dict]) -> str:
+    return "<div style='font-size: 16px; line-height: 1.6;'>" + "<p>" + "</p><p>".join(item.get('text', '').replace('\n', '<br>') for item in items if item.get('text')) + "</p></div>"
+
+
+# --- Componenti Streamlit ---
+
+def render_organic_results(results: list[dict], source: str = "serp"):
+    """
+    Anteprima SERP dei risultati organici.
+    source="serp" per gli item DataForSEO, "export" per il JSON di analisi.
+    """
+    html = _organic_serp_html(results) if source == "serp" else _organic_export_html(results)
+    st.markdown(html, unsafe_allow_html=True)
+
+
+def render_pills(items: list[str]):
+    """Pillole per People Also Ask e Ricerche Correlate."""
+    st.markdown(_pills_html(items), unsafe_allow_html=True)
+
+
+def _show_all_aio_sources():
+    st.session_state.aio_show_all_sources = True
+
+
+@fragment
+def render_aio_sources(references: list[dict], images: dict):
+    """
+    Card delle fonti AI Overview: le prime AIO_SOURCES_PREVIEW e il pulsante
+    "Mostra tutti", il cui clic riesegue solo questo frammento.
+    """
+    shown = references if st.session_state.get("aio_show_all_sources", False) else references[:AIO_SOURCES_PREVIEW]
+    st.markdown(_aio_sources_html(shown, images), unsafe_allow_html=True)
+    if len(shown) < len(references):
+        st.button("Mostra tutti", on_click=_show_all_aio_sources, use_container_width=True)
+
+
+def render_aio_text(items: list[dict]):
+    """Testo principale dell'AI Overview."""
+    st.markdown(_aio_text_html(items), unsafe_allow_html=True)
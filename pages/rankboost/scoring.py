@@ -0,0 +1,56 @@
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+
+from pages.common.settings import get_setting
+
+# Punteggio di una bozza rispetto ai contenuti dei competitor. Il modello TF-IDF è
+# addestrato una sola volta sul corpus dei competitor (matrice sparsa CSR con righe
+# normalizzate L2); a ogni modifica della bozza si calcola solo il suo vettore, quindi
+# similarità del coseno e termini mancanti costano qualche millisecondo.
+
+SCORING_MAX_FEATURES = get_setting("scoring_max_features", 20000)
+# Termini del profilo medio dei competitor considerati per i "termini mancanti"
+MISSING_TERMS_TOP = get_setting("scoring_missing_terms", 30)
+
+ITALIAN_STOP_WORDS = frozenset("""
+a ad agli ai al alla alle allo anche ancora avere che chi ci come con contro cosa cui da dagli dai dal
+dalla dalle dallo degli dei del della delle dello di dove dunque e ed era essere gli ha hanno i il in
+infatti inoltre io la le lo loro lui ma mentre molto ne negli nei nel nella nelle nello noi non nostro
+o ogni oppure per perché però più poi può quale quali quando quanto quello questa queste questi questo
+se sei senza si sia siamo sono sopra sotto su sua sue sui sul sulla sulle suo tra tutti tutto un una
+uno vi voi è
+""".split())
+STOP_WORDS = list(ITALIAN_STOP_WORDS | ENGLISH_STOP_WORDS)
+
+
+class DraftScorer:
+    """Modello TF-IDF dei competitor, riusato per valutare le versioni successive di una bozza."""
+
+    def __init__(self, texts: list[str]):
+        self.vectorizer = TfidfVectorizer(
+            sublinear_tf=True, ngram_range=(1, 2), max_features=SCORING_MAX_FEATURES,
+            stop_words=STOP_WORDS, token_pattern=r"(?u)\b[^\W\d_]{3,}\b", dtype=np.float32,
+        )
+        # TfidfVectorizer restituisce già una CSR con righe a norma unitaria
+        self.matrix = self.vectorizer.fit_transform(texts)
+        self.terms = self.vectorizer.get_feature_names_out()
+        # Profilo medio dei competitor: i termini con peso maggiore sono quelli da coprire
+        centroid = np.asarray(self.matrix.mean(axis=0)).ravel()
+        top = np.argsort(centroid)[::-1][:MISSING_TERMS_TOP]
+        self.top_terms = top[centroid[top] > 0]
+        self.top_weights = centroid[self.top_terms]
+        self.coverage = np.asarray((self.matrix[:, self.top_terms] > 0).sum(axis=0)).ravel()
+
+    def score(self, draft: str) -> tuple[np.ndarray, list[dict]]:
+        """
+        Similarità del coseno della bozza con ciascun competitor e termini ad alto
+        peso presenti nei competitor ma assenti nella bozza.
+        """
+        vector = self.vectorizer.transform([draft or ""])
+        similarities = (self.matrix @ vector.T).toarray().ravel()
+        present = set(vector.indices)
+        missing = [
+            {"term": self.terms[i], "weight": float(w), "competitors": int(c)}
+            for i, w, c in zip(self.top_terms, self.top_weights, self.coverage) if i not in present
+        ]
+        return similarities, missing
@@ -0,0 +1,111 @@
+from collections import Counter, defaultdict
+from concurrent.futures import as_completed
+
+from pages.common.executor import get_executor
+from pages.common.metering import cached_call, check_budget
+from pages.common.settings import get_setting
+from pages.common.unionfind import UnionFind
+from pages.common.urls import normalize_url
+from pages.rankboost.dataforseo import fetch_serp_data
+from pages.rankboost.serp_history import latest_organic_urls
+
+# Clustering delle keyword per sovrapposizione delle SERP: due keyword stanno nello
+# stesso cluster se i loro primi risultati organici si somigliano (Jaccard sugli URL).
+# Un indice invertito URL -> keyword limita i confronti alle coppie che condividono
+# almeno un URL, invece di tutte le n² coppie; i cluster sono le componenti connesse
+# del grafo delle coppie sopra soglia (union-find).
+
+SERP_CLUSTER_TOP_N = get_setting("serp_cluster_top_n", 10)
+# Jaccard minimo tra gli URL di due SERP (0.3 con top 10 ~ 5 URL in comune)
+SERP_CLUSTER_SIMILARITY = get_setting("serp_cluster_similarity", 0.3)
+# URL presenti nelle SERP di moltissime keyword (home page, portali generalisti) non
+# distinguono gli argomenti e renderebbero quadratico il conteggio: si ignorano
+MAX_KEYWORDS_PER_URL = get_setting("serp_cluster_max_keywords_per_url", 1000)
+# SERP dello storico (pages/rankboost/serp_history.py) abbastanza recenti da non richiederle di nuovo
+SERP_CLUSTER_MAX_AGE_HOURS = get_setting("serp_cluster_max_age_hours", 168)
+
+
+def top_urls(urls: list[str], top_n: int = SERP_CLUSTER_TOP_N) -> list[str]:
+    """Primi top_n URL distinti, normalizzati e senza query string."""
+    normalized = (normalize_url(url, keep_query=False) for url in urls)
+    return list(dict.fromkeys(u for u in normalized if u))[:top_n]
+
+
+def organic_urls(serp_result: dict, top_n: int = SERP_CLUSTER_TOP_N) -> list[str]:
+    """Primi top_n URL organici di un risultato SERP."""
+    return top_urls([item.get("url") for item in (serp_result or {}).get("items", []) if item.get("type") == "organic"], top_n)
+
+
+def cluster_keywords(serps: dict[str, list[str]], similarity: float = SERP_CLUSTER_SIMILARITY) -> list[dict]:
+    """
+    Raggruppa le keyword in base agli URL delle rispettive SERP. Restituisce i cluster
+    (dal più grande) come {"pillar", "keywords", "urls"}: il pillar è la keyword con più
+    collegamenti nel cluster, gli URL sono quelli condivisi da più keyword del cluster.
+    """
+    keywords = list(serps)
+    url_sets = [set(serps[k]) for k in keywords]
+    postings = defaultdict(list)
+    for i, urls in enumerate(url_sets):
+        for url in urls:
+            postings[url].append(i)
+
+    uf = UnionFind()
+    degree = Counter()
+    for i, urls in enumerate(url_sets):
+        # Intersezioni con le sole keyword che condividono almeno un URL (e indice maggiore)
+        shared = Counter(
+            j for url in urls if len(postings[url]) <= MAX_KEYWORDS_PER_URL
+            for j in postings[url] if j > i
+        )
+        for j, common in shared.items():
+            if common / (len(urls) + len(url_sets[j]) - common) >= similarity:
+                uf.union(i, j)
+                degree[i] += 1
+                degree[j] += 1
+
+    members = defaultdict(list)
+    for i in range(len(keywords)):
+        members[uf.find(i)].append(i)
+
+    clusters = []
+    for indexes in members.values():
+        url_counts = Counter(url for i in indexes for url in url_sets[i])
+        clusters.append({
+            "pillar": keywords[max(indexes, key=lambda i: (degree[i], -i))],
+            "keywords": [keywords[i] for i in indexes],
+            "urls": [url for url, n in url_counts.most_common() if n > 1 or len(indexes) == 1],
+        })
+    clusters.sort(key=lambda c: -len(c["keywords"]))
+    return clusters
+
+
+def run_serp_cluster_job(params: dict, progress) -> dict:
+    """
+    Job "serp_cluster": SERP di ogni keyword (dallo storico o dalla cache quando
+    disponibili) e clustering per sovrapposizione dei risultati organici.
+    """
+    keywords = list(dict.fromkeys(k.strip() for k in params["keywords"] if k.strip()))
+    location_code, language_code = params["location_code"], params["language_code"]
+    stored = latest_organic_urls(keywords, location_code, language_code, SERP_CLUSTER_MAX_AGE_HOURS)
+    serps = {keyword: top_urls(urls) for keyword, urls in stored.items()}
+    errors = {}
+    missing = [k for k in keywords if k not in serps]
+
+    check_budget()
+    executor = get_executor()
+    futures = {
+        executor.submit("dataforseo", cached_call, "dataforseo", "serp_organic", fetch_serp_data,
+                        keyword, location_code, language_code): keyword
+        for keyword in missing
+    }
+    for done, future in enumerate(as_completed(futures), len(serps) + 1):
+        keyword = futures[future]
+        try:
+            serps[keyword] = organic_urls(future.result())
+        except Exception as e:
+            errors[keyword] = str(e)
+        progress(done, len(keywords), f"SERP analizzate: {done}/{len(keywords)}")
+
+    progress(len(keywords), len(keywords), "Clustering delle keyword...")
+    clusters = cluster_keywords(serps, float(params.get("similarity", SERP_CLUSTER_SIMILARITY)))
+    return {"clusters": clusters, "errors": errors}
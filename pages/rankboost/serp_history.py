@@ -0,0 +1,161 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pages.common import cassette
+from pages.common.settings import data_path
+from pages.common.urls import site_host
+
+# Storico delle SERP: ogni risposta reale di fetch_serp_data viene aggiunta come
+# snapshot, con una riga per elemento (tipo, rank, URL, dominio) invece del JSON
+# grezzo. Le query sullo storico (movimenti di rank, nuovi entrati, presenza di AIO
+# e PAA) leggono solo le colonne che servono e i diff tra due snapshot sono
+# calcolati con operazioni vettoriali di pandas.
+DB_PATH = data_path("serp_history.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    keyword TEXT NOT NULL,
+    location_code INTEGER NOT NULL,
+    language_code TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    has_aio INTEGER NOT NULL,
+    has_paa INTEGER NOT NULL,
+    organic_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_serp ON snapshots (keyword, location_code, language_code, fetched_at);
+CREATE TABLE IF NOT EXISTS serp_items (
+    snapshot_id INTEGER NOT NULL,
+    item_type TEXT NOT NULL,
+    rank_group INTEGER,
+    rank_absolute INTEGER,
+    url TEXT,
+    domain TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_serp_items_snapshot ON serp_items (snapshot_id, item_type);
+CREATE INDEX IF NOT EXISTS idx_serp_items_domain ON serp_items (domain);
+"""
+
+AIO_TYPES = ["ai_overview", "generative_answers"]
+
+
+def _connect(db_path: Path = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _normalize_keyword(keyword: str) -> str:
+    return " ".join((keyword or "").lower().split())
+
+
+def record_snapshot(keyword: str, location_code: int, language_code: str, serp_result: dict,
+                    db_path: Path = None) -> int | None:
+    """Aggiunge allo storico uno snapshot della SERP; restituisce l'ID (None in modalità replay)."""
+    if cassette.replaying():
+        return None
+    items = serp_result.get("items") or []
+    types = [item.get("type") or "" for item in items]
+    rows = [
+        (item.get("type") or "", item.get("rank_group"), item.get("rank_absolute"), item.get("url"),
+         site_host(item["url"]) if item.get("url") else None)
+        for item in items
+    ]
+    with closing(_connect(db_path)) as conn, conn:
+        cur = conn.execute(
+            "INSERT INTO snapshots (keyword, location_code, language_code, fetched_at, has_aio, has_paa, organic_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                _normalize_keyword(keyword), location_code, language_code,
+                datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                any(t in AIO_TYPES for t in types), "people_also_ask" in types, types.count("organic"),
+            ),
+        )
+        snapshot_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO serp_items (snapshot_id, item_type, rank_group, rank_absolute, url, domain) VALUES (?, ?, ?, ?, ?, ?)",
+            [(snapshot_id, *row) for row in rows],
+        )
+    return snapshot_id
+
+
+def list_snapshots(keyword: str, location_code: int, language_code: str, db_path: Path = None) -> pd.DataFrame:
+    """Snapshot di una SERP dal più vecchio, con la presenza di AIO e PAA."""
+    with closing(_connect(db_path)) as conn:
+        return pd.read_sql_query(
+            "SELECT id, fetched_at, has_aio, has_paa, organic_count FROM snapshots "
+            "WHERE keyword = ? AND location_code = ? AND language_code = ? ORDER BY fetched_at, id",
+            conn, params=(_normalize_keyword(keyword), location_code, language_code),
+        ).astype({"has_aio": bool, "has_paa": bool})
+
+
+def latest_organic_urls(keywords: list[str], location_code: int, language_code: str, max_age_hours: float,
+                        db_path: Path = None) -> dict[str, list[str]]:
+    """
+    Per ogni keyword con uno snapshot non più vecchio di max_age_hours, gli URL
+    organici (in ordine di rank) dello snapshot più recente.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(hours=max_age_hours)).isoformat(timespec="seconds")
+    found = {}
+    with closing(_connect(db_path)) as conn:
+        for keyword in keywords:
+            urls = conn.execute(
+                "SELECT url FROM serp_items WHERE item_type = 'organic' AND url IS NOT NULL AND snapshot_id = ("
+                "SELECT id FROM snapshots WHERE keyword = ? AND location_code = ? AND language_code = ? AND fetched_at >= ? "
+                "ORDER BY fetched_at DESC, id DESC LIMIT 1) ORDER BY rank_group",
+                (_normalize_keyword(keyword), location_code, language_code, since),
+            ).fetchall()
+            if urls:
+                found[keyword] = [url for (url,) in urls]
+    return found
+
+
+def organic_ranks(snapshot_ids: list[int], db_path: Path = None) -> pd.DataFrame:
+    """Risultati organici (snapshot_id, rank, url, domain) di uno o più snapshot."""
+    if not snapshot_ids:
+        return pd.DataFrame(columns=["snapshot_id", "rank", "url", "domain"])
+    placeholders = ",".join("?" * len(snapshot_ids))
+    with closing(_connect(db_path)) as conn:
+        return pd.read_sql_query(
+            f"SELECT snapshot_id, rank_group AS rank, url, domain FROM serp_items "
+            f"WHERE snapshot_id IN ({placeholders}) AND item_type = 'organic' AND url IS NOT NULL",
+            conn, params=list(snapshot_ids),
+        )
+
+
+def diff_snapshots(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """
+    Confronto vettoriale tra i risultati organici di due snapshot (da organic_ranks):
+    rank prima e dopo, variazione (positiva = posizioni guadagnate) e stato
+    "nuovo", "uscito", "salito", "sceso" o "stabile".
+    """
+    # Un URL può comparire più volte nella stessa SERP: conta la posizione migliore
+    before = before.groupby("url", as_index=False).agg(domain=("domain", "first"), rank_before=("rank", "min"))
+    after = after.groupby("url", as_index=False).agg(domain=("domain", "first"), rank_after=("rank", "min"))
+    merged = before.merge(after, on="url", how="outer", suffixes=("_before", ""))
+    merged["domain"] = merged["domain"].fillna(merged["domain_before"])
+    delta = merged["rank_before"] - merged["rank_after"]
+    merged["delta"] = delta
+    merged["status"] = np.select(
+        [merged["rank_before"].isna(), merged["rank_after"].isna(), delta > 0, delta < 0],
+        ["nuovo", "uscito", "salito", "sceso"],
+        default="stabile",
+    )
+    merged = merged.sort_values(["rank_after", "rank_before"], na_position="last")
+    return merged[["url", "domain", "rank_before", "rank_after", "delta", "status"]].reset_index(drop=True)
+
+
+def rank_history(snapshots: pd.DataFrame, by: str = "domain", db_path: Path = None) -> pd.DataFrame:
+    """Matrice rank per dominio (o URL) x data di snapshot, dalla posizione migliore in ciascuno."""
+    ranks = organic_ranks(snapshots["id"].tolist(), db_path)
+    if ranks.empty:
+        return pd.DataFrame()
+    ranks = ranks.merge(snapshots[["id", "fetched_at"]], left_on="snapshot_id", right_on="id")
+    history = ranks.pivot_table(index=by, columns="fetched_at", values="rank", aggfunc="min")
+    return history.sort_values(history.columns[-1], na_position="last")
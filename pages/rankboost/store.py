@@ -0,0 +1,89 @@
+import json
+import sqlite3
+import zlib
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pages.common.settings import data_path
+
+# Archivio locale delle analisi Rank Booster: il JSON completo è salvato compresso
+# (zlib) in un BLOB, mentre query/country/lingua/data stanno in colonne indicizzate
+# per permettere una navigazione immediata dello storico.
+DB_PATH = data_path("analyses.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    query TEXT NOT NULL,
+    country TEXT,
+    language TEXT,
+    created_at TEXT NOT NULL,
+    size_bytes INTEGER,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_query ON analyses (query COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_analyses_country ON analyses (country);
+CREATE INDEX IF NOT EXISTS idx_analyses_created_at ON analyses (created_at);
+"""
+
+
+def _connect(db_path: Path = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def save_analysis(payload: dict, db_path: Path = None) -> int:
+    """
+    Salva un'analisi (stesso formato del JSON di export) e ne restituisce l'ID.
+    """
+    raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    with closing(_connect(db_path)) as conn, conn:
+        cur = conn.execute(
+            "INSERT INTO analyses (query, country, language, created_at, size_bytes, payload) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                payload.get("query", ""),
+                payload.get("country", ""),
+                payload.get("language", ""),
+                datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                len(raw),
+                zlib.compress(raw, 6),
+            ),
+        )
+        return cur.lastrowid
+
+
+def list_analyses(query: str = "", country: str = "", limit: int = 200, db_path: Path = None) -> list[dict]:
+    """
+    Elenca le analisi salvate (solo metadati, senza decomprimere i payload),
+    dalla più recente. `query` filtra per prefisso (case-insensitive).
+    """
+    sql = "SELECT id, query, country, language, created_at, size_bytes FROM analyses WHERE 1=1"
+    params = []
+    if query:
+        sql += " AND query LIKE ? COLLATE NOCASE"
+        params.append(f"{query}%")
+    if country:
+        sql += " AND country = ?"
+        params.append(country)
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit)
+    with closing(_connect(db_path)) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    keys = ["id", "query", "country", "language", "created_at", "size_bytes"]
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def load_analysis_bytes(analysis_id: int, db_path: Path = None) -> bytes | None:
+    """Restituisce il JSON (decompresso, in bytes) di un'analisi, o None se non esiste."""
+    with closing(_connect(db_path)) as conn:
+        row = conn.execute("SELECT payload FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+    return zlib.decompress(row[0]) if row else None
+
+
+def load_analysis(analysis_id: int, db_path: Path = None) -> dict | None:
+    """Restituisce il dict di un'analisi, o None se non esiste."""
+    raw = load_analysis_bytes(analysis_id, db_path)
+    return json.loads(raw) if raw is not None else None
@@ -0,0 +1,86 @@
+import re
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import AgglomerativeClustering
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from pages.rankboost.scoring import STOP_WORDS
+
+# Topic cluster calcolati in locale, alternativa alla chiamata Gemini della Fase 4:
+# entità, headings e domande PAA sono rappresentati con TF-IDF sui n-grammi di caratteri
+# (robusti a plurali, flessioni e testi brevissimi) più TF-IDF sulle parole, raggruppati
+# con clustering agglomerativo (Ward sui vettori normalizzati: distanza euclidea
+# equivalente al coseno, cluster più bilanciati del legame medio) ed etichettati con
+# i termini più pesanti. Bastano poche decine di millisecondi su CPU.
+
+TOPIC_COLUMNS = ['Topic Cluster (Sotto-argomento Principale)', 'Concetti, Entità e Domande Chiave del Cluster']
+MIN_CLUSTERS, MAX_CLUSTERS = 5, 7
+LABEL_TERMS = 3
+# Elementi mostrati per cluster nella seconda colonna
+MAX_ITEMS_PER_CLUSTER = 12
+
+_HEADING_PREFIX = re.compile(r"^H\d:\s*")
+
+
+def _unique(items: list[str]) -> list[str]:
+    seen, result = set(), []
+    for item in items:
+        item = _HEADING_PREFIX.sub("", str(item or "")).strip()
+        if item and item.lower() not in seen:
+            seen.add(item.lower())
+            result.append(item)
+    return result
+
+
+def split_entity_cells(cells: list) -> list[str]:
+    """
+    Entità singole dalle celle della tabella common ground, che ne contengono
+    più d'una separate da virgola (come in merge_entity_tables); senza duplicati,
+    nell'ordine di apparizione.
+    """
+    return _unique([part for cell in cells for part in str(cell or "").split(",")])
+
+
+def _label(weights: np.ndarray, terms: np.ndarray, query_terms: set) -> str:
+    # I termini della query compaiono ovunque: non distinguono un cluster dall'altro
+    order = [i for i in np.argsort(weights)[::-1] if weights[i] > 0 and terms[i] not in query_terms]
+    return " / ".join(terms[i].capitalize() for i in order[:LABEL_TERMS]) or "Altro"
+
+
+def cluster_topics(query: str, entities: list[str], headings: list[str], paa: list[str]) -> pd.DataFrame:
+    """
+    Raggruppa entità, headings (anche nel formato 'H2: Titolo') e domande PAA in 5-7
+    cluster; restituisce lo stesso DataFrame a due colonne prodotto dal prompt Gemini.
+    """
+    items = _unique([*entities, *headings, *paa])
+    if len(items) < 2:
+        return pd.DataFrame([[items[0], items[0]]] if items else [], columns=TOPIC_COLUMNS)
+
+    char_matrix = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True).fit_transform(items)
+    words = TfidfVectorizer(stop_words=STOP_WORDS, token_pattern=r"(?u)\b[^\W\d_]{3,}\b")
+    try:
+        word_matrix = words.fit_transform(items)
+        terms = words.get_feature_names_out()
+    except ValueError:  # solo stopword o numeri: nessun termine per le etichette
+        word_matrix, terms = None, np.array([])
+
+    n_clusters = min(len(items), max(MIN_CLUSTERS, min(MAX_CLUSTERS, round(len(items) ** 0.5))))
+    # Le parole tengono insieme elementi che condividono un concetto anche se scritti in
+    # modo diverso; pochi elementi (decine): le matrici dense non pesano
+    embedding = char_matrix.toarray()
+    if word_matrix is not None:
+        embedding = normalize(np.hstack([embedding, word_matrix.toarray()]))
+    labels = AgglomerativeClustering(n_clusters=n_clusters, linkage="ward").fit_predict(embedding)
+
+    query_terms = set(re.findall(r"\w+", (query or "").lower()))
+    rows = []
+    for cluster in sorted(set(labels), key=lambda c: -np.count_nonzero(labels == c)):
+        members = np.flatnonzero(labels == cluster)
+        if word_matrix is not None:
+            label = _label(np.asarray(word_matrix[members].sum(axis=0)).ravel(), terms, query_terms)
+        else:
+            label = items[members[0]]
+        rows.append([label, "; ".join(items[i] for i in members[:MAX_ITEMS_PER_CLUSTER])])
+    return pd.DataFrame(rows, columns=TOPIC_COLUMNS)
@@ -1,56 +1,16 @@
+import hashlib
+import time
+from datetime import date, timedelta
+
 import streamlit as st
-import requests
-from bs4 import BeautifulSoup
 import pandas as pd
 from io import BytesIO
 
-# User-Agent per le richieste
-BASE_HEADERS = {"User-Agent": "Mozilla/5.0"}
-
-def estrai_info(url: str) -> dict:
-    """
-    Fa GET via requests, parsea con BeautifulSoup e restituisce
-    dizionario con H1–H4, Meta title/description, canonical e robots.
-    """
-    resp = requests.get(url, headers=BASE_HEADERS, timeout=10)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-
-    # Selezione del main content (fallback su body)
-    content = (
-        soup.find("main")
-        or soup.find("article")
-        or soup.find("div", id="content")
-        or soup.find("div", class_="entry-content")
-        or soup.find("div", class_="post-body")
-        or soup.find("body")
-        or soup
-    )
-
-    # Estrazione headings
-    h1 = content.find("h1")
-    h2s = [h.get_text(strip=True) for h in content.find_all("h2")]
-    h3s = [h.get_text(strip=True) for h in content.find_all("h3")]
-    h4s = [h.get_text(strip=True) for h in content.find_all("h4")]
-
-    # Meta SEO globali
-    title_tag = soup.title
-    desc = soup.find("meta", {"name": "description"})
-    canonical = soup.find("link", rel="canonical")
-    robots = soup.find("meta", {"name": "robots"})
-
-    return {
-        "H1": h1.get_text(strip=True) if h1 else "",
-        "H2": " | ".join(h2s),
-        "H3": " | ".join(h3s),
-        "H4": " | ".join(h4s),
-        "Meta title": title_tag.get_text(strip=True) if title_tag else "",
-        "Meta title length": len(title_tag.get_text(strip=True)) if title_tag else 0,
-        "Meta description": desc["content"].strip() if desc and desc.has_attr("content") else "",
-        "Meta description length": len(desc["content"].strip()) if desc and desc.has_attr("content") else 0,
-        "Canonical": canonical["href"].strip() if canonical and canonical.has_attr("href") else "",
-        "Meta robots": robots["content"].strip() if robots and robots.has_attr("content") else ""
-    }
+from pages.common.jobs import DONE, FAILED, PAGE_POLL_SECONDS, ensure_workers, get_job
+from pages.common.jobs import submit as submit_job
+from pages.common.metering import current_session_id, set_streamlit_context
+from pages.common.settings import data_path
+from pages.extractor.extract import FIELDS
 
 def main():
     st.title("🔍 SEO Extractor")
@@ -82,15 +42,34 @@ def main():
 
     col1, col2 = st.columns([2, 1], gap="large")
     with col1:
-        urls = st.text_area(
-            "Incolla URL (uno per riga)",
-            height=200,
-            placeholder="https://esempio.com/p1\nhttps://esempio.com/p2"
-        )
+        source = st.radio("Sorgente URL", ["Lista di URL", "Sitemap", "Crawl del sito"], horizontal=True)
+        if source == "Lista di URL":
+            urls = st.text_area(
+                "Incolla URL (uno per riga)",
+                height=200,
+                placeholder="https://esempio.com/p1\nhttps://esempio.com/p2"
+            )
+        elif source == "Crawl del sito":
+            # Segue i link interni dal seed (stesso dominio, www incluso), nel rispetto di robots.txt
+            seed_url = st.text_input("URL di partenza", placeholder="https://esempio.com/")
+            c1, c2 = st.columns(2)
+            max_depth = c1.number_input("Profondità massima", min_value=0, max_value=20, value=3)
+            max_pages = c2.number_input("Numero massimo di pagine", min_value=1, max_value=100000, value=500, step=100)
+            respect_robots = st.checkbox("Rispetta robots.txt", value=True)
+        else:
+            # Sitemap o sitemap index (anche .gz): gli URL vengono estratti man mano che sono scoperti
+            sitemap_url = st.text_input("URL della sitemap o del sitemap index", placeholder="https://esempio.com/sitemap.xml")
+            sitemap_file = st.file_uploader("...oppure carica un file sitemap", type=["xml", "gz"])
+            f1, f2 = st.columns(2)
+            include = f1.text_input("Includi path (es. /blog/*)", help="Pattern separati da virgola; vuoto = tutti")
+            exclude = f2.text_input("Escludi path (es. /tag/*)", help="Pattern separati da virgola")
+            f3, f4 = st.columns(2)
+            only_recent = f3.checkbox("Solo pagine modificate dal", help="Usa il campo lastmod: evita di rianalizzare pagine invariate")
+            since = f3.date_input("Data", value=date.today() - timedelta(days=30), disabled=not only_recent, label_visibility="collapsed")
+            max_urls = f4.number_input("Numero massimo di URL", min_value=1, max_value=50000, value=1000, step=100)
     with col2:
-        example = estrai_info("https://www.example.com")
         # Menu dei campi senza lunghezze
-        all_keys = [k for k in example.keys() if not k.endswith("length")]
+        all_keys = [k for k in FIELDS if not k.endswith("length")]
         fields = st.pills(
             "Campi da estrarre",
             all_keys,
@@ -98,25 +77,78 @@ def main():
             default=[]
         )
 
+    # L'estrazione gira in un job in background (pages/common/jobs.py): sopravvive ai
+    # rerun e alla chiusura della tab, e liste di URL identiche condividono il risultato.
+    if st.query_params.get("job", "").isdigit() and "extract_job_id" not in st.session_state:
+        st.session_state.extract_job_id = int(st.query_params["job"])
+
     if st.button("🚀 Avvia Estrazione"):
         if not fields:
             st.error("Seleziona almeno un campo.")
             return
-        url_list = [u.strip() for u in urls.splitlines() if u.strip()]
-        if not url_list:
-            st.error("Inserisci almeno un URL valido.")
+        if source == "Lista di URL":
+            url_list = [u.strip() for u in urls.splitlines() if u.strip()]
+            if not url_list:
+                st.error("Inserisci almeno un URL valido.")
+                return
+            kind, params = "seo_extract", {"urls": url_list}
+        elif source == "Crawl del sito":
+            if not seed_url.strip():
+                st.error("Inserisci l'URL di partenza del crawl.")
+                return
+            kind = "seo_crawl"
+            params = {"seed": seed_url.strip(), "max_depth": int(max_depth), "max_pages": int(max_pages), "respect_robots": respect_robots}
+        else:
+            if not sitemap_url.strip() and sitemap_file is None:
+                st.error("Inserisci l'URL di una sitemap o carica un file.")
+                return
+            params = {
+                "include": [p.strip() for p in include.split(",") if p.strip()],
+                "exclude": [p.strip() for p in exclude.split(",") if p.strip()],
+                "since": since.isoformat() if only_recent else None,
+                "max_urls": int(max_urls),
+            }
+            if sitemap_file is not None:
+                # Il file è salvato su disco per il worker; il nome (hash del contenuto) rende il job deduplicabile
+                content = sitemap_file.getvalue()
+                path = data_path("uploads", hashlib.sha1(content).hexdigest() + ".sitemap")
+                path.write_bytes(content)
+                params["sitemap_file"] = str(path)
+            else:
+                params["sitemap_url"] = sitemap_url.strip()
+            kind = "seo_extract_sitemap"
+        set_streamlit_context()
+        ensure_workers()
+        st.session_state.extract_job_id = submit_job(kind, params, current_session_id())
+        st.query_params["job"] = str(st.session_state.extract_job_id)
+
+    if "extract_job_id" in st.session_state:
+        job = get_job(st.session_state.extract_job_id)
+        if job is None or job["kind"] not in ("seo_extract", "seo_extract_sitemap", "seo_crawl"):
+            st.session_state.pop("extract_job_id")
+            st.query_params.pop("job", None)
+            return
+        if job["status"] == FAILED:
+            st.error(f"Estrazione interrotta: {job['error'].splitlines()[0]}")
+            return
+        if job["status"] != DONE:
+            ensure_workers()
+            fraction = job["progress_done"] / job["progress_total"] if job["progress_total"] else 0.0
+            st.progress(fraction, text=job["progress_message"] or "In coda...")
+            time.sleep(PAGE_POLL_SECONDS)
+            st.rerun()
+
+        result = job["result"]
+        if not result["rows"]:
+            st.warning("Nessun URL trovato con i filtri indicati.")
             return
 
-        prog = st.progress(0)
         results = []
-        for i, u in enumerate(url_list, 1):
-            try:
-                info = estrai_info(u)
-            except Exception as e:
-                info = {k: (f"Errore: {e}" if not k.endswith("length") else 0)
-                        for k in example.keys()}
-
-            row = {"URL": u}
+        ordered_cols = []
+        for info in result["rows"]:
+            row = {"URL": info["URL"]}
+            if "Profondità" in info:
+                row["Profondità"] = info["Profondità"]
             # Costruisci ordine: per ciascun field metti subito il suo length
             ordered_cols = []
             for key in ["H1", "H2", "H3", "H4", "Meta title", "Meta description"]:
@@ -132,11 +164,15 @@ def main():
                         row["Meta description length"] = info["Meta description length"]
 
             results.append(row)
-            prog.progress(int(i / len(url_list) * 100))
 
         st.success(f"Analizzati {len(results)} URL.")
+        if job["kind"] in ("seo_extract_sitemap", "seo_crawl") and job["progress_message"]:
+            st.caption(job["progress_message"])
+        rendered = sum(1 for info in result["rows"] if info.get("Rendering") == "browser")
+        if rendered:
+            st.caption(f"🌐 {rendered} pagine senza contenuto statico sono state renderizzate con Chromium headless.")
         df = pd.DataFrame(results)
-        cols = ["URL"] + ordered_cols
+        cols = ["URL"] + (["Profondità"] if job["kind"] == "seo_crawl" else []) + ordered_cols
         df = df[cols]
 
         st.dataframe(df, use_container_width=True)
@@ -158,5 +194,33 @@ def main():
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
 
+        if result["duplicates"]:
+            render_duplicates(result["duplicates"])
+
+def render_duplicates(report: dict):
+    """Gruppi di title, description e H1 duplicati (esatti o quasi) tra gli URL analizzati."""
+    st.subheader("🧬 Duplicati tra URL")
+    tabs = st.tabs([f"{field} ({len(groups)})" for field, groups in report.items()])
+    for tab, (field, groups) in zip(tabs, report.items()):
+        with tab:
+            if not groups:
+                st.caption(f"Nessun {field} duplicato.")
+                continue
+            exact = sum(1 for g in groups if g["type"] == "esatto")
+            st.caption(f"{exact} gruppi di duplicati esatti, {len(groups) - exact} di quasi duplicati.")
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        "Tipo": "Esatto" if g["type"] == "esatto" else "Quasi duplicato",
+                        "N. URL": len(g["urls"]),
+                        "Testo": g["texts"][0],
+                        "Varianti": " | ".join(g["texts"][1:]),
+                        "URL": "\n".join(g["urls"]),
+                    }
+                    for g in groups
+                ]),
+                use_container_width=True, hide_index=True
+            )
+
 if __name__ == "__main__":
     main()
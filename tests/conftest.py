@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# I moduli in pages/ si importano dalla radice del progetto; i database locali
+# (job, metering, tracing) finiscono in una cartella temporanea
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("ANNALECT_DATA_DIR", tempfile.mkdtemp(prefix="annalect-tests-"))
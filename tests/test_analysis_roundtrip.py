@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+from pages.rankboost.loader import ITEM_FIELDS, load_analysis_data, strategic_records
+from pages.rankboost.store import load_analysis_bytes, save_analysis
+
+
+def _export(strategic: pd.DataFrame | None) -> dict:
+    """Payload con la stessa forma di quello salvato da NLP_Rank_Boost.py."""
+    return {
+        "query": "mutuo prima casa",
+        "country": "Italy",
+        "language": "Italian",
+        "organic": [{"URL": "https://example.com/mutui", "Meta Title": "Mutui", "Meta Description": ""}],
+        "people_also_ask": ["Quanto costa un mutuo?"],
+        "related_searches": ["mutuo giovani"],
+        "analysis_strategica": strategic_records(strategic),
+        "common_ground": [{"Categoria": "Prodotti", "Entità": "Mutuo fisso, Mutuo variabile", "Rilevanza Strategica": "Alta"}],
+        "content_gap": [{"Keyword": "surroga mutuo", "Volume": 1900, "Competitor": "example.com"}],
+        "keyword_mining": [{"Categoria Keyword": "Tassi", "Keywords / Concetti / Domande": "tasso fisso, spread"}],
+        "content_brief": "Brief",
+    }
+
+
+@pytest.mark.parametrize("columns", [
+    list(ITEM_FIELDS["analysis_strategica"]),
+    # Intestazioni scelte da Gemini diverse da quelle del prompt
+    ["**Caratteristica**", "Sintesi"],
+    ["Caratteristica SEO", "Analisi", "Note"],
+])
+def test_saved_analysis_reopens(tmp_path, columns):
+    strategic = pd.DataFrame(
+        [["Search Intent Primario", "Informazionale"] + [""] * (len(columns) - 2)], columns=columns,
+    )
+    db_path = tmp_path / "analyses.sqlite3"
+    analysis_id = save_analysis(_export(strategic), db_path)
+
+    loaded = load_analysis_data(load_analysis_bytes(analysis_id, db_path))
+    assert loaded.analysis_map == {"Search Intent Primario": "Informazionale"}
+
+
+def test_missing_strategic_table_reopens(tmp_path):
+    db_path = tmp_path / "analyses.sqlite3"
+    analysis_id = save_analysis(_export(None), db_path)
+    assert load_analysis_data(load_analysis_bytes(analysis_id, db_path)).analysis_map == {}
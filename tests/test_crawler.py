@@ -0,0 +1,75 @@
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pages.extractor import crawler
+
+ROBOTS = "User-agent: *\nDisallow: /privato\n"
+PAGES = {
+    "/": ["/pagina", "/vecchia", "/privato/a", "/privato/b"],
+    "/pagina": ["/profonda"],
+    # Link diretto alla destinazione del redirect di /vecchia, scoperto dopo il redirect
+    "/profonda": ["/nuova"],
+    "/nuova": [],
+}
+REDIRECTS = {"/vecchia": "/nuova"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    hits: Counter = Counter()
+
+    def do_GET(self):
+        self.hits[self.path] += 1
+        if self.path == "/robots.txt":
+            self._send(ROBOTS, "text/plain")
+        elif self.path in REDIRECTS:
+            self.send_response(301)
+            self.send_header("Location", REDIRECTS[self.path])
+            self.end_headers()
+        elif self.path in PAGES:
+            links = "".join(f'<a href="{href}">{href}</a>' for href in PAGES[self.path])
+            self._send(f"<html><head><title>{self.path}</title></head><body><main><h1>{self.path}</h1>{links}</main></body></html>")
+        else:
+            self.send_error(404)
+
+    def _send(self, body: str, content_type: str = "text/html"):
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site(monkeypatch):
+    # Una richiesta alla volta e senza attese: l'ordine di visita è deterministico
+    monkeypatch.setattr(crawler, "CRAWL_DELAY", 0)
+    monkeypatch.setattr(crawler, "CRAWL_HOST_CONCURRENCY", 1)
+    _Handler.hits.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_redirect_target_is_fetched_once(site):
+    rows = crawler.Crawler(site + "/", max_depth=3).run()
+
+    assert _Handler.hits["/nuova"] == 1
+    assert sorted(row["URL"].removeprefix(site) for row in rows) == ["/", "/pagina", "/profonda", "/vecchia"]
+
+
+def test_only_enqueued_urls_fill_the_bloom_filter(site):
+    c = crawler.Crawler(site + "/", max_depth=3)
+    c.run()
+
+    assert _Handler.hits["/privato/a"] == _Handler.hits["/privato/b"] == 0
+    assert f"{site}/privato/a" not in c.seen
+    # URL accodati più la destinazione del redirect
+    assert c.seen.count == c.enqueued + 1
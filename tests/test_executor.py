@@ -0,0 +1,15 @@
+from pages.common import executor
+
+
+def test_worker_processes_split_upstream_limits(monkeypatch):
+    monkeypatch.setattr(executor, "_process_share", 1)
+    single = executor.ExecutorService(max_workers=1)._upstream("gemini")
+
+    executor.set_process_share(3)
+    shared = executor.ExecutorService(max_workers=1)._upstream("gemini")
+
+    initial, maximum, _ = executor.UPSTREAM_DEFAULTS["gemini"]
+    assert (int(single.limit), single.maximum) == (initial, maximum)
+    # Tre worker insieme non superano (arrotondando per eccesso) il limite configurato
+    assert shared.maximum == -(-maximum // 3)
+    assert int(shared.limit) == max(executor.MIN_CONCURRENCY, -(-initial // 3))
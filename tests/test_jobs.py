@@ -0,0 +1,61 @@
+import threading
+import time
+from contextlib import closing
+
+import pytest
+
+from pages.common import jobs
+
+# Il job dura parecchi heartbeat e parecchie soglie di "orfano" senza chiamare progress()
+JOB_SECONDS = 1.0
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "HEARTBEAT_SECONDS", 0.05)
+    monkeypatch.setattr(jobs, "STALE_AFTER_SECONDS", 0.3)
+    return tmp_path / "jobs.sqlite3"
+
+
+def _quiet_job(params, progress):
+    time.sleep(JOB_SECONDS)
+    return {"ok": True}
+
+
+def test_quiet_running_job_is_not_reclaimed(db_path, monkeypatch):
+    monkeypatch.setattr(jobs, "_resolve", lambda kind: _quiet_job)
+    job_id = jobs.submit("seo_extract", {"urls": ["https://example.com/"]}, db_path=db_path)
+
+    claimed = threading.Event()
+
+    def worker():
+        # Come in worker_loop: claim ed esecuzione sulla connessione del worker
+        with closing(jobs._connect(db_path)) as conn:
+            row = jobs._claim(conn)
+            claimed.set()
+            jobs._run_one(conn, row, db_path)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert claimed.wait(5)
+
+    # Un secondo worker che cerca lavoro mentre il job è in corso non lo trova
+    with closing(jobs._connect(db_path)) as other:
+        deadline = time.time() + JOB_SECONDS * 0.8
+        while time.time() < deadline:
+            assert jobs._claim(other) is None
+            time.sleep(0.05)
+    thread.join()
+
+    job = jobs.get_job(job_id, db_path=db_path)
+    assert job["status"] == jobs.DONE
+    assert job["result"] == {"ok": True}
+
+
+def test_job_without_heartbeat_is_reclaimed(db_path):
+    job_id = jobs.submit("seo_extract", {"urls": ["https://example.com/"]}, db_path=db_path)
+    with closing(jobs._connect(db_path)) as conn:
+        assert jobs._claim(conn)["id"] == job_id
+        # Worker morto: nessuno rinnova l'heartbeat e il job torna disponibile
+        time.sleep(jobs.STALE_AFTER_SECONDS + 0.1)
+        assert jobs._claim(conn)["id"] == job_id
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from pages.common.json_repair import StreamingJsonParser, repair_json
+
+
+def _stream(text: str):
+    """Valore ricostruito passando il testo un carattere alla volta, come in streaming."""
+    parser = StreamingJsonParser()
+    for c in text:
+        parser.feed(c)
+    return parser.value()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": "x", // commento\n "b": 2}', {"a": "x", "b": 2}),
+    ('{"a": 1, /* "z": 3, */ "b": [1, /* due */ 2]}', {"a": 1, "b": [1, 2]}),
+    ('{"a": 1, /** stelle **/ "b": 2}', {"a": 1, "b": 2}),
+    ('[1, // fine riga\n 2, 3]', [1, 2, 3]),
+    # Commento subito dopo una stringa, prima di "," e prima di "}"
+    ('{"a": "x" // c\n, "b": 2}', {"a": "x", "b": 2}),
+    ('{"a": "x" /* c */, "b": 2}', {"a": "x", "b": 2}),
+    ('{"a": "x"  // nota\n}', {"a": "x"}),
+    ('{"a": "x" /* nota */}', {"a": "x"}),
+    # Dentro le stringhe le barre restano testo
+    ('{"url": "https://example.com/a", "b": "/* no */"}', {"url": "https://example.com/a", "b": "/* no */"}),
+    # Commento aperto a fine risposta (troncata)
+    ('{"a": 1, "b": 2 /* troncato', {"a": 1, "b": 2}),
+])
+def test_comments_between_tokens_are_skipped(text, expected):
+    assert json.loads(repair_json(text)) == expected
+    assert _stream(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": 1,}\n```', {"a": 1}),
+    ('{"a": 1 "b": 2}', {"a": 1, "b": 2}),
+    ("{'a': True, b: None}", {"a": True, "b": None}),
+    ('{"a": "dice "ciao" e va", "b": 1}', {"a": 'dice "ciao" e va', "b": 1}),
+    ('{"a": [1, 2, {"b": "tronc', {"a": [1, 2, {"b": "tronc"}]}),
+])
+def test_repairs(text, expected):
+    assert json.loads(repair_json(text)) == expected
+    assert _stream(text) == expected
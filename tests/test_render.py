@@ -0,0 +1,87 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pages.extractor import extract, render
+
+PAGES = {
+    "/statica": (
+        "<html><head><title>Pagina statica</title></head><body><main>"
+        "<h1>Titolo statico</h1><p>" + "Contenuto già presente nell'HTML. " * 10 + "</p>"
+        "</main></body></html>"
+    ),
+    "/client": (
+        "<html><head><title>Pagina client</title>"
+        "<meta name=\"description\" content=\"Descrizione statica\"></head>"
+        "<body><div id=\"app\"></div><script>"
+        "document.getElementById('app').innerHTML = '<main><h1>Titolo renderizzato</h1><p>Testo</p></main>';"
+        "</script></body></html>"
+    ),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/client")
+            self.end_headers()
+            return
+        body = PAGES.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def fixture_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_only_client_rendered_page_is_rendered(fixture_server):
+    pytest.importorskip("playwright")
+    if not render.available():
+        pytest.skip("rendering disabilitato")
+
+    client, _ = extract.extract_page(f"{fixture_server}/client")
+    if client["Rendering"] == "statico (rendering fallito)":
+        pytest.skip("Playwright installato senza un browser avviabile")
+    static, _ = extract.extract_page(f"{fixture_server}/statica")
+
+    assert static["Rendering"] == "statico"
+    assert static["H1"] == "Titolo statico"
+    assert client["Rendering"] == "browser"
+    assert client["H1"] == "Titolo renderizzato"
+
+
+def test_render_failure_keeps_static_fields(fixture_server, monkeypatch):
+    rendered_urls = []
+
+    class _BrokenPool:
+        def render(self, url):
+            rendered_urls.append(url)
+            raise render.RenderError("Avvio di Chromium non riuscito")
+
+    monkeypatch.setattr(render, "available", lambda: True)
+    monkeypatch.setattr(render, "get_render_pool", lambda: _BrokenPool())
+
+    info, _ = extract.extract_page(f"{fixture_server}/redirect")
+
+    assert info["Rendering"] == "statico (rendering fallito)"
+    assert info["Meta title"] == "Pagina client"
+    assert info["Meta description"] == "Descrizione statica"
+    # Il browser riceve l'URL finale, senza ripetere il redirect
+    assert rendered_urls == [f"{fixture_server}/client"]
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pages.common.singleflight import single_flight
+
+CALLERS = 16
+# Latenza dell'upstream: tutte le chiamate partono mentre la prima è ancora in corso
+UPSTREAM_DELAY = 0.3
+
+
+class _CountingHandler(BaseHTTPRequestHandler):
+    hits: dict = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.hits[self.path] = self.hits.get(self.path, 0) + 1
+            count = self.hits[self.path]
+        time.sleep(UPSTREAM_DELAY)
+        if self.path.startswith("/errore"):
+            self.send_error(500)
+            return
+        data = json.dumps({"path": self.path, "hit": count}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def counting_server():
+    _CountingHandler.hits = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CountingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", _CountingHandler.hits
+    server.shutdown()
+
+
+@single_flight
+def fetch(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def _call_together(fn, url: str) -> list:
+    """Esegue CALLERS chiamate identiche che partono nello stesso istante; restituisce risultati o eccezioni."""
+    barrier = threading.Barrier(CALLERS)
+
+    def call():
+        barrier.wait()
+        try:
+            return fn(url)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        return list(pool.map(lambda _: call(), range(CALLERS)))
+
+
+def test_parallel_identical_calls_hit_upstream_once(counting_server):
+    base_url, hits = counting_server
+    results = _call_together(fetch, f"{base_url}/serp")
+
+    assert hits == {"/serp": 1}
+    assert all(r == {"path": "/serp", "hit": 1} for r in results)
+    assert fetch.single_flight.in_flight() == 0
+
+
+def test_upstream_error_reaches_every_waiter(counting_server):
+    base_url, hits = counting_server
+    results = _call_together(fetch, f"{base_url}/errore")
+
+    assert hits == {"/errore": 1}
+    assert all(isinstance(r, urllib.error.HTTPError) and r.code == 500 for r in results)
+    assert fetch.single_flight.in_flight() == 0
+
+
+def test_calls_after_completion_are_not_coalesced(counting_server):
+    base_url, hits = counting_server
+    fetch(f"{base_url}/serp")
+    fetch(f"{base_url}/serp")
+
+    assert hits == {"/serp": 2}
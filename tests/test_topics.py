@@ -0,0 +1,10 @@
+import pytest
+
+pytest.importorskip("sklearn")
+
+from pages.rankboost.topics import split_entity_cells
+
+
+def test_entity_cells_are_split_and_deduplicated():
+    cells = ["Mutuo fisso, Tasso variabile , Spread", "spread, Surroga", None, " , "]
+    assert split_entity_cells(cells) == ["Mutuo fisso", "Tasso variabile", "Spread", "Surroga"]